@@ -0,0 +1,128 @@
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd  # type: ignore[import-untyped]
+
+from app.timestamps import VALID_TIMESTAMP, read_timestamps
+
+# Time buckets and the pandas period each one maps to
+TIME_BUCKETS = {"day": "D", "week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+
+METRICS = ("count", "sum", "mean", "min", "max", "median", "percentile")
+
+
+def metric_name(op: str, attribute: Optional[str], percentile: Optional[float] = None) -> str:
+    """Key a metric is reported under, e.g. `count`, `mean_price` or `p90_price`."""
+    if op == "percentile":
+        op = f"p{percentile:g}"
+    return op if attribute is None else f"{op}_{attribute}"
+
+
+def _to_python(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _time_buckets(events: List[Dict[str, Any]], bucket: str) -> pd.Series:
+    states, epochs = read_timestamps(events)
+    times = pd.to_datetime(pd.Series(np.where(states == VALID_TIMESTAMP, epochs, np.nan)), unit="us")
+    return times.dt.to_period(TIME_BUCKETS[bucket]).astype(str).where(times.notna(), None)
+
+
+def aggregate(
+    events: List[Dict[str, Any]],
+    group_by: Optional[List[str]] = None,
+    time_bucket: Optional[str] = None,
+    metrics: Optional[List[Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Groups events and computes summary metrics per group.
+
+    Parameters:
+    - `events` (List[Dict[str, Any]]): The (filtered) events to aggregate.
+    - `group_by` (List[str], optional): Attributes to group by.
+    - `time_bucket` (str, optional): One of `TIME_BUCKETS`; also groups by the
+      period of `time_object.timestamp`, reported under the bucket name.
+    - `metrics` (List[Any], optional): Metric objects with `op`, `attribute` and,
+      for `percentile`, `percentile` (0-100). Defaults to a single `count`.
+
+    Returns:
+    - `List[Dict[str, Any]]`: One entry per group, holding the group key under
+      `group` and each metric under its `metric_name`. Non-numeric values are
+      ignored by every metric other than `count`.
+    """
+    group_by = list(group_by or [])
+    metrics = list(metrics or [])
+    if time_bucket is not None and time_bucket not in TIME_BUCKETS:
+        raise ValueError(f"Invalid time_bucket: {time_bucket}")
+    for metric in metrics:
+        if metric.op not in METRICS:
+            raise ValueError(f"Invalid metric: {metric.op}")
+        if metric.op != "count" and not metric.attribute:
+            raise ValueError(f"Metric '{metric.op}' needs an attribute")
+        if metric.op == "percentile" and (metric.percentile is None or not 0 <= metric.percentile <= 100):
+            raise ValueError("Metric 'percentile' needs a percentile between 0 and 100")
+
+    if not metrics:
+        metrics = [_Count()]
+
+    attributes = [event.get("attribute", {}) for event in events]
+    frame = pd.DataFrame(index=pd.RangeIndex(len(events)))
+    names = list(group_by)
+    keys = [f"key.{name}" for name in names]
+    for name, key in zip(group_by, keys):
+        frame[key] = pd.Series([attrs.get(name) for attrs in attributes], dtype=object)
+    if time_bucket is not None:
+        names.append(time_bucket)
+        keys.append(f"key.{time_bucket}")
+        frame[keys[-1]] = _time_buckets(events, time_bucket)
+    if not keys:
+        if not events:
+            return [{"group": {}, **{_name(metric): 0 if metric.op == "count" else None for metric in metrics}}]
+        keys = ["key"]
+        frame["key"] = 0
+
+    for attribute in {metric.attribute for metric in metrics if metric.attribute}:
+        values = [attrs.get(attribute) for attrs in attributes]
+        frame[f"present.{attribute}"] = [value is not None for value in values]
+        frame[f"value.{attribute}"] = pd.to_numeric(
+            pd.Series([None if isinstance(value, (bool, str)) else value for value in values], dtype=object),
+            errors="coerce",
+        )
+
+    try:
+        groups = frame.groupby(keys, dropna=False, sort=True)
+        sizes = groups.size()
+    except TypeError:  # Keys of mixed types cannot be sorted
+        groups = frame.groupby(keys, dropna=False, sort=False)
+        sizes = groups.size()
+
+    columns = {}
+    for metric in metrics:
+        if metric.op == "count":
+            columns[_name(metric)] = groups[f"present.{metric.attribute}"].sum() if metric.attribute else sizes
+        elif metric.op == "percentile":
+            columns[_name(metric)] = groups[f"value.{metric.attribute}"].quantile(metric.percentile / 100)
+        else:
+            columns[_name(metric)] = getattr(groups[f"value.{metric.attribute}"], metric.op)()
+
+    aggregations = []
+    for position, group_key in enumerate(sizes.index):
+        key_values = group_key if isinstance(group_key, tuple) else (group_key,)
+        aggregations.append({
+            "group": {name: _to_python(value) for name, value in zip(names, key_values)},
+            **{name: _to_python(column.iloc[position]) for name, column in columns.items()},
+        })
+    return aggregations
+
+
+def _name(metric: Any) -> str:
+    return metric_name(metric.op, metric.attribute, getattr(metric, "percentile", None))
+
+
+class _Count:
+    op = "count"
+    attribute = None
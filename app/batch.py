@@ -0,0 +1,109 @@
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from app import settings
+from app.columnar import ColumnarUnsupported, EventColumns, lookup_table
+from app.executor import check_cancelled
+from app.metrics import record_scan
+from app.preprocessing import CANCEL_CHECK_EVENTS
+from app.timestamps import INVALID_TIMESTAMP, VALID_TIMESTAMP, TimestampParser, read_timestamp
+
+BATCH_ENGINES = ("auto", "python", "columnar")
+
+
+def select_batch(
+    plans: List[Any],
+    data: Dict[str, Any],
+    engine: str = "auto",
+    columns: Optional[EventColumns] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Runs several `FilterPlan`s over one dataset in a single pass.
+
+    The row-wise engine reads each event once: its type, timestamp and
+    attributes are looked up a single time and checked against every plan, and
+    timestamps are parsed by one shared parser. The columnar engine builds one
+    `EventColumns` view whose timestamp and attribute columns all plans reuse.
+    `"auto"` picks the columnar engine for batches of at least
+    `settings.BATCH_COLUMNAR_MIN_QUERIES` plans over at least
+    `settings.COLUMNAR_MIN_EVENTS` events.
+
+    Parameters:
+    - `plans` (List[FilterPlan]): The compiled queries.
+    - `data` (dict): The dataset to be filtered.
+    - `engine` (str, optional): One of `BATCH_ENGINES`.
+    - `columns` (EventColumns, optional): A columnar view of the events already built, used by the columnar engine.
+
+    Returns:
+    - `List[List[Dict[str, Any]]]`: The unprojected matches of each plan, in order.
+    """
+    if engine not in BATCH_ENGINES:
+        raise ValueError(f"Invalid engine: {engine}")
+
+    events = data.get("events", [])
+    if not isinstance(events, list):
+        events = list(events)
+
+    if engine == "columnar" or (
+        engine == "auto"
+        and len(plans) >= settings.BATCH_COLUMNAR_MIN_QUERIES
+        and len(events) >= settings.COLUMNAR_MIN_EVENTS
+    ):
+        try:
+            if columns is None:
+                columns = EventColumns(events)
+            selected = [columns.select_events(plan) for plan in plans]
+            for plan in plans:
+                plan.timestamp_failures = 0  # Counted once for the batch below, as by the row-wise scan
+            wanted = lookup_table(columns.event_type_values, _wanted_types(plans).__contains__)[columns.event_types]
+            timestamp_failures = int(np.count_nonzero(wanted & columns.invalid_timestamps))
+            record_scan(len(events), sum(map(len, selected)), timestamp_failures)
+            return selected
+        except ColumnarUnsupported:
+            pass  # Fall back to the row-wise scan
+
+    return _scan(plans, events)
+
+
+def _wanted_types(plans: List[Any]) -> frozenset:
+    return frozenset().union(*(plan.event_types for plan in plans))
+
+
+def _scan(plans: List[Any], events: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Checks every event against every plan in one pass. The event type and the
+    timestamp are read once per event rather than once per plan, then each
+    plan checks its time window and attribute filters.
+    """
+    parse = TimestampParser().parse
+    timestamp_failures = 0
+    selected: List[List[Dict[str, Any]]] = [[] for _ in plans]
+    wanted_types = _wanted_types(plans)
+    checks = [(plan, plan.event_types, matches.append) for plan, matches in zip(plans, selected)]
+
+    for position, event in enumerate(events):
+        if position % CANCEL_CHECK_EVENTS == 0:
+            check_cancelled()
+        event_type = event.get("event_type")
+        try:
+            if event_type not in wanted_types:
+                continue
+        except TypeError:
+            continue  # Unhashable event types can never match
+
+        state, event_time = read_timestamp(event, parse)
+        if state == INVALID_TIMESTAMP:
+            timestamp_failures += 1
+            continue  # Skip events with invalid timestamps
+
+        for plan, event_types, append in checks:
+            if event_type not in event_types:
+                continue
+            if state == VALID_TIMESTAMP and not plan.in_window(event_time):
+                continue
+            if plan.matches_attributes(event):
+                append(event)
+
+    record_scan(len(events), sum(map(len, selected)), timestamp_failures)  # One pass for every plan
+    return selected
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app import fastjson, settings
+
+
+def render_json(content: Any) -> bytes:
+    """Encodes a response body exactly as FastAPI's `JSONResponse` would."""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=fastjson.default,  # Compact and zero-copy events, see `app.records`
+    ).encode("utf-8")
+
+
+def dataset_digest(data: Dict[str, Any]) -> str:
+    """Content hash of an inline dataset."""
+    encoded = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=repr)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=repr)
+
+
+def plan_key(plan) -> str:
+    """
+    Normalized form of a `FilterPlan`.
+
+    Queries that differ only in list order, duplicate values or the spelling of
+    equivalent timestamps get the same key.
+    """
+    filters = sorted(
+        (
+            filter_.attribute,
+            filter_.operator,
+            sorted(_canonical(value) for value in filter_.operand)
+            if isinstance(filter_.operand, frozenset)
+            else [_canonical(value) for value in filter_.operand],
+        )
+        for filter_ in plan.filters
+    )
+    return _canonical({
+        "event_types": sorted(_canonical(value) for value in plan.event_types),
+        "filters": filters,
+        "include_attributes": (
+            None if plan.include_attributes is None else sorted(plan.include_attributes)
+        ),
+        "start": plan.start_epoch,
+        "end": plan.end_epoch,
+    })
+
+
+class ResultCache:
+    """
+    LRU cache of serialized query results.
+
+    Entries expire `ttl_seconds` after they are stored and the least recently
+    used ones are evicted once the cached bytes would exceed `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(dataset_key: str, plan, extra: Any = None) -> str:
+        """Cache key of a plan run on a dataset; `extra` covers any further query options."""
+        return hashlib.sha256(
+            f"{dataset_key}\n{plan_key(plan)}\n{_canonical(extra)}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self.clock():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        while self._entries and self.size_bytes + len(body) > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = (self.clock() + self.ttl_seconds, body)
+        self.size_bytes += len(body)
+
+    def _remove(self, key: str) -> None:
+        _, body = self._entries.pop(key)
+        self.size_bytes -= len(body)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+results = ResultCache(settings.RESULT_CACHE_BYTES, settings.RESULT_CACHE_TTL_SECONDS)
@@ -0,0 +1,166 @@
+from typing import List, Dict, Any, Collection, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.executor import check_cancelled
+from app.planner import DatasetStats
+from app.timestamps import INVALID_TIMESTAMP, MISSING_TIMESTAMP, read_timestamps
+
+# Placeholder for events that do not carry a given attribute
+MISSING = object()
+
+
+class ColumnarUnsupported(Exception):
+    """Raised when a dataset cannot be filtered column-wise with identical results."""
+
+
+def encode_column(values) -> Tuple[np.ndarray, List[Any]]:
+    """
+    Dictionary-encodes a column.
+
+    Returns an array of codes and the list of distinct values those codes index
+    into. Code 0 is reserved for `MISSING`, so every column shares that slot.
+    """
+    index: Dict[Any, int] = {}
+    dictionary: List[Any] = [MISSING]
+    codes: List[int] = []
+    append = codes.append
+    try:
+        for value in values:
+            if value is MISSING:
+                append(0)
+                continue
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(dictionary)
+                dictionary.append(value)
+            append(code)
+    except TypeError:
+        raise ColumnarUnsupported("Column contains unhashable values")
+    return np.array(codes, dtype=np.int32), dictionary
+
+
+def lookup_table(dictionary: List[Any], predicate, missing: bool = False) -> np.ndarray:
+    """
+    Evaluates `predicate` once per distinct value of a dictionary-encoded column.
+
+    `missing` is the result for the `MISSING` slot.
+    """
+    return np.fromiter(
+        (missing if value is MISSING else predicate(value) for value in dictionary),
+        dtype=bool,
+        count=len(dictionary),
+    )
+
+
+class EventColumns:
+    """
+    Columnar view of an ADAGE `events` list.
+
+    `event_type` and each attribute are dictionary-encoded and timestamps are
+    held as an int64 column of epoch microseconds, so filter predicates run as
+    vectorized boolean masks. Attribute columns are built lazily, the first time a filter
+    refers to them.
+    """
+
+    def __init__(self, events: Sequence[Dict[str, Any]]):
+        self.events = events
+        self.size = len(events)
+        try:
+            self.event_types, self.event_type_values = encode_column(
+                event.get("event_type") for event in events
+            )
+            (
+                self.timestamps,
+                self.missing_timestamps,
+                self.invalid_timestamps,
+            ) = self._parse_timestamps(events)
+        except (AttributeError, TypeError):
+            raise ColumnarUnsupported("Events are not uniformly shaped")
+        self._attributes: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        self._statistics: Optional[DatasetStats] = None
+
+    @staticmethod
+    def _parse_timestamps(events: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        states, timestamps = read_timestamps(events)
+        return timestamps, states == MISSING_TIMESTAMP, states == INVALID_TIMESTAMP
+
+    def attribute(self, name: str) -> Tuple[np.ndarray, List[Any]]:
+        """Returns the dictionary-encoded column for an attribute."""
+        if name not in self._attributes:
+            try:
+                self._attributes[name] = encode_column(
+                    event.get("attribute", {}).get(name, MISSING) for event in self.events
+                )
+            except AttributeError:
+                raise ColumnarUnsupported(f"Attribute '{name}' is not uniformly shaped")
+        return self._attributes[name]
+
+    def _attribute_statistics(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            codes, dictionary = self.attribute(name)
+        except ColumnarUnsupported:
+            return None
+        return len(dictionary) - 1, int(np.count_nonzero(codes))
+
+    @property
+    def statistics(self) -> DatasetStats:
+        """Planner statistics over the columns, see `app.planner`."""
+        if self._statistics is None:
+            counts = np.bincount(self.event_types, minlength=len(self.event_type_values))
+            valid = ~(self.missing_timestamps | self.invalid_timestamps)
+            timed = int(np.count_nonzero(valid))
+            timestamps = self.timestamps[valid] if timed else None
+            self._statistics = DatasetStats(
+                self.size,
+                {value: int(count) for value, count in zip(self.event_type_values[1:], counts[1:].tolist())},
+                None if timestamps is None else (int(timestamps.min()), int(timestamps.max())),
+                timed,
+                int(np.count_nonzero(self.missing_timestamps)),
+                self._attribute_statistics,
+            )
+        return self._statistics
+
+    def mask(self, plan, filters=None, skip: Collection[str] = ()) -> np.ndarray:
+        """
+        Evaluates a `FilterPlan` over every event as a boolean mask.
+
+        `filters` limits the attribute filters applied to a subset of `plan.filters`.
+        The `"event_type"` and `"timestamp"` predicates are left out if named in
+        `skip`, for an `app.planner.QueryPlan` that found every event passes them.
+        """
+        if "event_type" in skip:
+            mask = np.ones(self.size, dtype=bool)
+        else:
+            mask = lookup_table(self.event_type_values, plan.event_types.__contains__)[self.event_types]
+
+        if "timestamp" not in skip:
+            plan.timestamp_failures += int(np.count_nonzero(mask & self.invalid_timestamps))
+            mask &= ~self.invalid_timestamps
+            timestamps = self.timestamps
+            if plan.start_epoch is not None:
+                mask &= self.missing_timestamps | (timestamps >= plan.start_epoch)
+            if plan.end_epoch is not None:
+                mask &= self.missing_timestamps | (timestamps <= plan.end_epoch)
+
+        for filter_ in plan.filters if filters is None else filters:
+            codes, dictionary = self.attribute(filter_.attribute)
+            mask &= lookup_table(dictionary, filter_.test, filter_.matches_missing)[codes]
+
+        return mask
+
+    def select(self, plan) -> np.ndarray:
+        """Returns the positions of the events matched by a `FilterPlan`, in order."""
+        return np.flatnonzero(self.mask(plan))
+
+    def select_events(self, plan) -> List[Dict[str, Any]]:
+        """Returns the events matched by a `FilterPlan`, unprojected."""
+        positions = self.select(plan).tolist()
+        check_cancelled()
+        events = self.events
+        return [events[position] for position in positions]
+
+    def apply(self, plan) -> List[Dict[str, Any]]:
+        """Filters the events with a `FilterPlan` and projects the matches."""
+        project = plan.project
+        return [project(event) for event in self.select_events(plan)]
@@ -0,0 +1,263 @@
+"""
+Compressed request and response bodies.
+
+`CompressionMiddleware` decodes `Content-Encoding: gzip` (and `zstd`, when the
+optional `zstandard` package is installed) request bodies chunk by chunk as
+they arrive, so endpoints that stream the body keep doing so, and compresses
+responses with the best encoding the client accepts. Responses smaller than
+`settings.COMPRESSION_MIN_BYTES` are sent as they are, since compressing them
+costs more than it saves. A request body that decodes to more than
+`settings.DECOMPRESSED_MAX_BYTES` is refused with 413.
+"""
+import zlib
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from app import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - exercised only without zstandard
+    zstandard = None  # type: ignore[assignment]
+
+# Supported encodings, most preferred first
+ENCODINGS: Tuple[str, ...] = ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Compressed bytes decoded per step, bounding how far one step can overshoot the size cap
+DECODE_STEP_BYTES = 1024
+
+
+class ContentDecodingError(HTTPException):
+    """Raised while reading a request body that is not validly encoded."""
+
+    def __init__(self, detail: str):
+        super().__init__(status_code=400, detail=detail)
+
+
+class DecodedBodyTooLarge(HTTPException):
+    """Raised while reading a request body that decodes to more than the size cap."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(
+            status_code=413,
+            detail=f"Decompressed request body exceeds {max_bytes} bytes",
+        )
+
+
+class _GzipDecoder:
+    def __init__(self):
+        self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> bytes:
+        decoded = self._decoder.decompress(data)
+        while self._decoder.eof and self._decoder.unused_data:  # Concatenated gzip members
+            data = self._decoder.unused_data
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            decoded += self._decoder.decompress(data)
+        return decoded
+
+    @property
+    def eof(self) -> bool:
+        return self._decoder.eof
+
+
+class _StreamEncoder:
+    """Compresses a body in pieces, flushing after each so none is held back."""
+
+    def __init__(self, encoding: str):
+        self._encoder: Any
+        if encoding == "zstd":
+            self._encoder = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._encoder = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes) -> bytes:
+        return self._encoder.compress(data) + self._encoder.flush(self._flush_mode)
+
+    def finish(self) -> bytes:
+        return self._encoder.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compresses a complete body."""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return zlib.compress(body, GZIP_LEVEL, wbits=16 + zlib.MAX_WBITS)
+
+
+def decoder(encoding: str) -> Optional[Any]:
+    """Incremental decoder for a `Content-Encoding`, or `None` if it is not supported."""
+    if encoding == "gzip":
+        return _GzipDecoder()
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks the response encoding from an `Accept-Encoding` header.
+
+    The client's quality values decide, ties going to the order of
+    `ENCODINGS`; `None` means the response is sent uncompressed.
+    """
+    qualities = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    ranked = [
+        (qualities.get(encoding, wildcard), -preference, encoding)
+        for preference, encoding in enumerate(ENCODINGS)
+    ]
+    quality, _, encoding = max(ranked)
+    return encoding if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware for compressed request and response bodies.
+
+    Parameters:
+    - `app`: The ASGI application to wrap.
+    - `minimum_size` (int, optional): Smallest response body, in bytes, worth compressing.
+    - `max_decompressed_size` (int, optional): Largest size, in bytes, a compressed request body may decode to.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        minimum_size: Optional[int] = None,
+        max_decompressed_size: Optional[int] = None,
+    ):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MIN_BYTES if minimum_size is None else minimum_size
+        self.max_decompressed_size = (
+            settings.DECOMPRESSED_MAX_BYTES if max_decompressed_size is None else max_decompressed_size
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "identity").strip().lower()
+        if content_encoding not in ("", "identity"):
+            body_decoder = decoder(content_encoding)
+            if body_decoder is None:
+                response = JSONResponse(
+                    {"detail": f"Unsupported Content-Encoding: {content_encoding}"},
+                    status_code=415,
+                    headers={"Accept-Encoding": ", ".join(ENCODINGS)},
+                )
+                await response(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value)
+                for name, value in scope["headers"]
+                if name not in (b"content-encoding", b"content-length")
+            ]
+            receive = _decoding_receive(receive, body_decoder, self.max_decompressed_size)
+
+        encoding = negotiate(headers.get("accept-encoding"))
+        if encoding is not None:
+            send = _EncodingSend(send, encoding, self.minimum_size)
+        await self.app(scope, receive, send)
+
+
+def _decoding_receive(receive: Callable, body_decoder: Any, max_bytes: int) -> Callable:
+    decoded_bytes = 0
+
+    async def decoding_receive():
+        nonlocal decoded_bytes
+        message = await receive()
+        if message["type"] != "http.request":
+            return message
+        data = message.get("body", b"")
+        pieces = []
+        # Decoded in small steps so a highly compressed chunk is refused before it is fully inflated
+        for start in range(0, len(data), DECODE_STEP_BYTES):
+            try:
+                piece = body_decoder.decompress(data[start:start + DECODE_STEP_BYTES])
+            except Exception as e:
+                raise ContentDecodingError(f"Invalid compressed body: {e}")
+            decoded_bytes += len(piece)
+            if decoded_bytes > max_bytes:
+                raise DecodedBodyTooLarge(max_bytes)
+            pieces.append(piece)
+        body = b"".join(pieces)
+        if not message.get("more_body", False) and not getattr(body_decoder, "eof", True):
+            raise ContentDecodingError("Invalid compressed body: unexpected end of data")
+        return {**message, "body": body}
+
+    return decoding_receive
+
+
+class _EncodingSend:
+    """Wraps ASGI `send` to compress the response body when it is worth it."""
+
+    def __init__(self, send: Callable, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[dict] = None
+        self.encoder: Optional[_StreamEncoder] = None
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is None:  # Later pieces of a streamed body
+            if self.encoder is not None:
+                body = self.encoder.compress(body)
+                if not more_body:
+                    body += self.encoder.finish()
+                message = {"type": "http.response.body", "body": body, "more_body": more_body}
+            await self.send(message)
+            return
+
+        start, self.start = self.start, None
+        headers = MutableHeaders(raw=list(start["headers"]))
+        headers.add_vary_header("Accept-Encoding")
+        if "content-encoding" in headers or (not more_body and len(body) < self.minimum_size):
+            await self.send({**start, "headers": headers.raw})
+            await self.send(message)
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            del headers["Content-Length"]
+            self.encoder = _StreamEncoder(self.encoding)
+            body = self.encoder.compress(body)
+        else:
+            body = compress(body, self.encoding)
+            headers["Content-Length"] = str(len(body))
+        await self.send({**start, "headers": headers.raw})
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,527 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app import fastjson, settings
+from app.batch import select_batch
+from app.columnar import ColumnarUnsupported, EventColumns
+from app.pagination import project_page
+from app.partitions import TimePartition, partition_events
+from app.records import Compactor, EventRecord
+from app.streaming import EventStreamParser
+
+
+class DatasetTooLarge(ValueError):
+    """Raised when a dataset does not fit in the dataset store at all."""
+
+
+# The attribute that identifies an event when it is upserted or removed
+EVENT_KEY = "transaction_id"
+
+# Left in place of a removed event until its segment is rewritten. Its event
+# type is a private object, so no filter plan can ever match it.
+_REMOVED = EventRecord({}, object(), {})
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _event_key(event: Any) -> Any:
+    """The `transaction_id` of an event, or `None` if it has no usable one."""
+    try:
+        key = event.get("attribute", {}).get(EVENT_KEY)
+    except AttributeError:
+        return None
+    return key if _hashable(key) else None
+
+
+def _event_bytes(event: Any) -> int:
+    return len(fastjson.dumps(event))
+
+
+class _Segment:
+    """
+    A run of consecutive events of a `StoredDataset`.
+
+    Each segment builds its own columnar view and time partitions (see
+    `app.partitions`) on first use, so appending events only ever indexes the
+    new ones. Removed events are replaced by `_REMOVED` in place, which keeps
+    the offsets held by those structures valid.
+    """
+
+    def __init__(self, events: List[Any], lock: threading.RLock):
+        self.events = events
+        self.removed = 0
+        self._lock = lock
+        self._columns: Optional[EventColumns] = None
+        self._columnar_unsupported = False
+        self._partitions: Optional[List[TimePartition]] = None
+
+    @property
+    def live(self) -> int:
+        return len(self.events) - self.removed
+
+    def live_events(self) -> List[Any]:
+        if not self.removed:
+            return self.events
+        return [event for event in self.events if event is not _REMOVED]
+
+    @property
+    def columns(self) -> Optional[EventColumns]:
+        """The columnar view of the events, or `None` if they cannot be encoded."""
+        if self._columns is None and not self._columnar_unsupported:
+            with self._lock:  # Not built while an event is being removed
+                if self._columns is None and not self._columnar_unsupported:
+                    try:
+                        self._columns = EventColumns(self.events)
+                    except ColumnarUnsupported:
+                        self._columnar_unsupported = True
+        return self._columns
+
+    @property
+    def partitions(self) -> List[TimePartition]:
+        """The events split into time partitions."""
+        if self._partitions is None:
+            with self._lock:
+                if self._partitions is None:
+                    self._partitions = partition_events(self.events)
+        return self._partitions
+
+    def remove(self, offset: int) -> None:
+        self.events[offset] = _REMOVED
+        self.removed += 1
+        if self._columns is not None:
+            self._columns.event_types[offset] = 0  # The MISSING slot, which no plan matches
+        for partition in self._partitions or ():
+            # Index postings may still list the offset, so queries then recheck the event type
+            if partition.replace(offset, _REMOVED):
+                break
+
+    def select(self, plan, engine: str) -> List[Dict[str, Any]]:
+        if engine == "auto":
+            return self._select_partitions(plan)
+        if engine == "columnar" and self.columns is not None:
+            selected = self.columns.select_events(plan)
+            plan.record_scan(len(self.events), len(selected))
+            return selected
+        return plan.select({"events": self.live_events()}, engine=engine)
+
+    def select_batch(self, plans: List[Any], engine: str) -> List[List[Dict[str, Any]]]:
+        if engine == "auto":
+            return [self._select_partitions(plan) for plan in plans]
+        if engine == "columnar" and self.columns is not None:
+            return select_batch(plans, {"events": self.events}, "columnar", columns=self.columns)
+        return select_batch(plans, {"events": self.live_events()}, "python")
+
+    def _select_partitions(self, plan) -> List[Dict[str, Any]]:
+        """Queries the partitions the time window reaches, and merges their matches back into event order."""
+        found = []
+        for partition in self.partitions:
+            if not partition.overlaps(plan):
+                partition.prune(plan)
+                continue
+            offsets = partition.positions(plan)
+            if len(offsets):
+                found.append(offsets)
+        if not found:
+            return []
+        offsets = found[0] if len(found) == 1 else np.sort(np.concatenate(found))
+        events = self.events
+        return [events[offset] for offset in offsets.tolist()]
+
+
+def _merge_index_stats(descriptions: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for description in descriptions:
+        for name, stats in description.items():
+            if name not in merged:
+                merged[name] = dict(stats)
+                continue
+            total = merged[name]
+            total["indexed"] = total["indexed"] and stats["indexed"]
+            total["keys"] = max(total["keys"], stats["keys"])
+            total["build_ms"] = round(total["build_ms"] + stats["build_ms"], 3)
+            total["lookups"] += stats["lookups"]
+    return merged
+
+
+class StoredDataset:
+    """
+    A parsed ADAGE dataset held by a `DatasetStore`.
+
+    `dataset_id` is the SHA-256 of the uploaded bytes and `size_bytes` their
+    length. Derived structures such as the columnar view and the time
+    partitions with their secondary indexes are built on first use and kept
+    for later queries.
+
+    Events can be appended, upserted or removed after the upload without
+    rebuilding what was already derived: the events are held in segments, each
+    with its own derived structures, and every update adds one segment for the
+    new events. Trailing segments are merged once the newest holds at least
+    half as many events as the one before it, so a dataset has a logarithmic
+    number of segments and each event is rewritten a logarithmic number of
+    times. `version` counts the updates, so cached results of earlier
+    versions are never served. It continues from `version_floor`, the last
+    version the store issued for the same ID, so a deleted and re-uploaded
+    dataset never reuses the version of an earlier copy.
+    """
+
+    def __init__(self, dataset_id: str, data: Dict[str, Any], size_bytes: int):
+        self.dataset_id = dataset_id
+        self.metadata = {key: value for key, value in data.items() if key != "events"}
+        self.has_events = "events" in data
+        self.size_bytes = size_bytes
+        self.version = 0
+        self.version_floor = 0
+        self._lock = threading.RLock()
+        events = data.get("events", [])
+        self._segments = [_Segment(events if isinstance(events, list) else list(events), self._lock)]
+        self._keys: Optional[Dict[Any, List[Tuple[_Segment, int]]]] = None
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """The dataset as an ADAGE document."""
+        data = dict(self.metadata)
+        if self.has_events:
+            data["events"] = self.events
+        return data
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        segments = self._segments
+        if len(segments) == 1:
+            return segments[0].live_events()
+        return [event for segment in segments for event in segment.live_events()]
+
+    @property
+    def event_count(self) -> int:
+        return sum(segment.live for segment in self._segments)
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies the current contents of the dataset in the result cache."""
+        return f"{self.dataset_id}@{self.version}" if self.version else self.dataset_id
+
+    def select(self, plan, engine: str = "auto") -> List[Dict[str, Any]]:
+        """
+        Returns the events matched by a `FilterPlan`, unprojected.
+
+        Stored datasets are queried repeatedly, so `"auto"` skips the time
+        partitions outside the time window and narrows the scan of the others
+        through their secondary indexes, and `"columnar"` reuses the cached
+        columnar view when the events allow one.
+        """
+        selected: List[Dict[str, Any]] = []
+        for segment in self._segments:
+            selected.extend(segment.select(plan, engine))
+        return selected
+
+    def select_batch(self, plans: List[Any], engine: str = "auto") -> List[List[Dict[str, Any]]]:
+        """
+        Returns the events matched by each of several `FilterPlan`s, unprojected, see `app.batch`.
+
+        `"python"` and `"columnar"` check every plan in one pass over each
+        segment. `"auto"` still queries the time partitions plan by plan,
+        since their indexes narrow each plan's scan to its own candidates.
+        """
+        selected: List[List[Dict[str, Any]]] = [[] for _ in plans]
+        for segment in self._segments:
+            for matches, found in zip(selected, segment.select_batch(plans, engine)):
+                matches.extend(found)
+        return selected
+
+    def apply(self, plan, engine: str = "auto") -> List[Dict[str, Any]]:
+        """Runs a `FilterPlan` against the dataset and projects the matches."""
+        project = plan.project
+        return [project(event) for event in self.select(plan, engine)]
+
+    def page(
+        self,
+        plan,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        engine: str = "auto",
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Like `apply`, but returns only one page of the matches, see `FilterPlan.page`."""
+        return project_page(plan, self.select(plan, engine), offset, limit, sort_by, descending)
+
+    def explain(self, plan, engine: str = "auto") -> Dict[str, Any]:
+        """
+        Describes how `select` runs a `FilterPlan`, segment by segment.
+
+        Only the `"auto"` engine prunes time partitions and is planned; the
+        others check every event in the fixed order of `FilterPlan.matches`.
+        """
+        if engine != "auto":
+            return {"engine": engine, "segments": []}
+        return {
+            "engine": "index",
+            "segments": [
+                {"partitions": [partition.explain(plan) for partition in segment.partitions]}
+                for segment in self._segments
+            ],
+        }
+
+    def _positions(self) -> Dict[Any, List[Tuple[_Segment, int]]]:
+        """Where the events with each `transaction_id` are, built on the first keyed update."""
+        if self._keys is None:
+            keys: Dict[Any, List[Tuple[_Segment, int]]] = {}
+            for segment in self._segments:
+                self._add_keys(keys, segment)
+            self._keys = keys
+        return self._keys
+
+    @staticmethod
+    def _add_keys(keys: Dict[Any, List[Tuple[_Segment, int]]], segment: _Segment) -> None:
+        for offset, event in enumerate(segment.events):
+            key = _event_key(event)
+            if key is not None:
+                keys.setdefault(key, []).append((segment, offset))
+
+    def _located(self, keys: List[Any]) -> List[Tuple[_Segment, int]]:
+        positions = self._positions()
+        return [position for key in keys for position in positions.get(key, ())]
+
+    def _remove_keys(self, keys: List[Any]) -> None:
+        positions = self._positions()
+        for key in keys:
+            for segment, offset in positions.pop(key, ()):
+                segment.remove(offset)
+
+    def append(
+        self,
+        events: List[Dict[str, Any]],
+        upsert: bool = False,
+        max_bytes: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """
+        Adds events to the end of the dataset.
+
+        Parameters:
+        - `events` (List[Dict[str, Any]]): The new events.
+        - `upsert` (bool, optional): Whether each new event replaces the stored
+          events with the same `attribute.transaction_id`. Replacements are
+          placed at the end like any other new event, and of several new events
+          sharing an ID only the last is kept.
+        - `max_bytes` (int, optional): Raise `DatasetTooLarge`, leaving the
+          dataset unchanged, if it would grow past this size.
+
+        Returns:
+        - `Dict[str, int]`: The number of events `appended` and of stored events `replaced`.
+        """
+        compact = Compactor().event
+        added = [compact(event) for event in events]
+        keys: List[Any] = []
+        if upsert:
+            last = {_event_key(event): position for position, event in enumerate(added)}
+            last.pop(None, None)
+            added = [event for position, event in enumerate(added) if last.get(_event_key(event), position) == position]
+            keys = list(last)
+        added_bytes = sum(map(_event_bytes, added))
+
+        with self._lock:
+            replaced = self._located(keys) if keys else []
+            size_bytes = self.size_bytes + added_bytes - sum(
+                _event_bytes(segment.events[offset]) for segment, offset in replaced
+            )
+            if max_bytes is not None and size_bytes > max_bytes:
+                raise DatasetTooLarge(
+                    f"Dataset of {size_bytes} bytes exceeds the dataset store limit of {max_bytes} bytes"
+                )
+            self._remove_keys(keys)
+            segment = _Segment(added, self._lock)
+            if self._keys is not None:
+                self._add_keys(self._keys, segment)
+            self._segments = [*self._segments, segment]
+            self._compact()
+            self.size_bytes = size_bytes
+            self.version = max(self.version, self.version_floor) + 1
+        return {"appended": len(added), "replaced": len(replaced)}
+
+    def remove(self, keys: List[Any]) -> int:
+        """Removes the events with the given `attribute.transaction_id`s, returning how many there were."""
+        keys = list(dict.fromkeys(key for key in keys if key is not None and _hashable(key)))
+        with self._lock:
+            removed = self._located(keys)
+            if removed:
+                self.size_bytes -= sum(_event_bytes(segment.events[offset]) for segment, offset in removed)
+                self._remove_keys(keys)
+                self._compact()
+                self.version = max(self.version, self.version_floor) + 1
+        return len(removed)
+
+    def _compact(self) -> None:
+        """Rewrites mostly removed segments and merges the trailing ones, see the class docstring."""
+        rewritten: List[_Segment] = []  # Replaced segments that were part of the dataset
+        created: List[_Segment] = []
+
+        def rewrite(*old: _Segment) -> _Segment:
+            for segment in old:
+                if segment in created:
+                    created.remove(segment)
+                else:
+                    rewritten.append(segment)
+            segment = _Segment([event for segment in old for event in segment.live_events()], self._lock)
+            created.append(segment)
+            return segment
+
+        segments = []
+        for segment in self._segments:
+            if segment.removed * 2 > len(segment.events):
+                segment = rewrite(segment)
+            if segment.events:
+                segments.append(segment)
+        while len(segments) > 1 and segments[-1].live * 2 >= segments[-2].live:
+            last, previous = segments.pop(), segments.pop()
+            segments.append(rewrite(previous, last))
+
+        if self._keys is not None and rewritten:
+            stale = set(map(id, rewritten))
+            for segment in rewritten:
+                for event in segment.events:
+                    found = self._keys.get(_event_key(event))
+                    if found:
+                        found[:] = [position for position in found if id(position[0]) not in stale]
+                        if not found:
+                            del self._keys[_event_key(event)]
+            for segment in created:
+                self._add_keys(self._keys, segment)
+        self._segments = segments or [_Segment([], self._lock)]
+
+    def describe(self) -> Dict[str, Any]:
+        description = {
+            "dataset_id": self.dataset_id,
+            "event_count": self.event_count,
+            "size_bytes": self.size_bytes,
+        }
+        if self.version:
+            description["version"] = self.version
+            description["segments"] = len(self._segments)
+        partitions = [partition for segment in self._segments for partition in segment._partitions or ()]
+        if partitions:
+            description["partitions"] = len(partitions)
+            indexes = [partition._index.describe() for partition in partitions if partition._index is not None]
+            description["indexed_partitions"] = len(indexes)
+            if indexes:
+                description["indexes"] = _merge_index_stats(indexes)
+        return description
+
+
+class DatasetStore:
+    """
+    In-process LRU store of uploaded datasets.
+
+    Datasets are evicted least recently used first once the total of their
+    uploaded sizes would exceed `max_bytes`.
+
+    Uploading the bytes of a stored dataset again returns it unchanged, unless
+    it was updated since: its ID then no longer describes its events, so the
+    upload replaces it. The store remembers the last version of every ID it
+    dropped, so versions keep increasing across deletes and re-uploads.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._datasets: "OrderedDict[str, StoredDataset]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    def __contains__(self, dataset_id: str) -> bool:
+        return dataset_id in self._datasets
+
+    def get(self, dataset_id: str) -> Optional[StoredDataset]:
+        dataset = self._datasets.get(dataset_id)
+        if dataset is not None:
+            self._datasets.move_to_end(dataset_id)
+        return dataset
+
+    def put(self, dataset: StoredDataset) -> StoredDataset:
+        if dataset.size_bytes > self.max_bytes:
+            raise DatasetTooLarge(
+                f"Dataset of {dataset.size_bytes} bytes exceeds the dataset store "
+                f"limit of {self.max_bytes} bytes"
+            )
+        existing = self.get(dataset.dataset_id)
+        if existing is not None:
+            if not existing.version:
+                return existing
+            self._drop(existing.dataset_id)  # Updated since, so no longer the uploaded bytes
+        while self._datasets and self.size_bytes + dataset.size_bytes > self.max_bytes:
+            self._drop(next(iter(self._datasets)))
+        dataset.version_floor = self._versions.get(dataset.dataset_id, 0)
+        self._datasets[dataset.dataset_id] = dataset
+        self.size_bytes += dataset.size_bytes
+        return dataset
+
+    def refresh(self, dataset: StoredDataset) -> None:
+        """Accounts for a stored dataset that changed size, evicting others if it grew past the budget."""
+        self.size_bytes = sum(stored.size_bytes for stored in self._datasets.values())
+        for dataset_id in list(self._datasets):
+            if self.size_bytes <= self.max_bytes:
+                break
+            if dataset_id != dataset.dataset_id:
+                self._drop(dataset_id)
+
+    def delete(self, dataset_id: str) -> bool:
+        if dataset_id not in self._datasets:
+            return False
+        self._drop(dataset_id)
+        return True
+
+    def _drop(self, dataset_id: str) -> None:
+        dataset = self._datasets.pop(dataset_id)
+        self.size_bytes -= dataset.size_bytes
+        if dataset.version:
+            self._versions[dataset_id] = max(self._versions.get(dataset_id, 0), dataset.version)
+
+    def clear(self) -> None:
+        for dataset_id in list(self._datasets):
+            self._drop(dataset_id)
+        self.size_bytes = 0
+
+
+class DatasetIngest:
+    """
+    Parses an uploaded ADAGE document into a `StoredDataset`, a body chunk at a time.
+
+    The body is hashed while it is parsed, so the content ID costs no extra
+    pass over the data. Events are held as compact `EventRecord`s. `feed` and
+    `close` do CPU-bound work, so the API runs them on the query executor.
+    Both raise `StreamParseError` for malformed documents.
+    """
+
+    def __init__(self) -> None:
+        self._parser = EventStreamParser()
+        self._compact = Compactor().event
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._events: List[Any] = []
+
+    def feed(self, chunk: bytes) -> None:
+        self._digest.update(chunk)
+        self._size += len(chunk)
+        self._events.extend(map(self._compact, self._parser.feed(chunk)))
+
+    def close(self) -> StoredDataset:
+        parser = self._parser
+        self._events.extend(map(self._compact, parser.close()))
+        data = dict(parser.metadata)
+        if parser.has_events:
+            data["events"] = self._events
+        return StoredDataset(self._digest.hexdigest(), data, self._size)
+
+
+datasets = DatasetStore(settings.DATASET_CACHE_BYTES)
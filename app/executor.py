@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app import settings
+
+_cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "cancel_event", default=None
+)
+
+
+class QueueFull(Exception):
+    """Raised when too many queries are already running or waiting."""
+
+
+class QueryCancelled(Exception):
+    """Raised inside a query once its caller has given up on it."""
+
+
+def check_cancelled() -> None:
+    """Raises `QueryCancelled` if the query running on this thread was cancelled."""
+    cancel_event = _cancel_event.get()
+    if cancel_event is not None and cancel_event.is_set():
+        raise QueryCancelled()
+
+
+class QueryExecutor:
+    """
+    Runs CPU-bound queries on worker threads instead of the event loop.
+
+    At most `max_concurrency` queries run at once and at most `max_queue` more
+    wait for a slot; beyond that `run` raises `QueueFull` straight away. A
+    query that has not finished `timeout` seconds after it was submitted is
+    cancelled: `run` raises `asyncio.TimeoutError` and the worker stops at its
+    next `check_cancelled` call. Work done in several steps, such as the
+    chunks of a streamed response, runs as one query through a `session`.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pending = 0
+        self._threads = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query")
+
+    def session(self) -> "QuerySession":
+        """Admits a query run in steps, raising `QueueFull` if there is no room for it."""
+        if self.pending >= self.max_concurrency + self.max_queue:
+            raise QueueFull()
+        self.pending += 1
+        return QuerySession(self, asyncio.get_running_loop().time() + self.timeout)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        session = self.session()
+        try:
+            return await session.run(func, *args)
+        finally:
+            session.close()
+
+
+class QuerySession:
+    """
+    A query of `QueryExecutor` that runs in several steps.
+
+    The session counts as one pending query until `close`, whatever the
+    number of steps, and all of its steps share one deadline. Steps run one
+    at a time: each is awaited before the next is submitted.
+    """
+
+    def __init__(self, executor: QueryExecutor, deadline: float):
+        self._executor = executor
+        self._deadline = deadline
+        self._cancel_event = threading.Event()
+        self._closed = False
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Runs one step on a worker thread, raising `asyncio.TimeoutError` past the deadline."""
+        context = contextvars.copy_context()
+        context.run(_cancel_event.set, self._cancel_event)
+
+        def call() -> Any:
+            check_cancelled()
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor._threads, context.run, call)
+            return await asyncio.wait_for(future, max(self._deadline - loop.time(), 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._cancel_event.set()
+            raise
+
+    def close(self) -> None:
+        """Ends the query, cancelling a step still running. Closing twice is harmless."""
+        if not self._closed:
+            self._closed = True
+            self._cancel_event.set()
+            self._executor.pending -= 1
+
+
+queries = QueryExecutor(
+    settings.MAX_CONCURRENT_QUERIES,
+    settings.MAX_QUEUED_QUERIES,
+    settings.QUERY_TIMEOUT_SECONDS,
+)
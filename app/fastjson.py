@@ -0,0 +1,53 @@
+"""
+JSON encoding and decoding for the high-throughput endpoints.
+
+Uses `orjson` when it is installed and falls back to the standard library
+otherwise, so the service still runs without it. `orjson` reads integers
+past 64 bits as floats and cannot write them, so documents that may hold
+such integers go through the standard library as well.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None  # type: ignore[assignment]
+
+JSONDecodeError = ValueError  # Both json.JSONDecodeError and orjson.JSONDecodeError subclass it
+
+# Maps every digit to "0" and every other byte to a space, so that runs of
+# digits can be found with a plain substring search
+_DIGIT_MASK = bytes(ord("0") if byte in b"0123456789" else ord(" ") for byte in range(256))
+
+# Integers past 64 bits have at least 19 digits; false positives only cost speed
+_LONG_DIGITS = b"0" * 19
+
+
+def loads(body: bytes) -> Any:
+    if orjson is None:
+        return json.loads(body)
+    content = orjson.loads(body)
+    if body.translate(_DIGIT_MASK).find(_LONG_DIGITS) >= 0:
+        return json.loads(body)  # orjson read integers past 64 bits as floats
+    return content
+
+
+def default(value: Any) -> Any:
+    """
+    Encoding hook for the event types of `app.records` (`EventRecord`,
+    `ProjectedEvent`), which encode as the dicts they stand for.
+    """
+    to_dict = getattr(value, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return to_dict()
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, default=default)
+        except TypeError:
+            pass  # Integers past 64 bits
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
@@ -0,0 +1,274 @@
+import time
+from typing import List, Dict, Any, Collection, Optional, Tuple
+
+import numpy as np
+
+from app import settings
+from app.executor import check_cancelled
+from app.planner import DatasetStats, QueryPlan
+from app.timestamps import MISSING_TIMESTAMP, VALID_TIMESTAMP, read_timestamps
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def _postings(index: Dict[Any, List[int]]) -> Dict[Any, np.ndarray]:
+    return {key: np.array(offsets, dtype=np.int64) for key, offsets in index.items()}
+
+
+def _union(postings: List[np.ndarray]) -> np.ndarray:
+    if not postings:
+        return _EMPTY
+    if len(postings) == 1:
+        return postings[0]
+    return np.unique(np.concatenate(postings))
+
+
+class IndexStats:
+    """Build and usage statistics for one index."""
+
+    def __init__(self, build_ms: float, keys: int, indexed: bool = True):
+        self.build_ms = build_ms
+        self.keys = keys
+        self.indexed = indexed
+        self.lookups = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "indexed": self.indexed,
+            "keys": self.keys,
+            "build_ms": round(self.build_ms, 3),
+            "lookups": self.lookups,
+        }
+
+
+class DatasetIndex:
+    """
+    Secondary indexes over the events of a stored dataset.
+
+    Holds a hash index from `event_type` to event offsets, a sorted timestamp
+    array for range lookups, and inverted indexes for attributes, each built
+    the first time a filter refers to it. Attributes with more than
+    `settings.INDEX_MAX_CARDINALITY` distinct values (or unhashable ones) are
+    left unindexed. `candidates` intersects posting lists to narrow a query
+    down to a superset of its matches. `select` has an `app.planner.QueryPlan`
+    check the candidates only against the predicates no lookup answered, in
+    the order it chose from the `statistics` the indexes provide.
+    """
+
+    def __init__(
+        self,
+        events: List[Dict[str, Any]],
+        max_cardinality: Optional[int] = None,
+        epochs: Optional[np.ndarray] = None,
+    ):
+        self.events = events
+        self.max_cardinality = (
+            settings.INDEX_MAX_CARDINALITY if max_cardinality is None else max_cardinality
+        )
+        self.stats: Dict[str, IndexStats] = {}
+        self._attributes: Dict[str, Optional[Dict[Any, np.ndarray]]] = {}
+        self._statistics: Optional[DatasetStats] = None
+        self.event_types = self._build_event_types()
+        self.timestamps, self.timestamp_offsets, self.untimed_offsets = (
+            self._build_timestamps() if epochs is None else self._sort_epochs(epochs)
+        )
+
+    def _build_event_types(self) -> Optional[Dict[Any, np.ndarray]]:
+        started = time.perf_counter()
+        index: Dict[Any, List[int]] = {}
+        try:
+            for offset, event in enumerate(self.events):
+                index.setdefault(event.get("event_type"), []).append(offset)
+        except (AttributeError, TypeError):
+            self.stats["event_type"] = IndexStats(0.0, 0, indexed=False)
+            return None
+        postings = _postings(index)
+        self.stats["event_type"] = IndexStats((time.perf_counter() - started) * 1000, len(postings))
+        return postings
+
+    def _build_timestamps(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[np.ndarray]]:
+        started = time.perf_counter()
+        try:
+            states, epochs = read_timestamps(self.events)
+        except (AttributeError, TypeError):
+            self.stats["timestamp"] = IndexStats(0.0, 0, indexed=False)
+            return None, None, None
+
+        offsets = np.flatnonzero(states == VALID_TIMESTAMP)  # Invalid timestamps never match
+        order = np.argsort(epochs[offsets], kind="stable")
+        self.stats["timestamp"] = IndexStats((time.perf_counter() - started) * 1000, len(offsets))
+        return (
+            epochs[offsets][order],
+            offsets[order].astype(np.int64),
+            np.flatnonzero(states == MISSING_TIMESTAMP).astype(np.int64),
+        )
+
+    def _sort_epochs(self, epochs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The timestamp index from already parsed timestamps, all valid, one per event."""
+        started = time.perf_counter()
+        order = np.argsort(epochs, kind="stable")
+        self.stats["timestamp"] = IndexStats((time.perf_counter() - started) * 1000, len(epochs))
+        return epochs[order], order.astype(np.int64), _EMPTY
+
+    def attribute(self, name: str) -> Optional[Dict[Any, np.ndarray]]:
+        """Returns the inverted index for an attribute, or `None` if it is not indexable."""
+        if name not in self._attributes:
+            started = time.perf_counter()
+            index: Dict[Any, List[int]] = {}
+            indexable = True
+            try:
+                for offset, event in enumerate(self.events):
+                    attributes = event.get("attribute", {})
+                    if name in attributes:
+                        index.setdefault(attributes[name], []).append(offset)
+                        if len(index) > self.max_cardinality:
+                            indexable = False
+                            break
+            except (AttributeError, TypeError):
+                indexable = False
+            postings = _postings(index) if indexable else None
+            self._attributes[name] = postings
+            self.stats[f"attribute.{name}"] = IndexStats(
+                (time.perf_counter() - started) * 1000,
+                0 if postings is None else len(postings),
+                indexed=postings is not None,
+            )
+        return self._attributes[name]
+
+    def _attribute_statistics(self, name: str) -> Optional[Tuple[int, int]]:
+        postings = self.attribute(name)
+        if postings is None:
+            return None
+        return len(postings), sum(len(offsets) for offsets in postings.values())
+
+    @property
+    def statistics(self) -> DatasetStats:
+        """Planner statistics, read off the indexes."""
+        if self._statistics is None:
+            timestamps = self.timestamps
+            self._statistics = DatasetStats(
+                len(self.events),
+                None if self.event_types is None else {
+                    key: len(offsets) for key, offsets in self.event_types.items()
+                },
+                (int(timestamps[0]), int(timestamps[-1])) if timestamps is not None and len(timestamps) else None,
+                None if timestamps is None else len(timestamps),
+                None if self.untimed_offsets is None else len(self.untimed_offsets),
+                self._attribute_statistics,
+            )
+        return self._statistics
+
+    def _lookup(self, postings: Dict[Any, np.ndarray], keys) -> np.ndarray:
+        found = []
+        for key in keys:
+            try:
+                offsets = postings.get(key)
+            except TypeError:
+                continue
+            if offsets is not None:
+                found.append(offsets)
+        return _union(found)
+
+    def candidates(
+        self,
+        plan,
+        skip: Collection[str] = (),
+        answered: Optional[List[str]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Returns the sorted offsets of the events that may match a `FilterPlan`.
+
+        Returns `None` when no index applies and the whole dataset has to be
+        scanned. Lookups for the predicates named in `skip` (see
+        `app.planner.QueryPlan`) are left out, and the names of those the
+        lookups answered exactly are appended to `answered`.
+        """
+        lists: List[np.ndarray] = []
+        answered = [] if answered is None else answered
+
+        if self.event_types is not None and "event_type" not in skip:
+            self.stats["event_type"].lookups += 1
+            lists.append(self._lookup(self.event_types, plan.event_types))
+            answered.append("event_type")
+
+        timestamps, offsets, untimed = self.timestamps, self.timestamp_offsets, self.untimed_offsets
+        if (
+            timestamps is not None and offsets is not None and untimed is not None and "timestamp" not in skip
+            and (plan.start_epoch is not None or plan.end_epoch is not None)
+        ):
+            self.stats["timestamp"].lookups += 1
+            low = 0 if plan.start_epoch is None else np.searchsorted(timestamps, plan.start_epoch, "left")
+            high = len(timestamps) if plan.end_epoch is None else np.searchsorted(timestamps, plan.end_epoch, "right")
+            in_range = np.sort(offsets[low:high])
+            lists.append(np.union1d(in_range, untimed))
+            answered.append("timestamp")
+
+        for position, filter_ in enumerate(plan.filters):
+            if filter_.matches_missing:
+                continue  # Events without the attribute are not in its index
+            postings = self.attribute(filter_.attribute)
+            if postings is None:
+                continue
+            self.stats[f"attribute.{filter_.attribute}"].lookups += 1
+            if filter_.operator == "in":
+                lists.append(self._lookup(postings, filter_.operand))
+            else:
+                lists.append(_union([offsets for key, offsets in postings.items() if filter_.test(key)]))
+            answered.append(f"filters[{position}]")
+
+        if not lists:
+            return None
+        lists.sort(key=len)
+        result = lists[0]
+        for offsets in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, offsets, assume_unique=True)
+        return result
+
+    def _plan(self, plan, exact: bool) -> Tuple[QueryPlan, Optional[np.ndarray], List[str]]:
+        query = QueryPlan(plan, self.statistics, exact)
+        answered: List[str] = []
+        if query.empty:
+            return query, _EMPTY, answered
+        offsets = self.candidates(plan, query.skipped_names, answered)
+        if not exact and "event_type" in answered:
+            answered.remove("event_type")  # Replaced events are still in its postings
+        return query, offsets, answered
+
+    def positions(self, plan, exact: bool = True) -> List[int]:
+        """
+        Returns the offsets of the events matched by a `FilterPlan`, in order.
+
+        `exact` is false once events were replaced since the indexes were built
+        (see `app.planner.QueryPlan`).
+        """
+        query, offsets, answered = self._plan(plan, exact)
+        matches = query.matcher(answered)
+        check_cancelled()
+        candidates = range(len(self.events)) if offsets is None else offsets.tolist()
+        if matches is None:
+            selected = list(candidates)
+        else:
+            events = self.events
+            selected = [offset for offset in candidates if matches(events[offset])]
+        plan.record_scan(len(candidates), len(selected))
+        return selected
+
+    def select(self, plan, exact: bool = True) -> List[Dict[str, Any]]:
+        """Returns the events matched by a `FilterPlan` through the indexes, unprojected."""
+        events = self.events
+        return [events[offset] for offset in self.positions(plan, exact)]
+
+    def explain(self, plan, exact: bool = True) -> Dict[str, Any]:
+        """Describes how `select` runs a `FilterPlan`, see `app.planner.QueryPlan.explain`."""
+        query, offsets, answered = self._plan(plan, exact)
+        return query.explain(answered, None if offsets is None else len(offsets))
+
+    def apply(self, plan) -> List[Dict[str, Any]]:
+        """Filters the events through the indexes and projects the matches."""
+        project = plan.project
+        return [project(event) for event in self.select(plan)]
+
+    def describe(self) -> Dict[str, Any]:
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
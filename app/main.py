@@ -1,7 +1,28 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from app.preprocessing import process_data
+import asyncio
+import os
+from functools import partial
+from itertools import islice
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, model_validator
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional, Literal, Union
+from app import fastjson, settings
+from app.aggregation import aggregate
+from app.batch import select_batch
+from app.compression import CompressionMiddleware
+from app.cache import dataset_digest, render_json, results
+from app.executor import QuerySession, QueueFull, queries
+from app.columnar import ColumnarUnsupported
+from app.mapped import MappedDataset, mapped_datasets
+from app.metrics import MetricsMiddleware, registry, stage
+from app.datasets import DatasetIngest, DatasetTooLarge, StoredDataset, datasets
+from app.operators import OPERATORS
+from app.pagination import decode_cursor, encode_cursor, project_page
+from app.partitions import partition_indexes
+from app.preprocessing import FilterPlan
+from app.streaming import NDJSON_MEDIA_TYPE, EventStreamParser, StreamParseError, iter_ndjson
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(
@@ -18,20 +39,157 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)  # Outermost, so timings and byte counts cover the whole request
+
+registry.gauge("preprocessing_queries_pending", "Queries running or queued on the query executor.", lambda: queries.pending)
+registry.gauge("preprocessing_result_cache_bytes", "Bytes held by the result cache.", lambda: results.size_bytes)
+registry.gauge("preprocessing_stored_datasets", "Datasets held in memory by the dataset store.", lambda: len(datasets))
+registry.gauge("preprocessing_stored_dataset_bytes", "Uploaded bytes of the datasets in the dataset store.", lambda: datasets.size_bytes)
+registry.gauge(
+    "preprocessing_partition_index_events",
+    "Events of the stored dataset time partitions holding a built index.",
+    lambda: partition_indexes.events,
+)
 
 
 class FilterCriteria(BaseModel):
     attribute: str
-    values: List[Any]
+    values: List[Any] = []  # Required by every operator except exists/null
+    operator: Literal[
+        "in", "not_in", "gt", "gte", "lt", "lte", "between", "prefix", "exists", "null"
+    ] = "in"
 
+    @model_validator(mode="before")
+    @classmethod
+    def check_values(cls, data: Any) -> Any:
+        if isinstance(data, dict) and "values" not in data and data.get("operator") not in ("exists", "null"):
+            raise ValueError("Field 'values' is required for this operator")
+        return data
 
-class PreprocessRequest(BaseModel):
-    json_data: Dict[str, Any]
+    @model_validator(mode="after")
+    def check_arity(self) -> "FilterCriteria":
+        arity = OPERATORS[self.operator]
+        if arity and len(self.values) != arity:
+            raise ValueError(f"Filter operator '{self.operator}' takes {arity} value(s)")
+        return self
+
+    @model_validator(mode="after")
+    def check_hashable(self) -> "FilterCriteria":
+        if self.operator in ("in", "not_in"):
+            for value in self.values:
+                if isinstance(value, (list, dict)):
+                    raise ValueError(f"Filter operator '{self.operator}' takes scalar values, not {value!r}")
+        return self
+
+
+class Metric(BaseModel):
+    op: Literal["count", "sum", "mean", "min", "max", "median", "percentile"]
+    attribute: Optional[str] = None  # Default: Count events rather than values
+    percentile: Optional[float] = None  # Required by the percentile metric, 0-100
+
+    @model_validator(mode="after")
+    def check_operands(self) -> "Metric":
+        if self.op != "count" and not self.attribute:
+            raise ValueError(f"Metric '{self.op}' needs an attribute")
+        if self.op == "percentile" and (self.percentile is None or not 0 <= self.percentile <= 100):
+            raise ValueError("Metric 'percentile' needs a percentile between 0 and 100")
+        return self
+
+
+class Aggregation(BaseModel):
+    group_by: List[str] = []  # Default: A single group
+    time_bucket: Optional[Literal["day", "week", "month", "quarter", "year"]] = None  # Default: No time grouping
+    metrics: List[Metric] = [Metric(op="count")]
+
+    def apply(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Aggregates the given (unprojected) events."""
+        return aggregate(events, self.group_by, self.time_bucket, self.metrics)
+
+
+class FilterQuery(BaseModel):
     event_type: Optional[List[str]] = []  # Default: No filtering by event type
     filters: Optional[List[FilterCriteria]] = []  # Default: No filtering
     include_attributes: Optional[List[str]] = None  # Default: Include all attributes
     start_timestamp: Optional[str] = None  # Default: No time range filtering
     end_timestamp: Optional[str] = None  # Default: No time range filtering
+    engine: Literal["auto", "python", "columnar", "parallel"] = "auto"  # Default: Chosen by dataset size
+    aggregate: Optional[Aggregation] = None  # Default: Return the matched events themselves
+    limit: Optional[int] = Field(None, ge=1)  # Default: Return every match
+    offset: int = Field(0, ge=0)  # Default: Start from the first match
+    cursor: Optional[str] = None  # A `next_cursor` from a previous page, overrides `offset`
+    sort_by: Optional[str] = None  # "timestamp" or an attribute; Default: Dataset order
+    descending: bool = False
+
+    @model_validator(mode="after")
+    def check_cursor(self) -> "FilterQuery":
+        if self.cursor is not None:
+            self.offset = decode_cursor(self.cursor, self.sort_by, self.descending)
+        return self
+
+    def to_plan(self) -> FilterPlan:
+        """
+        Compiles the query into a `FilterPlan`.
+
+        The plan projects in zero-copy mode: the endpoints that run it encode
+        the matches straight to JSON and hold the source events anyway.
+        """
+        return FilterPlan(
+            self.event_type or [],
+            filters=self.filters or [],
+            include_attributes=self.include_attributes or [],
+            start_timestamp=self.start_timestamp,
+            end_timestamp=self.end_timestamp,
+            zero_copy=True,
+        )
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        """The query options beyond the filter plan, for result cache keys."""
+        return self.model_dump(include={"aggregate", "limit", "offset", "sort_by", "descending"})
+
+    def run(
+        self,
+        select: Callable[[], List[Dict[str, Any]]],
+        page: Callable[..., Any],
+    ) -> Dict[str, Any]:
+        """
+        Builds the response content: the requested page of projected matches
+        from `page` (a `FilterPlan.page`-like callable), or the aggregations over
+        the raw matches from `select` when `aggregate` is set. Paginated
+        responses carry a `next_cursor`, `None` on the last page.
+        """
+        if self.aggregate is not None:
+            return {"status": "success", "aggregations": self.aggregate.apply(select())}
+        events, more = page(self.offset, self.limit, self.sort_by, self.descending)
+        content = {"status": "success", "filtered_data": events}
+        if self.limit is not None:
+            content["next_cursor"] = (
+                encode_cursor(self.offset + self.limit, self.sort_by, self.descending) if more else None
+            )
+        return content
+
+
+class PreprocessRequest(FilterQuery):
+    json_data: Dict[str, Any]
+
+
+class BatchQuery(BaseModel):
+    queries: List[FilterQuery] = Field(..., min_length=1)
+    engine: Literal["auto", "python", "columnar"] = "auto"  # Used for the whole batch, over per-query engines
+
+
+class BatchRequest(BatchQuery):
+    json_data: Dict[str, Any]
+
+
+class EventsUpdate(BaseModel):
+    events: List[Dict[str, Any]] = Field(min_length=1)
+    upsert: bool = False  # Replace the stored events with the same attribute.transaction_id
+
+
+class EventsRemoval(BaseModel):
+    transaction_ids: List[Union[str, int]] = Field(min_length=1)
 
 
 @app.get("/")
@@ -40,10 +198,227 @@ def health_check():
     return {"status": "healthy", "microservice": "preprocessing", "updated": "16/04/2025"}
 
 
+def compile_query(query: FilterQuery) -> FilterPlan:
+    try:
+        return query.to_plan()
+    except ValueError as ve:
+        raise HTTPException(status_code=500, detail=str(ve))
+    except TypeError as te:  # Unhashable filter values
+        raise HTTPException(status_code=422, detail=str(te))
+
+
+def render_filtered(run: Callable[[], Dict[str, Any]]) -> bytes:
+    try:
+        with stage("filter"):
+            content = run()
+        with stage("encode"):
+            return render_json(content)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def open_session() -> QuerySession:
+    """Admits query work done in several steps to the query executor, see `run_query`."""
+    try:
+        return queries.session()
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Too many queries in progress, retry later")
+
+
+async def run_query(func: Callable[..., Any], *args: Any, session: Optional[QuerySession] = None) -> Any:
+    """
+    Runs CPU-bound query work on the query executor, off the event loop: as a
+    query of its own, or as a step of `session`, whose steps hold a single
+    executor slot and share one deadline.
+    """
+    owned = session is None
+    query_session = open_session() if session is None else session
+    try:
+        return await query_session.run(func, *args)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Query timed out")
+    finally:
+        if owned:
+            query_session.close()
+
+
+async def stream_query(chunks: Iterator[bytes], media_type: str) -> StreamingResponse:
+    """
+    Streams the chunks of a lazy query, computing each one on the query
+    executor as a step of one session. The session is admitted and the first
+    chunk computed before the response starts, so a full queue is answered
+    with a 429; a stream that outlives the query timeout is cut off.
+    """
+    session = open_session()
+    try:
+        first = await run_query(next, chunks, None, session=session)
+    except BaseException:
+        session.close()
+        raise
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            chunk = first
+            while chunk is not None:
+                yield chunk
+                chunk = await session.run(next, chunks, None)
+        finally:
+            session.close()
+
+    # Also closed once the response ends, in case the client left before the body was read
+    return StreamingResponse(body(), media_type=media_type, background=BackgroundTask(session.close))
+
+
+def batch_content(
+    queries: List[FilterQuery],
+    plans: List[FilterPlan],
+    selected: List[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """Builds the response content of a batch from the unprojected matches of each query."""
+    return {
+        "status": "success",
+        "results": [
+            query.run(lambda: matches, lambda *page: project_page(plan, matches, *page))
+            for query, plan, matches in zip(queries, plans, selected)
+        ],
+    }
+
+
+async def filtered_response(
+    query: FilterQuery,
+    plan: FilterPlan,
+    run: Callable[[], Dict[str, Any]],
+    dataset_key: Callable[[], str],
+    cache_control: Optional[str],
+) -> Response:
+    """
+    Runs a filter query through the result cache.
+
+    `Cache-Control: no-cache` skips the lookup but still stores the fresh
+    result, `no-store` bypasses the cache entirely. The `X-Cache` response
+    header reports `HIT`, `MISS` or `BYPASS`.
+    """
+    directives = {directive.strip().lower() for directive in (cache_control or "").split(",")}
+    if not results.enabled or "no-store" in directives:
+        body = await run_query(render_filtered, run)
+        return Response(body, media_type="application/json", headers={"X-Cache": "BYPASS"})
+
+    key = await run_query(lambda: results.key(dataset_key(), plan, query.options))
+    if "no-cache" not in directives:
+        body = results.get(key)
+        if body is not None:
+            return Response(body, media_type="application/json", headers={"X-Cache": "HIT"})
+
+    body = await run_query(render_filtered, run)
+    results.put(key, body)
+    return Response(body, media_type="application/json", headers={"X-Cache": "MISS"})
+
+
 @app.post("/filter-data")
-async def filter_data(request: PreprocessRequest):
+async def filter_data(
+    request: PreprocessRequest,
+    accept: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+):
     """
     Filters a dataset based on event type, attributes, and a time range.
+
+    With `Accept: application/x-ndjson` the matched events are streamed back
+    one per line as they are found, instead of in a single JSON envelope.
+    Envelope responses are served from the result cache when possible.
+    With `aggregate` set, per-group metrics over the matched events are
+    returned under `aggregations` instead of the events themselves. `limit`,
+    `offset`/`cursor` and `sort_by` return one page of the matches at a time.
+    """
+    if not request.json_data:
+        raise HTTPException(status_code=400, detail="No JSON data provided")
+
+    if "events" not in request.json_data:
+        raise HTTPException(status_code=400, detail="Invalid JSON format: Missing 'events' key")
+
+    plan = compile_query(request)
+    if accept and NDJSON_MEDIA_TYPE in accept and request.aggregate is None and request.sort_by is None:
+        stop = None if request.limit is None else request.offset + request.limit
+        events = islice(plan.iter_apply(request.json_data), request.offset, stop)
+        return await stream_query(iter_ndjson(events), NDJSON_MEDIA_TYPE)
+
+    return await filtered_response(
+        request,
+        plan,
+        lambda: request.run(
+            lambda: plan.select(request.json_data, engine=request.engine),
+            partial(plan.page, request.json_data, engine=request.engine),
+        ),
+        lambda: dataset_digest(request.json_data),
+        cache_control,
+    )
+
+
+@app.post(
+    "/filter-data/fast",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/PreprocessRequest"}}},
+        }
+    },
+)
+async def filter_data_fast(request: Request):
+    """
+    High-throughput variant of `/filter-data`.
+
+    Takes the same request body, but decodes it with a fast JSON parser,
+    validates only the small control fields (never the events themselves) and
+    writes the response straight to bytes, skipping FastAPI's encoder.
+    """
+    raw = await request.body()
+    try:
+        with stage("parse"):
+            body = await run_query(fastjson.loads, raw)
+    except fastjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON format: expected an object")
+
+    json_data = body.pop("json_data", None)
+    try:
+        with stage("validate"):
+            query = FilterQuery.model_validate(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    if not json_data:
+        raise HTTPException(status_code=400, detail="No JSON data provided")
+
+    if not isinstance(json_data, dict) or "events" not in json_data:
+        raise HTTPException(status_code=400, detail="Invalid JSON format: Missing 'events' key")
+
+    plan = compile_query(query)
+
+    def render() -> bytes:
+        try:
+            with stage("filter"):
+                content = query.run(
+                    lambda: plan.select(json_data, engine=query.engine),
+                    partial(plan.page, json_data, engine=query.engine),
+                )
+            with stage("encode"):
+                return fastjson.dumps(content)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return Response(await run_query(render), media_type="application/json")
+
+
+@app.post("/filter-data/batch")
+async def filter_data_batch(request: BatchRequest):
+    """
+    Runs several filter queries over one dataset in a single pass.
+
+    Takes the dataset once, as `json_data`, with a list of `queries` shaped like
+    the `/filter-data` criteria, and returns one result per query, in order.
+    The events are scanned once for all the queries together.
     """
     if not request.json_data:
         raise HTTPException(status_code=400, detail="No JSON data provided")
@@ -51,28 +426,262 @@ async def filter_data(request: PreprocessRequest):
     if "events" not in request.json_data:
         raise HTTPException(status_code=400, detail="Invalid JSON format: Missing 'events' key")
 
+    plans = [compile_query(query) for query in request.queries]
+    body = await run_query(render_filtered, lambda: batch_content(
+        request.queries, plans, select_batch(plans, request.json_data, engine=request.engine)
+    ))
+    return Response(body, media_type="application/json")
+
+
+@app.post("/filter-data/stream")
+async def filter_data_stream(
+    request: Request,
+    event_type: List[str] = Query([]),
+    filters: Optional[str] = None,
+    include_attributes: List[str] = Query([]),
+    start_timestamp: Optional[str] = None,
+    end_timestamp: Optional[str] = None,
+):
+    """
+    Filters a dataset while it is being uploaded.
+
+    The request body is the ADAGE document itself (what `/filter-data` takes as
+    `json_data`) and the filter criteria are query parameters, with `filters`
+    given as a JSON array. Events are parsed one at a time as the body arrives
+    and non-matching events are discarded straight away, so memory use follows
+    the size of the result rather than the size of the upload. The chunks of
+    the body are filtered on the query executor as one query.
+    """
+    try:
+        filter_criteria = TypeAdapter(List[FilterCriteria]).validate_json(filters or "[]")
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**error, "loc": ("query", "filters", *error["loc"])} for error in e.errors(include_url=False)
+        ])
+
     try:
-        filtered_data = process_data(
-            data=request.json_data,
-            event_types=request.event_type or [],
-            filters=request.filters or [],
-            include_attributes=request.include_attributes or [],
-            start_timestamp=request.start_timestamp,
-            end_timestamp=request.end_timestamp,
+        plan = FilterPlan(
+            event_type,
+            filters=filter_criteria,
+            include_attributes=include_attributes,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
         )
-        return {"status": "success", "filtered_data": filtered_data}
     except ValueError as ve:
         raise HTTPException(status_code=500, detail=str(ve))
+
+    parser = EventStreamParser()
+    filtered_data: List[Dict[str, Any]] = []
+
+    def scan(chunk: Optional[bytes]) -> None:
+        events = parser.close() if chunk is None else parser.feed(chunk)
+        filtered_data.extend(plan.project(event) for event in events if plan.matches(event))
+
+    session = open_session()
+    try:
+        async for chunk in request.stream():
+            await run_query(scan, chunk, session=session)
+        await run_query(scan, None, session=session)
+    except StreamParseError as spe:
+        raise HTTPException(status_code=400, detail=str(spe))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        session.close()
+
+    if parser.is_empty:
+        raise HTTPException(status_code=400, detail="No JSON data provided")
+
+    if not parser.has_events:
+        raise HTTPException(status_code=400, detail="Invalid JSON format: Missing 'events' key")
+
+    return {"status": "success", "filtered_data": filtered_data}
+
+
+def get_dataset(dataset_id: str) -> Union[StoredDataset, MappedDataset]:
+    """Looks a dataset up among the uploaded ones, then the mapped ones on disk."""
+    dataset = datasets.get(dataset_id) or mapped_datasets.get(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return dataset
+
+
+@app.post("/datasets")
+async def upload_dataset(request: Request):
+    """
+    Stores a dataset so it can be queried repeatedly without re-uploading it.
+
+    The request body is the ADAGE document itself. The returned `dataset_id` is
+    the SHA-256 of the body, so uploading the same document again is a no-op.
+
+    With `settings.SHARED_DATASETS` (set by `python -m app.server` for more than
+    one worker), the document is converted into the mapped store instead, so
+    that every worker process serves it from one copy in the page cache.
+    Mapped datasets are read-only, so they cannot be updated.
+    """
+    if settings.SHARED_DATASETS:
+        return await upload_shared_dataset(request)
+
+    ingest = DatasetIngest()
+    session = open_session()
+    try:
+        async for chunk in request.stream():
+            await run_query(ingest.feed, chunk, session=session)
+        dataset = await run_query(ingest.close, session=session)
+    except StreamParseError as spe:
+        raise HTTPException(status_code=400, detail=str(spe))
+    finally:
+        session.close()
+
+    if not dataset.data:
+        raise HTTPException(status_code=400, detail="No JSON data provided")
+
+    if "events" not in dataset.data:
+        raise HTTPException(status_code=400, detail="Invalid JSON format: Missing 'events' key")
+
+    try:
+        dataset = datasets.put(dataset)
+    except DatasetTooLarge as dtl:
+        raise HTTPException(status_code=413, detail=str(dtl))
+    return {"status": "success", **dataset.describe()}
+
+
+async def upload_shared_dataset(request: Request):
+    path = await mapped_datasets.spool(request.stream())
+    try:
+        dataset = await run_query(mapped_datasets.add, path)
+    except DatasetTooLarge as dtl:
+        raise HTTPException(status_code=413, detail=str(dtl))
+    except (ValueError, ColumnarUnsupported) as e:  # StreamParseError is a ValueError
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(path)
+    return {"status": "success", **dataset.describe()}
+
+
+@app.get("/datasets/{dataset_id}")
+def describe_dataset(dataset_id: str):
+    """Describes a stored dataset."""
+    return {"status": "success", **get_dataset(dataset_id).describe()}
+
+
+@app.delete("/datasets/{dataset_id}")
+def delete_dataset(dataset_id: str):
+    """Removes a stored dataset."""
+    deleted = datasets.delete(dataset_id)
+    if settings.SHARED_DATASETS:
+        deleted = mapped_datasets.delete(dataset_id) or deleted
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return {"status": "success", "dataset_id": dataset_id}
+
+
+def get_stored_dataset(dataset_id: str) -> StoredDataset:
+    """Looks up an uploaded dataset to update; mapped datasets are read-only."""
+    dataset = datasets.get(dataset_id)
+    if dataset is None:
+        if mapped_datasets.get(dataset_id) is not None:
+            raise HTTPException(status_code=400, detail=f"Mapped datasets are read-only: {dataset_id}")
+        raise HTTPException(status_code=404, detail=f"Dataset not found: {dataset_id}")
+    return dataset
+
+
+@app.post("/datasets/{dataset_id}/events")
+async def append_events(dataset_id: str, request: EventsUpdate):
+    """
+    Appends events to a stored dataset, without re-uploading what it already holds.
+
+    With `upsert`, each new event replaces the stored events with the same
+    `attribute.transaction_id`. Only the new events are indexed; the
+    `dataset_id` stays the same.
+    """
+    dataset = get_stored_dataset(dataset_id)
+    try:
+        counts = await run_query(dataset.append, request.events, request.upsert, datasets.max_bytes)
+    except DatasetTooLarge as dtl:
+        raise HTTPException(status_code=413, detail=str(dtl))
+    datasets.refresh(dataset)
+    return {"status": "success", **counts, **dataset.describe()}
+
+
+@app.post("/datasets/{dataset_id}/events/remove")
+async def remove_events(dataset_id: str, request: EventsRemoval):
+    """Removes the events with the given `attribute.transaction_id`s from a stored dataset."""
+    dataset = get_stored_dataset(dataset_id)
+    removed = await run_query(dataset.remove, request.transaction_ids)
+    datasets.refresh(dataset)
+    return {"status": "success", "removed": removed, **dataset.describe()}
+
+
+@app.post("/datasets/{dataset_id}/filter-data")
+async def filter_dataset(
+    dataset_id: str,
+    query: FilterQuery,
+    cache_control: Optional[str] = Header(None),
+):
+    """
+    Filters a stored dataset based on event type, attributes, and a time range.
+
+    Both uploaded datasets and those converted with `python -m app.mapped` can
+    be queried.
+    """
+    dataset = get_dataset(dataset_id)
+    plan = compile_query(query)
+    return await filtered_response(
+        query,
+        plan,
+        lambda: query.run(
+            lambda: dataset.select(plan, engine=query.engine),
+            partial(dataset.page, plan, engine=query.engine),
+        ),
+        lambda: dataset.cache_key,
+        cache_control,
+    )
+
+
+@app.post("/datasets/{dataset_id}/filter-data/explain")
+async def explain_dataset_query(dataset_id: str, query: FilterQuery):
+    """
+    Describes how a filter query would run over a stored dataset: the
+    statistics the planner used, the predicates answered by index lookups or
+    column masks, those skipped, and the order of the remaining row checks.
+    """
+    dataset = get_dataset(dataset_id)
+    plan = compile_query(query)
+    return {"status": "success", **await run_query(dataset.explain, plan, query.engine)}
+
+
+@app.post("/datasets/{dataset_id}/filter-data/batch")
+async def filter_dataset_batch(dataset_id: str, request: BatchQuery):
+    """
+    Runs several filter queries over a stored dataset, see `/filter-data/batch`.
+    """
+    dataset = get_dataset(dataset_id)
+    plans = [compile_query(query) for query in request.queries]
+    body = await run_query(render_filtered, lambda: batch_content(
+        request.queries, plans, dataset.select_batch(plans, engine=request.engine)
+    ))
+    return Response(body, media_type="application/json")
+
+
+@app.get("/metrics")
+def metrics():
+    """Reports request latencies, stage timings and filter engine counters in the Prometheus text format."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Reports result cache usage."""
+    return {"status": "success", **results.stats()}
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        app,
-        host="0.0.0.0",  # Accepts connections from any network interface
-        port=8000,
-        ssl_keyfile="../key.pem",       # Path to your private key file
-        ssl_certfile="../cert.pem",     # Path to your certificate file
-    )
\ No newline at end of file
+    from app import server
+    server.main([
+        "--port", "8000",
+        "--ssl-keyfile", "../key.pem",      # Path to your private key file
+        "--ssl-certfile", "../cert.pem",    # Path to your certificate file
+    ])
@@ -0,0 +1,502 @@
+"""
+Memory-mapped on-disk datasets.
+
+Very large ADAGE files are converted once, with `python -m app.mapped convert
+<file>`, into a directory of dictionary-encoded numpy columns plus the events
+themselves as newline-delimited JSON. Queries memory-map those files, so a
+dataset opens in constant time, only the pages a query touches are read, and
+every worker process on the host shares them through the page cache.
+
+Layout of `<directory>/<dataset_id>/`:
+
+- `manifest.json`: the event count, the other top-level members of the
+  document and the attribute columns.
+- `event_type.npy` / `event_type.json`: `event_type` codes and their values.
+- `timestamps.npy` / `timestamp_state.npy`: epoch microseconds, and whether
+  each timestamp was valid, missing or invalid.
+- `attribute-<n>.npy` / `attribute-<n>.json`: one encoded column per attribute.
+- `events.ndjson` / `offsets.npy`: each event as it was given, and the byte
+  offset at which it starts.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from typing import List, Dict, Any, AsyncIterable, Iterable, Iterator, Optional, Sequence, Tuple, overload
+
+import numpy as np
+
+from app import fastjson, settings
+from app.columnar import MISSING, ColumnarUnsupported, EventColumns
+from app.datasets import DatasetTooLarge
+from app.executor import check_cancelled
+from app.pagination import project_page
+from app.planner import QueryPlan
+from app.streaming import EventStreamParser
+from app.timestamps import INVALID_TIMESTAMP, MISSING_TIMESTAMP, TimestampParser, read_timestamp
+
+FORMAT_VERSION = 1
+
+# Bytes of the source file read at a time during conversion
+CONVERT_CHUNK_BYTES = 1 << 20
+
+_DATASET_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class _ColumnBuilder:
+    """Dictionary-encodes one column while events stream past."""
+
+    def __init__(self, size: int = 0):
+        self.codes = array("i", bytes(4 * size))  # Earlier events lack the column
+        self.index: Dict[Any, int] = {}
+        self.values: List[Any] = []
+
+    def append(self, value: Any) -> None:
+        if value is MISSING:
+            self.codes.append(0)
+            return
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values) + 1  # Code 0 is MISSING
+            self.values.append(value)
+        self.codes.append(code)
+
+    def save(self, directory: str, name: str) -> None:
+        np.save(os.path.join(directory, f"{name}.npy"), np.frombuffer(self.codes, dtype=np.int32))
+        with open(os.path.join(directory, f"{name}.json"), "w", encoding="utf-8") as file:
+            json.dump(self.values, file, ensure_ascii=False)
+
+
+def _write_dataset(events: Iterable[Any], directory: str) -> Tuple[int, Dict[str, Optional[str]]]:
+    """
+    Writes the columns and rows of `events` into `directory`.
+
+    Returns the event count and the file name of each attribute column (`None`
+    for attributes holding unhashable values).
+    """
+    parse = TimestampParser().parse
+    event_types = _ColumnBuilder()
+    timestamps = array("q")
+    states = array("b")
+    offsets = array("q", [0])
+    attributes: Dict[str, Optional[_ColumnBuilder]] = {}  # None once a column holds unhashable values
+    size = 0
+
+    with open(os.path.join(directory, "events.ndjson"), "wb") as rows:
+        for event in events:
+            try:
+                event_type = event.get("event_type")
+                state, event_time = read_timestamp(event, parse)
+                event_attributes = event.get("attribute", {})
+                names = event_attributes.keys()
+            except (AttributeError, TypeError):
+                raise ColumnarUnsupported(f"Event {size} is not shaped like an ADAGE event")
+
+            try:
+                event_types.append(event_type)
+            except TypeError:
+                event_types.append(MISSING)  # Unhashable event types can never match
+            timestamps.append(event_time)
+            states.append(state)
+
+            for name in names - attributes.keys():
+                attributes[name] = _ColumnBuilder(size)
+            for name, column in attributes.items():
+                if column is None:
+                    continue
+                try:
+                    column.append(event_attributes.get(name, MISSING))
+                except TypeError:
+                    attributes[name] = None  # Filters on it are checked row by row
+
+            row = json.dumps(event, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+            rows.write(row)
+            offsets.append(offsets[-1] + len(row))
+            size += 1
+
+    event_types.save(directory, "event_type")
+    np.save(os.path.join(directory, "timestamps.npy"), np.frombuffer(timestamps, dtype=np.int64))
+    np.save(os.path.join(directory, "timestamp_state.npy"), np.frombuffer(states, dtype=np.int8))
+    np.save(os.path.join(directory, "offsets.npy"), np.frombuffer(offsets, dtype=np.int64))
+    columns: Dict[str, Optional[str]] = {}
+    for number, (name, column) in enumerate(sorted(attributes.items(), key=lambda item: item[0])):
+        columns[name] = None
+        if column is not None:
+            columns[name] = stem = f"attribute-{number}"
+            column.save(directory, stem)
+    return size, columns
+
+
+def convert(source: str, directory: Optional[str] = None) -> "MappedDataset":
+    """
+    Converts an ADAGE JSON file into a mapped dataset.
+
+    The file is read in chunks and parsed incrementally, so it never has to fit
+    in memory. The dataset ID is the SHA-256 of the file, as for uploads;
+    converting the same file twice returns the existing dataset.
+
+    Parameters:
+    - `source` (str): Path of the ADAGE JSON document.
+    - `directory` (str, optional): Dataset directory; defaults to `settings.DATASET_DIR`.
+
+    Returns:
+    - `MappedDataset`: The converted dataset.
+    """
+    directory = directory or settings.DATASET_DIR
+    os.makedirs(directory, exist_ok=True)
+    parser = EventStreamParser()
+    digest = hashlib.sha256()
+
+    def events() -> Iterable[Any]:
+        with open(source, "rb") as file:
+            for chunk in iter(lambda: file.read(CONVERT_CHUNK_BYTES), b""):
+                digest.update(chunk)
+                yield from parser.feed(chunk)
+        yield from parser.close()
+
+    staging = tempfile.mkdtemp(prefix=".convert-", dir=directory)
+    try:
+        event_count, columns = _write_dataset(events(), staging)
+        if parser.is_empty:
+            raise ValueError("No JSON data provided")
+        if not parser.has_events:
+            raise ValueError("Invalid JSON format: Missing 'events' key")
+        with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "event_count": event_count,
+                "metadata": parser.metadata,
+                "attributes": columns,
+            }, file, ensure_ascii=False)
+
+        target = os.path.join(directory, digest.hexdigest())
+        if os.path.isdir(target):
+            shutil.rmtree(staging)
+        else:
+            try:
+                os.replace(staging, target)
+            except OSError:
+                if not os.path.isdir(target):
+                    raise
+                shutil.rmtree(staging)  # Another process converted the same document meanwhile
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return MappedDataset(target)
+
+
+def _load_values(path: str) -> List[Any]:
+    with open(path, "r", encoding="utf-8") as file:
+        return [MISSING] + json.load(file)
+
+
+def _decode_row(row: bytes) -> Dict[str, Any]:
+    try:
+        return fastjson.loads(row)
+    except fastjson.JSONDecodeError:
+        return json.loads(row)  # NaN, Infinity and huge integers are only read by json
+
+
+class _MappedEvents(Sequence[Dict[str, Any]]):
+    """Read-only sequence of the events of a mapped dataset, decoded on access."""
+
+    def __init__(self, directory: str):
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "events.ndjson"), "rb") as file:
+            self.rows = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @overload
+    def __getitem__(self, position: int) -> Dict[str, Any]:
+        ...
+
+    @overload
+    def __getitem__(self, position: slice) -> List[Dict[str, Any]]:
+        ...
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[index] for index in range(*position.indices(len(self)))]
+        return _decode_row(self.rows[self.offsets[position]:self.offsets[position + 1]])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(len(self)):
+            yield self[position]
+
+
+class MappedColumns(EventColumns):
+    """
+    `EventColumns` over the memory-mapped files of a converted dataset.
+
+    Columns are opened on first use; `has_column` tells which attribute
+    filters can be evaluated column-wise.
+    """
+
+    def __init__(self, directory: str, manifest: Dict[str, Any]):
+        self.directory = directory
+        self.events = _MappedEvents(directory)
+        self.size = manifest["event_count"]
+        self.event_types = self._load("event_type.npy")
+        self.event_type_values = _load_values(os.path.join(directory, "event_type.json"))
+        self.timestamps = self._load("timestamps.npy")
+        state = self._load("timestamp_state.npy")
+        self.missing_timestamps = state == MISSING_TIMESTAMP
+        self.invalid_timestamps = state == INVALID_TIMESTAMP
+        self._columns: Dict[str, Optional[str]] = manifest["attributes"]
+        self._attributes: Dict[str, Tuple[np.ndarray, List[Any]]] = {}
+        self._statistics = None
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.directory, name), mmap_mode="r")
+
+    def has_column(self, name: str) -> bool:
+        return self._columns.get(name, "") is not None
+
+    def attribute(self, name: str) -> Tuple[np.ndarray, List[Any]]:
+        if name not in self._attributes:
+            column = self._columns.get(name, "")
+            if column is None:
+                raise ColumnarUnsupported(f"Attribute '{name}' holds unhashable values")
+            if not column:  # No event has the attribute
+                self._attributes[name] = (np.zeros(self.size, dtype=np.int32), [MISSING])
+            else:
+                self._attributes[name] = (
+                    self._load(f"{column}.npy"),
+                    _load_values(os.path.join(self.directory, f"{column}.json")),
+                )
+        return self._attributes[name]
+
+
+class MappedDataset:
+    """
+    A converted dataset, queried straight from its memory-mapped files.
+
+    Offers the query interface of `StoredDataset`. Every engine runs the same
+    mapped column scan; only matched events are decoded from disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dataset_id = os.path.basename(os.path.normpath(path))
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported mapped dataset version: {self.manifest.get('version')}")
+        self.columns = MappedColumns(path, self.manifest)
+
+    @property
+    def events(self) -> Sequence[Dict[str, Any]]:
+        return self.columns.events
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+    @property
+    def cache_key(self) -> str:
+        """Identifies the contents of the dataset in the result cache; mapped datasets never change."""
+        return self.dataset_id
+
+    def _plan(self, plan) -> Tuple[QueryPlan, Tuple[Any, ...], List[str]]:
+        columns = self.columns
+        query = QueryPlan(plan, columns.statistics)
+        filters = tuple(filter_ for filter_ in plan.filters if columns.has_column(filter_.attribute))
+        answered = ["event_type", "timestamp"] + [
+            f"filters[{position}]"
+            for position, filter_ in enumerate(plan.filters)
+            if columns.has_column(filter_.attribute)
+        ]
+        return query, filters, answered
+
+    def select(self, plan, engine: str = "auto") -> List[Dict[str, Any]]:
+        """
+        Returns the events matched by a `FilterPlan`, unprojected.
+
+        An `app.planner.QueryPlan` over the column statistics rules out queries
+        no event can match and leaves out masks every event passes.
+        """
+        columns = self.columns
+        query, filters, answered = self._plan(plan)
+        if query.empty:
+            plan.record_scan(0, 0)
+            return []
+        positions = np.flatnonzero(columns.mask(plan, filters, query.skipped_names)).tolist()
+        check_cancelled()
+        events = self.events
+        selected = [events[position] for position in positions]
+        matches = query.matcher(answered)  # Filters on attributes without a column
+        if matches is not None:
+            selected = [event for event in selected if matches(event)]
+        plan.record_scan(columns.size, len(selected))
+        return selected
+
+    def select_batch(self, plans: List[Any], engine: str = "auto") -> List[List[Dict[str, Any]]]:
+        """
+        Returns the events matched by each of several `FilterPlan`s, unprojected.
+
+        The mapped columns are shared by every plan, and each plan is still
+        planned on its own so the column statistics can rule it out.
+        """
+        return [self.select(plan, engine) for plan in plans]
+
+    def explain(self, plan, engine: str = "auto") -> Dict[str, Any]:
+        """Describes how `select` runs a `FilterPlan`, see `app.planner.QueryPlan.explain`."""
+        query, _, answered = self._plan(plan)
+        return {"engine": "columns", "segments": [query.explain(answered, answered_by="columns")]}
+
+    def apply(self, plan, engine: str = "auto") -> List[Dict[str, Any]]:
+        """Runs a `FilterPlan` against the dataset and projects the matches."""
+        project = plan.project
+        return [project(event) for event in self.select(plan, engine)]
+
+    def page(
+        self,
+        plan,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        engine: str = "auto",
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Like `apply`, but returns only one page of the matches, see `FilterPlan.page`."""
+        return project_page(plan, self.select(plan, engine), offset, limit, sort_by, descending)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "dataset_id": self.dataset_id,
+            "event_count": self.columns.size,
+            "size_bytes": self.size_bytes,
+            "storage": "mapped",
+        }
+
+
+class MappedStore:
+    """
+    The mapped datasets under a directory, opened on first use.
+
+    With `max_bytes`, datasets added through `add` are evicted least recently
+    used first once the files of all datasets under the directory would
+    exceed it. The modification time of a manifest records the last use of
+    its dataset, so every process sharing the directory evicts in the same
+    order.
+
+    Parameters:
+    - `directory` (str): Directory holding one sub-directory per dataset.
+    - `max_bytes` (int, optional): Budget for the files of the datasets; unlimited if `None`.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._datasets: Dict[str, MappedDataset] = {}
+
+    def get(self, dataset_id: str) -> Optional[MappedDataset]:
+        if not _DATASET_ID.match(dataset_id):
+            return None
+        path = os.path.join(self.directory, dataset_id)
+        try:
+            os.utime(os.path.join(path, "manifest.json"))  # Marks it as recently used
+        except OSError:
+            self._datasets.pop(dataset_id, None)  # Deleted, possibly by another process
+            return None
+        dataset = self._datasets.get(dataset_id)
+        if dataset is None:
+            dataset = self._datasets[dataset_id] = MappedDataset(path)
+        return dataset
+
+    def add(self, source: str) -> MappedDataset:
+        """
+        Converts an ADAGE document (see `spool`) into a dataset of the store,
+        evicting others past the budget. Raises `DatasetTooLarge` for
+        documents larger than the whole budget.
+        """
+        size = os.path.getsize(source)
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise DatasetTooLarge(
+                f"Dataset of {size} bytes exceeds the dataset store limit of {self.max_bytes} bytes"
+            )
+        dataset = convert(source, self.directory)
+        self.evict(keep=dataset.dataset_id)
+        return dataset
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Deletes the least recently used datasets until the rest fit in the budget, never `keep`."""
+        if self.max_bytes is None:
+            return
+        stored = []
+        for entry in os.scandir(self.directory):
+            if not _DATASET_ID.match(entry.name):
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, "manifest.json")).st_mtime
+                size = sum(file.stat().st_size for file in os.scandir(entry.path) if file.is_file())
+            except OSError:
+                continue  # Deleted meanwhile
+            stored.append((used, size, entry.name))
+        total = sum(size for _, size, _ in stored)
+        for _, size, dataset_id in sorted(stored):
+            if total <= self.max_bytes:
+                break
+            if dataset_id != keep and self.delete(dataset_id):
+                total -= size
+
+    async def spool(self, chunks: AsyncIterable[bytes]) -> str:
+        """
+        Writes an uploaded ADAGE document to a temporary file under the
+        directory, returning its path for `convert`. The caller removes it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, path = tempfile.mkstemp(prefix=".upload-", suffix=".json", dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                async for chunk in chunks:
+                    file.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def delete(self, dataset_id: str) -> bool:
+        """Removes a dataset; processes that have it open keep reading their mapping until they let go of it."""
+        path = os.path.join(self.directory, dataset_id)
+        if not _DATASET_ID.match(dataset_id) or not os.path.isfile(os.path.join(path, "manifest.json")):
+            self._datasets.pop(dataset_id, None)
+            return False
+        staging = tempfile.mkdtemp(prefix=".delete-", dir=self.directory)
+        try:
+            os.replace(path, os.path.join(staging, dataset_id))  # Disappears for every process at once
+        except FileNotFoundError:
+            return False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            self._datasets.pop(dataset_id, None)
+        return True
+
+
+mapped_datasets = MappedStore(settings.DATASET_DIR, settings.DATASET_CACHE_BYTES)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.mapped", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_command = commands.add_parser("convert", help="Convert an ADAGE JSON file into a mapped dataset")
+    convert_command.add_argument("source", help="Path of the ADAGE JSON document")
+    convert_command.add_argument("--dir", default=settings.DATASET_DIR, help="Dataset directory")
+    args = parser.parse_args(argv)
+
+    try:
+        dataset = convert(args.source, args.dir)
+    except (OSError, ValueError, ColumnarUnsupported) as e:
+        parser.error(str(e))
+    print(json.dumps(dataset.describe()))
+
+
+if __name__ == "__main__":
+    main()
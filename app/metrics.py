@@ -0,0 +1,279 @@
+"""
+Performance instrumentation.
+
+`MetricsMiddleware` times every request and counts the bytes it reads and
+writes. Inside a request, `stage` times a phase of the work and `record_scan`
+counts the events a filter engine examined, matched and rejected for an
+unparseable timestamp. Per-request stage timings go back to the client in a
+`Server-Timing` header. Service-wide counters and latency histograms are
+rendered in the Prometheus text format by `registry.render()`, which
+`/metrics` serves.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+# Histogram bucket bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """A monotonically increasing count, per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {value:g}" for labels, value in values]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts, total = self._values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._values.items())
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value read from a callback each time the metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.read():g}"]
+
+
+class Registry:
+    """The metrics of the service, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help, label_names))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help, read))
+
+    def _register(self, metric: Any) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "preprocessing_request_duration_seconds",
+    "Time from receiving a request to sending the start of its response.",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = registry.histogram(
+    "preprocessing_stage_duration_seconds",
+    "Time spent in each stage of request handling.",
+    ("stage",),
+)
+REQUEST_BYTES = registry.counter(
+    "preprocessing_request_bytes_total", "Request body bytes received, as sent on the wire.", ("route",)
+)
+RESPONSE_BYTES = registry.counter(
+    "preprocessing_response_bytes_total", "Response body bytes sent, as sent on the wire.", ("route",)
+)
+EVENTS_SCANNED = registry.counter("preprocessing_events_scanned_total", "Events examined by the filter engines.")
+EVENTS_MATCHED = registry.counter("preprocessing_events_matched_total", "Events matched by the filter engines.")
+TIMESTAMP_FAILURES = registry.counter(
+    "preprocessing_timestamp_parse_failures_total",
+    "Events rejected by the filter engines because their timestamp could not be parsed.",
+)
+
+
+class RequestTimings:
+    """
+    The stage timings of one request, reported in its `Server-Timing` header.
+
+    `read` is the time taken to receive the request body. `decode` is
+    recorded implicitly when the first stage starts: the time from the body
+    arriving to the endpoint starting its own work, which on the standard
+    endpoints is FastAPI decoding and validating the body.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.body_received: Optional[float] = None
+        self.handler_started = False
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage)
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(entries)
+
+
+_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Times a stage of the current request (or just records it, outside of one)."""
+    timings = _timings.get()
+    started = time.perf_counter()
+    if timings is not None and not timings.handler_started:
+        timings.handler_started = True
+        if timings.body_received is not None:
+            timings.add("decode", started - timings.body_received)
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        if timings is not None:
+            timings.add(name, seconds)
+        else:
+            STAGE_SECONDS.observe(seconds, name)
+
+
+def record_scan(scanned: int, matched: int, timestamp_failures: int = 0) -> None:
+    """Counts the work of one filter engine run."""
+    EVENTS_SCANNED.inc(scanned)
+    EVENTS_MATCHED.inc(matched)
+    if timestamp_failures:
+        TIMESTAMP_FAILURES.inc(timestamp_failures)
+
+
+def _route(app: Any, scope: Dict[str, Any]) -> str:
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"  # Keeps raw paths, such as dataset IDs, out of the labels
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times requests and counts their body bytes.
+
+    Requests are labelled with the path template of the route they match.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        route = _route(scope.get("app"), scope)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                REQUEST_BYTES.inc(len(message.get("body", b"")), route)
+                if not message.get("more_body", False) and timings.body_received is None:
+                    timings.body_received = time.perf_counter()
+                    timings.add("read", timings.body_received - timings.started)
+            return message
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - timings.started
+                REQUEST_SECONDS.observe(total, scope["method"], route, str(message["status"]))
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.server_timing(total))
+            elif message["type"] == "http.response.body":
+                RESPONSE_BYTES.inc(len(message.get("body", b"")), route)
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            _timings.reset(token)
@@ -0,0 +1,106 @@
+from typing import Any, Callable, Dict, List
+
+# Operators and the number of values each one takes (None for any number)
+OPERATORS = {
+    "in": None,
+    "not_in": None,
+    "gt": 1,
+    "gte": 1,
+    "lt": 1,
+    "lte": 1,
+    "between": 2,
+    "prefix": None,
+    "exists": 0,
+    "null": 0,
+}
+
+
+class AttributeFilter:
+    """
+    A compiled attribute filter.
+
+    `test` is called with the value of the attribute on events that have it;
+    `matches_missing` tells whether events without the attribute pass. Range
+    operators never match values that cannot be compared with their bounds.
+
+    Parameters:
+    - `attribute` (str): The attribute to filter on.
+    - `operator` (str): One of `OPERATORS`.
+    - `values` (List[Any]): The operand values; ranges take `[bound]` or `[low, high]`.
+    """
+
+    def __init__(self, attribute: str, operator: str, values: List[Any]):
+        if operator not in OPERATORS:
+            raise ValueError(f"Invalid filter operator: {operator}")
+        arity = OPERATORS[operator]
+        if arity is not None and arity > 0 and len(values) != arity:
+            raise ValueError(f"Filter operator '{operator}' takes {arity} value(s)")
+
+        self.attribute = attribute
+        self.operator = operator
+        self.matches_missing = operator in ("not_in", "null")
+        if operator in ("in", "not_in"):
+            self.operand: Any = frozenset(values)
+        elif operator == "prefix":
+            self.operand = tuple(value for value in values if isinstance(value, str))
+        else:
+            self.operand = tuple(values)
+        self.test: Callable[[Any], bool] = (
+            self.operand.__contains__ if operator == "in" else getattr(self, f"_{operator}")
+        )
+
+    def check(self, attributes: Dict[str, Any]) -> bool:
+        """Checks the `attribute` dict of an event."""
+        if self.attribute in attributes:
+            return self.test(attributes[self.attribute])
+        return self.matches_missing
+
+    def _not_in(self, value: Any) -> bool:
+        return value not in self.operand
+
+    def _gt(self, value: Any) -> bool:
+        try:
+            return value is not None and value > self.operand[0]
+        except TypeError:
+            return False
+
+    def _gte(self, value: Any) -> bool:
+        try:
+            return value is not None and value >= self.operand[0]
+        except TypeError:
+            return False
+
+    def _lt(self, value: Any) -> bool:
+        try:
+            return value is not None and value < self.operand[0]
+        except TypeError:
+            return False
+
+    def _lte(self, value: Any) -> bool:
+        try:
+            return value is not None and value <= self.operand[0]
+        except TypeError:
+            return False
+
+    def _between(self, value: Any) -> bool:
+        try:
+            return value is not None and self.operand[0] <= value <= self.operand[1]
+        except TypeError:
+            return False
+
+    def _prefix(self, value: Any) -> bool:
+        return isinstance(value, str) and value.startswith(self.operand)
+
+    def _exists(self, value: Any) -> bool:
+        return value is not None
+
+    def _null(self, value: Any) -> bool:
+        return value is None
+
+
+def compile_filter(filter_: Any) -> AttributeFilter:
+    """Compiles a filter object with `attribute`, `values` and an optional `operator`."""
+    operator = getattr(filter_, "operator", "in")
+    if not isinstance(operator, str):
+        operator = "in"  # Objects without a real operator are membership filters
+    return AttributeFilter(filter_.attribute, operator, list(getattr(filter_, "values", None) or []))
@@ -0,0 +1,139 @@
+import base64
+import heapq
+import json
+import math
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+
+from app.timestamps import VALID_TIMESTAMP, read_timestamp
+
+# `sort_by` value that orders events by `time_object.timestamp`
+SORT_TIMESTAMP = "timestamp"
+
+# Sort ranks: numbers before strings, anything else (missing, null, invalid) last
+_NUMBER, _STRING, _UNSORTABLE = 0, 1, 2
+
+
+class _Descending:
+    """Wraps a sort value so that it orders in reverse."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, _Descending):
+            return NotImplemented
+        return self.value == other.value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.value < self.value
+
+
+def _rank(value: Any) -> Tuple[int, Any]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and not (
+        isinstance(value, float) and math.isnan(value)
+    ):
+        return _NUMBER, value
+    if isinstance(value, str):
+        return _STRING, value
+    return _UNSORTABLE, None
+
+
+def sort_key(plan, sort_by: Optional[str], descending: bool = False) -> Optional[Callable[[Dict[str, Any]], Tuple]]:
+    """
+    Builds the sort key of an event for `sort_by`.
+
+    `"timestamp"` orders by `time_object.timestamp` (parsed with the plan's
+    memoizing parser), any other value by that attribute. Values that cannot be
+    ordered against the rest, including missing ones, sort last either way.
+    Returns `None` when `sort_by` is not set.
+    """
+    if sort_by is None:
+        return None
+    if sort_by == SORT_TIMESTAMP:
+        parse = plan.timestamps.parse
+
+        def value(event: Dict[str, Any]) -> Any:
+            state, event_time = read_timestamp(event, parse)
+            return event_time if state == VALID_TIMESTAMP else None
+    else:
+        def value(event: Dict[str, Any]) -> Any:
+            return event.get("attribute", {}).get(sort_by)
+
+    if descending:
+        def key(event: Dict[str, Any]) -> Tuple:
+            rank, sort_value = _rank(value(event))
+            return rank, _Descending(sort_value)
+    else:
+        def key(event: Dict[str, Any]) -> Tuple:
+            return _rank(value(event))
+    return key
+
+
+def paginate(
+    events: Iterable[Dict[str, Any]],
+    offset: int = 0,
+    limit: Optional[int] = None,
+    key: Optional[Callable[[Dict[str, Any]], Tuple]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Cuts one page out of a sequence of matched events.
+
+    Without a `key` the events keep their dataset order and, when `events` is
+    a lazy iterator, it is only consumed up to the end of the page. With a
+    `key`, a bounded heap keeps just the best `offset + limit` events, ties
+    keeping dataset order.
+
+    Returns:
+    - `Tuple[List[Dict[str, Any]], bool]`: The page and whether more events follow it.
+    """
+    stop = None if limit is None else offset + limit + 1  # One extra to detect a next page
+    if key is None:
+        if offset == 0 and limit is None and isinstance(events, list):
+            return events, False
+        page = list(islice(events, offset, stop))
+    else:
+        ranked = ((key(event), position, event) for position, event in enumerate(events))
+        if stop is None:
+            page = [event for _, _, event in sorted(ranked, key=lambda item: item[:2])][offset:]
+        else:
+            page = [event for _, _, event in heapq.nsmallest(stop, ranked, key=lambda item: item[:2])][offset:]
+    more = limit is not None and len(page) > limit
+    return page[:limit] if more else page, more
+
+
+def project_page(
+    plan,
+    events: Iterable[Dict[str, Any]],
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Cuts one page out of the events matched by a `FilterPlan` and projects it, see `paginate`."""
+    page, more = paginate(events, offset, limit, sort_key(plan, sort_by, descending))
+    project = plan.project
+    return [project(event) for event in page], more
+
+
+def encode_cursor(offset: int, sort_by: Optional[str], descending: bool) -> str:
+    """Opaque cursor for the page starting at `offset` of a query's ordering."""
+    payload = json.dumps({"offset": offset, "sort_by": sort_by, "descending": descending})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort_by: Optional[str], descending: bool) -> int:
+    """Returns the offset of a cursor, checking it was issued for the same ordering."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        offset = payload["offset"]
+        issued_for = (payload["sort_by"], payload["descending"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise ValueError("Invalid cursor")
+    if issued_for != (sort_by, descending):
+        raise ValueError("Cursor was issued for a different sort order")
+    return offset
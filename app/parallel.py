@@ -0,0 +1,134 @@
+import json
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Tuple
+
+from app import fastjson, settings
+from app.executor import check_cancelled
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class ParallelUnsupported(Exception):
+    """Raised when events cannot be serialized for the worker processes."""
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Returns the shared worker pool, starting it on first use."""
+    global _executor
+    executor = _executor
+    if executor is None:
+        with _executor_lock:
+            executor = _executor
+            if executor is None:
+                executor = _executor = ProcessPoolExecutor(
+                    max_workers=settings.PARALLEL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return executor
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+
+
+def _decode(payload: bytes) -> List[Any]:
+    try:
+        return fastjson.loads(payload)
+    except fastjson.JSONDecodeError:
+        return json.loads(payload)  # NaN and infinities written by the standard library
+
+
+def _reads_null(event: Any, attributes: List[str]) -> bool:
+    """
+    Whether a plan reads a null member of an event: its event type, its
+    timestamp or a filtered attribute. The event in the parent process may
+    hold NaN or an infinity there, which `orjson` writes as `null`.
+    """
+    if not isinstance(event, dict):
+        return False
+    if "event_type" in event and event["event_type"] is None:
+        return True
+    time_object = event.get("time_object")
+    if isinstance(time_object, dict) and "timestamp" in time_object and time_object["timestamp"] is None:
+        return True
+    attribute = event.get("attribute")
+    return isinstance(attribute, dict) and any(name in attribute and attribute[name] is None for name in attributes)
+
+
+def _match_chunk(plan, payload: bytes) -> Tuple[bytes, bytes, int]:
+    """
+    Runs in a worker: returns the positions of the matching events in a chunk,
+    those of the events to check in the parent process (see `_reads_null`)
+    and the timestamp failures the worker's copy of the plan counted.
+    """
+    matches = plan.matches
+    attributes = [filter_.attribute for filter_ in plan.filters]
+    failures = plan.timestamp_failures
+    positions, rechecks = array("q"), array("q")
+    for position, event in enumerate(_decode(payload)):
+        if _reads_null(event, attributes):
+            rechecks.append(position)
+        elif matches(event):
+            positions.append(position)
+    return positions.tobytes(), rechecks.tobytes(), plan.timestamp_failures - failures
+
+
+def select_parallel(plan, events: List[Dict[str, Any]], chunk_events: Optional[int] = None) -> List[int]:
+    """
+    Returns the positions of the events matched by a `FilterPlan`, in order.
+
+    The events are split into chunks that are sent to the worker pool as
+    pre-serialized JSON, which is much cheaper to move between processes than
+    pickled dicts; workers send back only the matching positions. Events
+    the plan reads a null from are checked here instead, as the null may
+    stand for NaN or an infinity. The timestamp failures counted by the
+    workers are added to `plan.timestamp_failures`. Raises
+    `ParallelUnsupported` for events JSON cannot carry.
+    """
+    chunk_events = chunk_events or settings.PARALLEL_CHUNK_EVENTS
+    starts = range(0, len(events), chunk_events)
+    executor = get_executor()
+    futures: List[Future] = []
+    for start in starts:
+        chunk = events[start:start + chunk_events]
+        try:
+            payload = fastjson.dumps(chunk)
+        except (TypeError, ValueError) as e:
+            for future in futures:
+                future.cancel()
+            raise ParallelUnsupported(str(e))
+        futures.append(executor.submit(_match_chunk, plan, payload))
+    matches = plan.matches
+    selected: List[int] = []
+    try:
+        for start, future in zip(starts, futures):
+            check_cancelled()
+            matched, rechecked, timestamp_failures = future.result()
+            plan.timestamp_failures += timestamp_failures
+            positions = array("q")
+            positions.frombytes(matched)
+            if rechecked:
+                rechecks = array("q")
+                rechecks.frombytes(rechecked)
+                positions.extend(position for position in rechecks if matches(events[start + position]))
+                positions = array("q", sorted(positions))
+            selected.extend(start + position for position in positions)
+    except BrokenProcessPool:
+        shutdown()  # Start a fresh pool for the next query
+        raise
+    return selected
+
+
+def apply_parallel(plan, events: List[Dict[str, Any]], chunk_events: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Filters the events in the worker pool and projects the matches."""
+    project = plan.project
+    return [project(events[position]) for position in select_parallel(plan, events, chunk_events)]
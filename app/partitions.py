@@ -0,0 +1,250 @@
+"""
+Time partitions of stored datasets.
+
+`partition_events` splits events into buckets of `settings.PARTITION_MONTHS`
+months of their timestamps. Each `TimePartition` records the earliest and
+latest timestamp it holds, so a query with a time window skips the
+partitions outside of it without touching their events. Events without a
+timestamp share a partition every query scans, since they pass any window;
+events with an invalid timestamp share one no query scans, since they never
+match.
+
+A partition builds its own `DatasetIndex` the first time a query reaches
+it, from the timestamps parsed when the events were partitioned.
+`partition_indexes` keeps the partitions with a built index within
+`settings.PARTITION_INDEX_EVENTS` events and drops the indexes of the least
+recently queried ones past it; they are rebuilt when queried again.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app import settings
+from app.indexes import DatasetIndex
+from app.timestamps import INVALID_TIMESTAMP, MISSING_TIMESTAMP, VALID_TIMESTAMP, read_timestamps
+
+# Partition kinds
+TIMED = "timed"
+UNTIMED = "untimed"
+INVALID = "invalid"
+UNPARTITIONED = "all"  # Every event, when events cannot be partitioned
+
+
+def month_label(month: int) -> str:
+    """`YYYY-MM` for a month counted from January 1970."""
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+class TimePartition:
+    """
+    The events of one time bucket of a stored dataset.
+
+    Parameters:
+    - `label` (str): The first month of the bucket, or the partition kind for the others.
+    - `kind` (str): `TIMED`, `UNTIMED`, `INVALID` or `UNPARTITIONED`.
+    - `offsets` (np.ndarray): The sorted offsets of the events in the whole list they came from.
+    - `events` (List[Any]): The events at those offsets.
+    - `epochs` (np.ndarray, optional): The timestamps of `TIMED` events, as epoch microseconds.
+    """
+
+    def __init__(
+        self,
+        label: str,
+        kind: str,
+        offsets: np.ndarray,
+        events: List[Any],
+        epochs: Optional[np.ndarray] = None,
+    ):
+        self.label = label
+        self.kind = kind
+        self.offsets = offsets
+        self.events = events
+        self.epochs = epochs
+        self.removed = 0
+        self.timestamp_range: Optional[Tuple[int, int]] = (
+            (int(epochs.min()), int(epochs.max())) if epochs is not None and len(epochs) else None
+        )
+        self.event_types: Dict[Any, int] = {}
+        if kind == INVALID:  # Counted as timestamp failures by the queries that skip them
+            for event in events:
+                event_type = event.get("event_type")
+                if isinstance(event_type, str):
+                    self.event_types[event_type] = self.event_types.get(event_type, 0) + 1
+        self._index: Optional[DatasetIndex] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.events) - self.removed
+
+    def overlaps(self, plan) -> bool:
+        """Whether events of this partition may match a `FilterPlan`."""
+        if self.kind == INVALID:
+            return False
+        if self.kind != TIMED or self.timestamp_range is None:
+            return True
+        low, high = self.timestamp_range
+        if plan.start_epoch is not None and high < plan.start_epoch:
+            return False
+        if plan.end_epoch is not None and low > plan.end_epoch:
+            return False
+        return True
+
+    def prune(self, plan) -> None:
+        """Accounts for a partition a `FilterPlan` skips."""
+        failures = sum(count for event_type, count in self.event_types.items() if event_type in plan.event_types)
+        if failures:
+            plan.timestamp_failures += failures
+            plan.record_scan(0, 0)
+
+    @property
+    def index(self) -> DatasetIndex:
+        """The secondary indexes over the events, built on first use."""
+        index = self._index
+        if index is None:
+            with self._lock:
+                index = self._index
+                if index is None:
+                    index = self._index = DatasetIndex(self.events, epochs=self.epochs)
+            partition_indexes.built(self)
+        else:
+            partition_indexes.used(self)
+        return index
+
+    def drop_index(self) -> None:
+        self._index = None
+
+    def positions(self, plan) -> np.ndarray:
+        """The offsets of the events matched by a `FilterPlan`, in the list the events came from."""
+        return self.offsets[self.index.positions(plan, exact=not self.removed)]
+
+    def explain(self, plan) -> Dict[str, Any]:
+        description = self.describe()
+        description["pruned"] = not self.overlaps(plan)
+        if not description["pruned"]:
+            description["plan"] = self.index.explain(plan, exact=not self.removed)
+        return description
+
+    def replace(self, offset: int, tombstone: Any) -> bool:
+        """Puts `tombstone` in place of the event at `offset`, if this partition holds it."""
+        position = int(np.searchsorted(self.offsets, offset))
+        if position == len(self.offsets) or self.offsets[position] != offset:
+            return False
+        event_type = self.events[position].get("event_type")
+        if isinstance(event_type, str) and event_type in self.event_types:
+            self.event_types[event_type] -= 1
+        self.events[position] = tombstone
+        self.removed += 1
+        return True
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "partition": self.label,
+            "event_count": len(self),
+            "timestamp_min": None if self.timestamp_range is None else self.timestamp_range[0],
+            "timestamp_max": None if self.timestamp_range is None else self.timestamp_range[1],
+            "indexed": self._index is not None,
+        }
+
+
+def partition_events(events: List[Any], months: Optional[int] = None) -> List[TimePartition]:
+    """
+    Splits events into time partitions of `months` months (default
+    `settings.PARTITION_MONTHS`; 0 keeps them in a single partition).
+
+    Timestamps are read with `app.timestamps.read_timestamps`. Events that
+    are not uniformly shaped stay in a single partition, as do all events
+    when partitioning is disabled.
+    """
+    months = settings.PARTITION_MONTHS if months is None else months
+    everything = [TimePartition(UNPARTITIONED, UNPARTITIONED, np.arange(len(events), dtype=np.int64), events)]
+    if months <= 0 or not events:
+        return everything
+
+    try:
+        states, epochs = read_timestamps(events)
+    except (AttributeError, TypeError):
+        return everything
+
+    partitions = []
+    timed = np.flatnonzero(states == VALID_TIMESTAMP)
+    if len(timed):
+        buckets = epochs[timed].astype("datetime64[us]").astype("datetime64[M]").astype(np.int64) // months
+        order = np.argsort(buckets, kind="stable")  # Keeps the offsets of each bucket sorted
+        keys, starts = np.unique(buckets[order], return_index=True)
+        for key, offsets in zip(keys.tolist(), np.split(timed[order], starts[1:])):
+            partitions.append(TimePartition(
+                month_label(key * months), TIMED, offsets, [events[offset] for offset in offsets.tolist()], epochs[offsets]
+            ))
+    for kind, state in ((UNTIMED, MISSING_TIMESTAMP), (INVALID, INVALID_TIMESTAMP)):
+        offsets = np.flatnonzero(states == state)
+        if len(offsets):
+            partitions.append(TimePartition(kind, kind, offsets, [events[offset] for offset in offsets.tolist()]))
+    return partitions
+
+
+class PartitionIndexes:
+    """
+    The time partitions holding a built index, least recently queried first.
+
+    Partitions are held by weak reference, so those of deleted or rewritten
+    datasets leave on their own.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.events = 0
+        self._partitions: "OrderedDict[int, Tuple[weakref.ref, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._partitions)
+
+    def built(self, partition: TimePartition) -> None:
+        """Records a partition that built its index, dropping those of others past the budget."""
+        with self._lock:
+            key = id(partition)
+            previous = self._partitions.pop(key, None)
+            if previous is not None:
+                self.events -= previous[1]
+            self._partitions[key] = (weakref.ref(partition), len(partition.events))
+            self.events += len(partition.events)
+            if self.events > self.max_events:
+                self._evict(partition)
+
+    def used(self, partition: TimePartition) -> None:
+        with self._lock:
+            key = id(partition)
+            if key in self._partitions:
+                self._partitions.move_to_end(key)
+
+    def _evict(self, keep: TimePartition) -> None:
+        for key, (ref, size) in list(self._partitions.items()):
+            if ref() is None:
+                del self._partitions[key]
+                self.events -= size
+        for key in list(self._partitions):
+            if self.events <= self.max_events:
+                break
+            ref, size = self._partitions[key]
+            partition = ref()
+            if partition is keep:
+                continue
+            del self._partitions[key]
+            self.events -= size
+            if partition is not None:
+                partition.drop_index()
+
+    def clear(self) -> None:
+        with self._lock:
+            for ref, _ in self._partitions.values():
+                partition = ref()
+                if partition is not None:
+                    partition.drop_index()
+            self._partitions.clear()
+            self.events = 0
+
+
+partition_indexes = PartitionIndexes(settings.PARTITION_INDEX_EVENTS)
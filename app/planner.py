@@ -0,0 +1,300 @@
+"""
+Query planner for stored and mapped datasets.
+
+A `FilterPlan` checks an event in a fixed order: event type, timestamp, then
+the attribute filters as the request lists them. That order is a poor fit for
+queries where a cheap filter rejects most events while the timestamp parse,
+the most expensive check, runs on every event of a matching type.
+
+`DatasetStats` keeps lightweight statistics over a dataset (the event type
+histogram, the timestamp range with counts of missing and invalid timestamps,
+and distinct-value counts for the attributes queries refer to), read off the
+structures the engines build anyway. `QueryPlan` uses them to estimate the
+selectivity of every predicate of a `FilterPlan`, then:
+
+- drops predicates every event passes, such as the timestamp check when the
+  time window covers the whole timestamp range of a dataset without invalid
+  timestamps, so no timestamp is parsed at all;
+- answers the whole query as empty when no event can match;
+- orders the remaining row checks by rank, `cost / (1 - selectivity)`, which
+  puts cheap predicates that reject many events first.
+
+`QueryPlan.explain` describes these choices.
+"""
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple
+
+# Relative per-event cost of each check; a timestamp is a memoized parse
+PREDICATE_COSTS = {
+    "event_type": 1.0,
+    "timestamp": 4.0,
+    "in": 1.5,
+    "not_in": 1.5,
+    "exists": 1.5,
+    "null": 1.5,
+    "prefix": 2.0,
+}
+RANGE_COST = 2.5
+
+# Selectivity guesses for attributes without statistics, as in System R
+DEFAULT_SELECTIVITY = {"in": 0.1, "not_in": 0.9, "exists": 0.5, "null": 0.5, "prefix": 0.1}
+RANGE_SELECTIVITY = 1 / 3
+
+
+class DatasetStats:
+    """
+    Statistics over the events of a dataset.
+
+    Parameters:
+    - `event_count` (int): The number of events.
+    - `event_types` (Dict[Any, int], optional): Events per event type, `None` if unknown.
+    - `timestamp_range` (Tuple[int, int], optional): The earliest and latest valid timestamps,
+      as epoch microseconds.
+    - `timed` (int, optional): Events with a valid timestamp, `None` if unknown.
+    - `untimed` (int, optional): Events without a timestamp, `None` if unknown.
+    - `attributes` (Callable[[str], Optional[Tuple[int, int]]]): Returns the distinct values
+      of an attribute and the number of events that have it, or `None` if unknown.
+    """
+
+    def __init__(
+        self,
+        event_count: int,
+        event_types: Optional[Dict[Any, int]],
+        timestamp_range: Optional[Tuple[int, int]],
+        timed: Optional[int],
+        untimed: Optional[int],
+        attributes: Callable[[str], Optional[Tuple[int, int]]],
+    ):
+        self.event_count = event_count
+        self.event_types = event_types
+        self.timestamp_range = timestamp_range
+        self.timed = timed
+        self.untimed = untimed
+        self.invalid = None if timed is None or untimed is None else event_count - timed - untimed
+        self._attributes = attributes
+        self._attribute_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def attribute(self, name: str) -> Optional[Tuple[int, int]]:
+        """The distinct values of an attribute and the number of events that have it."""
+        if name not in self._attribute_stats:
+            self._attribute_stats[name] = self._attributes(name)
+        return self._attribute_stats[name]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "event_count": self.event_count,
+            "event_types": (
+                None if self.event_types is None
+                else {str(key): count for key, count in self.event_types.items() if isinstance(key, str)}
+            ),
+            "timestamp_min": None if self.timestamp_range is None else self.timestamp_range[0],
+            "timestamp_max": None if self.timestamp_range is None else self.timestamp_range[1],
+            "missing_timestamps": self.untimed,
+            "invalid_timestamps": self.invalid,
+            "attributes": {
+                name: {"distinct": stats[0], "present": stats[1]}
+                for name, stats in self._attribute_stats.items()
+                if stats is not None
+            },
+        }
+
+
+class Predicate:
+    """One check of a `FilterPlan`, with its estimated cost and selectivity."""
+
+    def __init__(self, name: str, test: Callable[[Dict[str, Any]], bool], cost: float, selectivity: float):
+        self.name = name
+        self.test = test
+        self.cost = cost
+        self.selectivity = min(max(selectivity, 0.0), 1.0)
+        self.filter = None
+        self.skip_reason: Optional[str] = None
+
+    @property
+    def rank(self) -> float:
+        """Lower ranks are checked first."""
+        if self.selectivity >= 1.0:
+            return float("inf")
+        return self.cost / (1.0 - self.selectivity)
+
+    def to_dict(self) -> Dict[str, Any]:
+        description: Dict[str, Any] = {"predicate": self.name}
+        if self.filter is not None:
+            description["attribute"] = self.filter.attribute
+            description["operator"] = self.filter.operator
+        description["cost"] = self.cost
+        description["selectivity"] = round(self.selectivity, 6)
+        description["rank"] = None if self.rank == float("inf") else round(self.rank, 6)
+        return description
+
+
+def _filter_test(filter_) -> Callable[[Dict[str, Any]], bool]:
+    check = filter_.check
+
+    def test(event: Dict[str, Any]) -> bool:
+        return check(event.get("attribute", {}))
+
+    return test
+
+
+def _event_type_selectivity(plan, stats: DatasetStats) -> Optional[float]:
+    if stats.event_types is None or not stats.event_count:
+        return None
+    matching = sum(count for event_type, count in stats.event_types.items() if event_type in plan.event_types)
+    return matching / stats.event_count
+
+
+def _timed_fraction(plan, stats: DatasetStats) -> Optional[float]:
+    """
+    The estimated fraction of the valid timestamps inside the time window,
+    spreading them evenly over their range. `None` if the window misses them all.
+    """
+    if stats.timestamp_range is None:
+        return None
+    low, high = stats.timestamp_range
+    start = low if plan.start_epoch is None else max(plan.start_epoch, low)
+    end = high if plan.end_epoch is None else min(plan.end_epoch, high)
+    if start > end:
+        return None
+    return (end - start) / (high - low) if high > low else 1.0
+
+
+def _filter_selectivity(filter_, stats: DatasetStats) -> float:
+    attribute = stats.attribute(filter_.attribute) if stats.event_count else None
+    operator = filter_.operator
+    if attribute is None:
+        return DEFAULT_SELECTIVITY.get(operator, RANGE_SELECTIVITY)
+    distinct, present = attribute
+    presence = present / stats.event_count
+    if operator == "in":
+        return presence * min(len(filter_.operand) / distinct, 1.0) if distinct else 0.0
+    if operator == "not_in":
+        excluded = min(len(filter_.operand) / distinct, 1.0) if distinct else 0.0
+        return (1 - presence) + presence * (1 - excluded)
+    if operator == "exists":
+        return presence
+    if operator == "null":
+        return 1 - presence
+    return presence * RANGE_SELECTIVITY
+
+
+class QueryPlan:
+    """
+    The plan chosen for running a `FilterPlan` over a dataset with `stats`.
+
+    `exact` tells whether the statistics still describe every event; when
+    events were replaced since they were gathered, the event type is always
+    checked and never used to rule a query out.
+
+    Parameters:
+    - `plan` (FilterPlan): The query.
+    - `stats` (DatasetStats): Statistics over the dataset.
+    - `exact` (bool, optional): Whether the statistics are current.
+    """
+
+    def __init__(self, plan, stats: DatasetStats, exact: bool = True):
+        self.plan = plan
+        self.stats = stats
+        self.predicates: List[Predicate] = []
+        self.skipped: List[Predicate] = []
+        self.empty = False
+
+        type_selectivity = _event_type_selectivity(plan, stats) if exact else None
+        event_type = Predicate(
+            "event_type",
+            plan.matches_type,
+            PREDICATE_COSTS["event_type"],
+            0.5 if type_selectivity is None else type_selectivity,
+        )
+        if type_selectivity is not None and type_selectivity >= 1.0:
+            event_type.skip_reason = "every event has one of the requested types"
+        self._add(event_type)
+
+        timed_fraction = _timed_fraction(plan, stats)
+        windowed = plan.start_epoch is not None or plan.end_epoch is not None
+        if stats.timed is None or stats.untimed is None or not stats.event_count:
+            timestamp_selectivity = RANGE_SELECTIVITY if windowed else 1.0
+        else:
+            timestamp_selectivity = (stats.timed * (timed_fraction or 0.0) + stats.untimed) / stats.event_count
+        timestamp = Predicate("timestamp", plan.matches_time, PREDICATE_COSTS["timestamp"], timestamp_selectivity)
+        if stats.invalid == 0 and (timed_fraction == 1.0 or not stats.timed):
+            timestamp.skip_reason = (
+                "the time window covers every timestamp and none is invalid"
+                if windowed
+                else "no time window and no invalid timestamp"
+            )
+        self._add(timestamp)
+
+        for position, filter_ in enumerate(plan.filters):
+            predicate = Predicate(
+                f"filters[{position}]",
+                _filter_test(filter_),
+                PREDICATE_COSTS.get(filter_.operator, RANGE_COST),
+                _filter_selectivity(filter_, stats),
+            )
+            predicate.filter = filter_
+            self._add(predicate)
+
+        self.predicates.sort(key=lambda predicate: predicate.rank)
+        if type_selectivity == 0.0 or (
+            stats.invalid is not None and timed_fraction is None and not stats.untimed and stats.event_count
+        ):
+            self.empty = True  # No event can match
+
+    def _add(self, predicate: Predicate) -> None:
+        (self.skipped if predicate.skip_reason else self.predicates).append(predicate)
+
+    @property
+    def skipped_names(self) -> List[str]:
+        return [predicate.name for predicate in self.skipped]
+
+    def matcher(self, answered: Collection[str] = ()) -> Optional[Callable[[Dict[str, Any]], bool]]:
+        """
+        Returns the row check for the predicates not `answered` by index lookups,
+        in rank order, or `None` if there is nothing left to check.
+        """
+        tests = tuple(predicate.test for predicate in self.predicates if predicate.name not in answered)
+        if not tests:
+            return None
+        if len(tests) == 1:
+            return tests[0]
+
+        def matches(event: Dict[str, Any]) -> bool:
+            for test in tests:
+                if not test(event):
+                    return False
+            return True
+
+        return matches
+
+    def explain(
+        self,
+        answered: Collection[str] = (),
+        candidates: Optional[int] = None,
+        answered_by: str = "index",
+    ) -> Dict[str, Any]:
+        """
+        Describes the plan: every predicate with its estimates and how it is
+        evaluated (`answered_by` a lookup, `"row"` checks in the order listed,
+        or `"skipped"`), with the number of `candidates` the lookups left.
+        """
+        estimate = float(self.stats.event_count)
+        for predicate in self.predicates:
+            estimate *= predicate.selectivity
+        predicates = []
+        for predicate in self.predicates:
+            description = predicate.to_dict()
+            description["evaluation"] = answered_by if predicate.name in answered else "row"
+            predicates.append(description)
+        for predicate in self.skipped:
+            description = predicate.to_dict()
+            description["evaluation"] = "skipped"
+            description["reason"] = predicate.skip_reason
+            predicates.append(description)
+        return {
+            "event_count": self.stats.event_count,
+            "short_circuit": self.empty,
+            "candidates": candidates,
+            "estimated_matches": 0 if self.empty else round(estimate),
+            "predicates": predicates,
+            "statistics": self.stats.to_dict(),
+        }
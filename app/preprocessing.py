@@ -1,5 +1,248 @@
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from app import settings
+from app.columnar import ColumnarUnsupported, EventColumns
+from app.executor import check_cancelled
+from app.metrics import record_scan
+from app.operators import compile_filter
+from app.pagination import project_page
+from app.parallel import ParallelUnsupported, select_parallel
+from app.records import ProjectedEvent, is_projected
+from app.timestamps import INVALID_TIMESTAMP, MISSING_TIMESTAMP, VALID_TIMESTAMP, TimestampParser, parse_bound, read_timestamp
+
+ENGINES = ("auto", "python", "columnar", "parallel")
+
+# Events scanned between checks for a cancelled query
+CANCEL_CHECK_EVENTS = 10000
+
+
+class FilterPlan:
+    """
+    A compiled form of the `process_data` filter arguments.
+
+    All per-request work (event type and filter value sets, the projection key
+    set and the time bounds as epoch microseconds) is done once when the plan is
+    built, so the plan can be applied to any number of datasets without
+    repeating it. Event timestamps go through a memoizing `TimestampParser`;
+    events rejected for an unparseable one are counted in `timestamp_failures`
+    until the engine reports its scan with `record_scan`.
+
+    Parameters:
+    - `event_types` (List[str]): The event types to keep.
+    - `filters` (List[Any]): A list of filter objects with `attribute`, `values` and
+      optionally `operator` (see `app.operators.OPERATORS`, default `"in"`).
+    - `include_attributes` (List[str]): A list of attributes to include in the response.
+    - `start_timestamp` (str, optional): The start timestamp for filtering events.
+    - `end_timestamp` (str, optional): The end timestamp for filtering events.
+    - `zero_copy` (bool, optional): Whether `project` avoids copying events, see `project`.
+    """
+
+    def __init__(
+        self,
+        event_types: Optional[List[str]],
+        filters: Optional[List[Any]] = None,
+        include_attributes: Optional[List[str]] = None,
+        start_timestamp: Optional[str] = None,
+        end_timestamp: Optional[str] = None,
+        zero_copy: bool = False,
+    ):
+        self.zero_copy = zero_copy
+        self.start_epoch = parse_bound(start_timestamp, "start_timestamp")
+        self.end_epoch = parse_bound(end_timestamp, "end_timestamp")
+        self.timestamps = TimestampParser()
+        self.timestamp_failures = 0
+        self.event_types = frozenset(event_types or ())
+        self.filters = tuple(
+            compile_filter(filter_)
+            for filter_ in filters or ()
+            if hasattr(filter_, "attribute") and hasattr(filter_, "values")
+        )
+        self.include_attributes = (
+            frozenset(include_attributes) if include_attributes else None
+        )
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        """
+        Checks if an event meets the filter criteria: those of `matches_type`,
+        `matches_time` and `matches_attributes`, inlined as this runs per event.
+        """
+        try:
+            if event.get("event_type") not in self.event_types:
+                return False
+        except TypeError:
+            return False  # Unhashable event types can never match
+
+        state, event_time = read_timestamp(event, self.timestamps.parse)
+        if state == INVALID_TIMESTAMP:
+            self.timestamp_failures += 1
+            return False  # Skip events with invalid timestamps
+        if state == VALID_TIMESTAMP and not self.in_window(event_time):
+            return False
+
+        if self.filters:
+            attributes = event.get("attribute", {})
+            for filter_ in self.filters:
+                if not filter_.check(attributes):
+                    return False
+        return True
+
+    def matches_type(self, event: Dict[str, Any]) -> bool:
+        try:
+            return event.get("event_type") in self.event_types
+        except TypeError:
+            return False  # Unhashable event types can never match
+
+    def matches_time(self, event: Dict[str, Any]) -> bool:
+        """Checks the time window, counting events rejected for an invalid timestamp."""
+        state, event_time = read_timestamp(event, self.timestamps.parse)
+        if state == INVALID_TIMESTAMP:
+            self.timestamp_failures += 1
+            return False  # Skip events with invalid timestamps
+        return state == MISSING_TIMESTAMP or self.in_window(event_time)
+
+    def in_window(self, event_time: int) -> bool:
+        """Whether a valid timestamp, as epoch microseconds, is inside the time window."""
+        return (self.start_epoch is None or event_time >= self.start_epoch) and (
+            self.end_epoch is None or event_time <= self.end_epoch
+        )
+
+    def matches_attributes(self, event: Dict[str, Any]) -> bool:
+        if self.filters:
+            attributes = event.get("attribute", {})
+            for filter_ in self.filters:
+                if not filter_.check(attributes):
+                    return False
+        return True
+
+    def record_scan(self, scanned: int, matched: int) -> None:
+        """Reports a finished scan to `app.metrics`, with the timestamp failures counted since the last."""
+        failures, self.timestamp_failures = self.timestamp_failures, 0
+        record_scan(scanned, matched, failures)
+
+    def project(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Builds the response form of a matched event.
+
+        In `zero_copy` mode, events already in that form are returned as they
+        are when every attribute is included, and others are returned as
+        `ProjectedEvent` views, which encode to the same JSON (see
+        `app.fastjson.default`) without a per-event copy being held.
+        """
+        if self.zero_copy:
+            if self.include_attributes is None and is_projected(event):
+                return event
+            return ProjectedEvent(event, self.include_attributes)  # type: ignore[return-value]  # Encodes as the dict
+        attributes = event.get("attribute", {})
+        include = self.include_attributes
+        return {
+            "time_object": event["time_object"],
+            "event_type": event["event_type"],
+            "attribute": (
+                dict(attributes)
+                if include is None
+                else {key: value for key, value in attributes.items() if key in include}
+            ),
+        }
+
+    def select(self, data: Dict[str, Any], engine: str = "python") -> List[Dict[str, Any]]:
+        """
+        Returns the events of a dataset that meet the filter criteria, unprojected.
+
+        `engine` selects how the events are scanned: `"python"` checks one event
+        at a time, `"columnar"` evaluates the plan as vectorized masks over an
+        `EventColumns` view, and `"parallel"` splits the events across the
+        worker processes of `app.parallel`. `"auto"` picks the parallel engine
+        from `settings.PARALLEL_MIN_EVENTS` events (when more than one worker is
+        configured), else the row-wise scan: building an `EventColumns` view
+        for a single scan costs more than the vectorized masks save, so only
+        the datasets that keep their columns use them by default. All engines
+        return identical results.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Invalid engine: {engine}")
+
+        events = data.get("events", [])
+        if not isinstance(events, list):
+            events = list(events)
+
+        if engine == "auto":
+            if settings.PARALLEL_WORKERS > 1 and len(events) >= settings.PARALLEL_MIN_EVENTS:
+                engine = "parallel"
+            else:
+                engine = "python"
+
+        selected: Optional[List[Dict[str, Any]]] = None
+        if engine == "parallel":
+            try:
+                selected = [events[position] for position in select_parallel(self, events)]
+            except ParallelUnsupported:
+                pass  # Fall back to the row-wise scan
+
+        if engine == "columnar":
+            try:
+                selected = EventColumns(events).select_events(self)
+            except ColumnarUnsupported:
+                pass  # Fall back to the row-wise scan
+
+        if selected is None:
+            matches = self.matches
+            selected = []
+            for start in range(0, len(events), CANCEL_CHECK_EVENTS):
+                check_cancelled()
+                selected.extend([event for event in events[start:start + CANCEL_CHECK_EVENTS] if matches(event)])
+
+        self.record_scan(len(events), len(selected))
+        return selected
+
+    def apply(self, data: Dict[str, Any], engine: str = "python") -> List[Dict[str, Any]]:
+        """Filters the events of a dataset and projects the matches, see `select`."""
+        project = self.project
+        return [project(event) for event in self.select(data, engine)]
+
+    def iter_select(self, data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Like `select`, but yields each match as soon as the row-wise scan reaches it."""
+        matches = self.matches
+        scanned = matched = 0
+        try:
+            for event in data.get("events", []):
+                if scanned % CANCEL_CHECK_EVENTS == 0:
+                    check_cancelled()
+                scanned += 1
+                if matches(event):
+                    matched += 1
+                    yield event
+        finally:
+            self.record_scan(scanned, matched)  # Also when the consumer stops early
+
+    def iter_apply(self, data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Like `apply`, but yields each match as soon as the row-wise scan reaches it."""
+        project = self.project
+        for event in self.iter_select(data):
+            yield project(event)
+
+    def page(
+        self,
+        data: Dict[str, Any],
+        offset: int = 0,
+        limit: Optional[int] = None,
+        sort_by: Optional[str] = None,
+        descending: bool = False,
+        engine: str = "python",
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Like `apply`, but returns only one page of the matches, see `app.pagination`.
+
+        With a `limit`, the row-wise engine scans lazily: unsorted queries stop
+        as soon as the page is filled and sorted ones keep only the best
+        `offset + limit` events in memory. `"auto"` uses that scan for unsorted
+        pages; sorted pages are selected from the matches of the usual engine.
+
+        Returns:
+        - `Tuple[List[Dict[str, Any]], bool]`: The projected page and whether more matches follow it.
+        """
+        lazy = limit is not None and (engine == "python" or (engine == "auto" and sort_by is None))
+        matches = self.iter_select(data) if lazy else self.select(data, engine)
+        return project_page(self, matches, offset, limit, sort_by, descending)
 
 
 def process_data(
@@ -9,6 +252,12 @@ def process_data(
     include_attributes: Optional[List[str]] = None,  # Optional attributes
     start_timestamp: Optional[str] = None,
     end_timestamp: Optional[str] = None,
+    engine: str = "python",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    sort_by: Optional[str] = None,
+    descending: bool = False,
+    zero_copy: bool = False,
 ) -> List[Dict[str, Any]]:
     """
     Filters a dataset based on event type, attribute filters, and a time range.
@@ -20,66 +269,51 @@ def process_data(
     - `include_attributes` (List[str]): A list of attributes to include in the response.
     - `start_timestamp` (str, optional): The start timestamp for filtering events.
     - `end_timestamp` (str, optional): The end timestamp for filtering events.
+    - `engine` (str, optional): `"python"`, `"columnar"`, `"parallel"` or `"auto"`, see `FilterPlan.apply`.
+    - `limit` (int, optional): The maximum number of events to return.
+    - `offset` (int, optional): The number of matched events to skip.
+    - `sort_by` (str, optional): `"timestamp"` or an attribute to order the events by.
+    - `descending` (bool, optional): Whether `sort_by` orders from largest to smallest.
+    - `zero_copy` (bool, optional): Whether to return the events of `data` by
+      reference, or as read-only views when only some attributes are included,
+      instead of copies. For results that are only serialized, see `FilterPlan.project`.
 
     Returns:
     - `List[Dict[str, Any]]`: A list of filtered events with specified attributes.
     """
-    events = data.get("events", [])
-
-    # Convert timestamps to datetime objects for comparison
-    try:
-        start_dt = datetime.fromisoformat(start_timestamp) if start_timestamp else None
-    except ValueError:
-        raise ValueError(f"Invalid start_timestamp format: {start_timestamp}")
-
-    try:
-        end_dt = datetime.fromisoformat(end_timestamp) if end_timestamp else None
-    except ValueError:
-        raise ValueError(f"Invalid end_timestamp format: {end_timestamp}")
-
-    def event_matches(event: Dict[str, Any]) -> bool:
-        """Checks if an event meets the filter criteria."""
-        if event.get("event_type") not in event_types:
-            return False
-
-        event_time_str = event.get("time_object", {}).get("timestamp")
-        if event_time_str:
-            try:
-                event_time = datetime.fromisoformat(
-                    event_time_str[:26]
-                )  # Trim extra precision if needed
-                if start_dt and event_time < start_dt:
-                    return False
-                if end_dt and event_time > end_dt:
-                    return False
-            except ValueError:
-                return False  # Skip events with invalid timestamps
-
-        # Check attribute filters
-        if filters:
-            attributes = event.get("attribute", {})
-            for filter_ in filters:
-                if hasattr(filter_, "attribute") and hasattr(filter_, "values"):
-                    attr_name = filter_.attribute
-                    allowed_values = set(filter_.values)
-                    if attr_name not in attributes or attributes[attr_name] not in allowed_values:
-                        return False
+    plan = FilterPlan(
+        event_types,
+        filters=filters,
+        include_attributes=include_attributes,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+        zero_copy=zero_copy,
+    )
+    if limit is None and not offset and sort_by is None:
+        return plan.apply(data, engine=engine)
+    return plan.page(data, offset, limit, sort_by, descending, engine=engine)[0]
 
-        return True
 
-    # Apply filtering
-    filtered_events = [
-        {
-            "time_object": event["time_object"],
-            "event_type": event["event_type"],
-            "attribute": {
-                key: value
-                for key, value in event.get("attribute", {}).items()
-                if not include_attributes or key in include_attributes
-            },
-        }
-        for event in events
-        if event_matches(event)
-    ]
+def iter_process_data(
+    data: Dict[str, Any],
+    event_types: List[str],
+    filters: Optional[List[Any]] = None,
+    include_attributes: Optional[List[str]] = None,
+    start_timestamp: Optional[str] = None,
+    end_timestamp: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generator variant of `process_data`.
 
-    return filtered_events
+    The arguments are validated straight away, so an invalid timestamp raises
+    here rather than on the first iteration; filtered events are then produced
+    lazily, one at a time.
+    """
+    plan = FilterPlan(
+        event_types,
+        filters=filters,
+        include_attributes=include_attributes,
+        start_timestamp=start_timestamp,
+        end_timestamp=end_timestamp,
+    )
+    return plan.iter_apply(data)
@@ -0,0 +1,178 @@
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, FrozenSet, Iterator, Optional
+
+# The members of a well-formed ADAGE event
+FIELDS = ("time_object", "event_type", "attribute")
+_FIELD_SET = frozenset(FIELDS)
+
+# Longer strings are rarely repeated, so they are not worth interning
+INTERN_MAX_LENGTH = 64
+
+# Distinct time objects shared per `Compactor` before its table is reset
+TIME_OBJECT_CACHE_SIZE = 1 << 16
+
+
+class EventRecord(Mapping):
+    """
+    Compact, read-only form of a stored ADAGE event.
+
+    A slotted object takes a fraction of the memory of the three-key dict it
+    replaces. It is a `Mapping` with the same keys, so everything that reads
+    events with `get` or `[]` accepts it unchanged, and it compares equal to
+    the dict it was built from.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, time_object: Dict[str, Any], event_type: Any, attribute: Dict[str, Any]):
+        self.time_object = time_object
+        self.event_type = event_type
+        self.attribute = attribute
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"EventRecord({self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"time_object": self.time_object, "event_type": self.event_type, "attribute": self.attribute}
+
+
+class ProjectedEvent(Mapping):
+    """
+    Read-only view of a matched event restricted to some of its attributes.
+
+    Holds only a reference to the source event and the attribute names to keep;
+    the projected `attribute` dict is built when the view is read or encoded to
+    JSON, so a response is never held as a second copy of its events. A view
+    keeps the whole source event alive, which costs nothing when the source is
+    held anyway (a request's `json_data`, a stored dataset).
+    """
+
+    __slots__ = ("_event", "_include")
+
+    def __init__(self, event: Any, include: Optional[FrozenSet[str]]):
+        self._event = event
+        self._include = include
+
+    @property
+    def time_object(self) -> Any:
+        return self._event["time_object"]
+
+    @property
+    def event_type(self) -> Any:
+        return self._event["event_type"]
+
+    @property
+    def attribute(self) -> Dict[str, Any]:
+        return self.to_dict()["attribute"]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    def __repr__(self) -> str:
+        return f"ProjectedEvent({self.to_dict()!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        event = self._event
+        attributes = event.get("attribute", {})
+        include = self._include
+        return {
+            "time_object": event["time_object"],
+            "event_type": event["event_type"],
+            "attribute": (
+                dict(attributes)
+                if include is None
+                else {key: value for key, value in attributes.items() if key in include}
+            ),
+        }
+
+
+def is_projected(event: Any) -> bool:
+    """Whether an event is already in the response form of a projection of all attributes."""
+    if type(event) is EventRecord:
+        return type(event.attribute) is dict
+    return (
+        type(event) is dict
+        and len(event) == 3
+        and type(event.get("attribute")) is dict
+        and tuple(event) == FIELDS
+    )
+
+
+def _intern(value: Any) -> Any:
+    if type(value) is str and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+class Compactor:
+    """
+    Converts parsed events into `EventRecord`s as they are ingested.
+
+    Dict keys and short string values are interned, so the repeated names
+    (`duration_unit`, `suburb`, ...) and low-cardinality values (`"AEDT"`,
+    `"sales report"`, ...) of millions of events share one string object each.
+    Time objects with identical contents share one dict. Events that are not
+    shaped like ADAGE events are kept as dicts, with their strings interned.
+    """
+
+    def __init__(self):
+        self._time_objects: Dict[Any, Dict[str, Any]] = {}
+
+    @staticmethod
+    def compact_dict(value: Dict[str, Any]) -> Dict[str, Any]:
+        return {_intern(key): _intern(item) for key, item in value.items()}
+
+    def time_object(self, value: Dict[str, Any]) -> Dict[str, Any]:
+        compacted = self.compact_dict(value)
+        try:
+            # With the value types, as 0, 0.0 and False are equal keys but different JSON
+            key = tuple((name, type(item), item) for name, item in compacted.items())
+            shared = self._time_objects.get(key)
+        except TypeError:
+            return compacted  # Unhashable members cannot be looked up
+        if shared is None:
+            if len(self._time_objects) >= TIME_OBJECT_CACHE_SIZE:
+                self._time_objects.clear()
+            shared = self._time_objects[key] = compacted
+        return shared
+
+    def event(self, event: Any) -> Any:
+        if type(event) is not dict:
+            return event
+        if (
+            event.keys() == _FIELD_SET
+            and type(event["time_object"]) is dict
+            and type(event["attribute"]) is dict
+        ):
+            return EventRecord(
+                self.time_object(event["time_object"]),
+                _intern(event["event_type"]),
+                self.compact_dict(event["attribute"]),
+            )
+        return self.compact_dict(event)
@@ -0,0 +1,79 @@
+"""
+Production server: `python -m app.server [--workers N] [--host HOST] [--port PORT]`.
+
+Runs the API under Uvicorn's process supervisor with `settings.WORKERS`
+workers, one by default, or one per CPU of the container's quota with
+`--workers 0`. The app is imported
+once by the supervisor before any worker starts, so a broken deployment fails
+straight away instead of in every worker. Workers are replaced after
+`settings.WORKER_MAX_REQUESTS` requests, and all of them one by one on
+`SIGHUP`, each finishing its requests in progress first.
+
+Workers do not share Python objects, so with more than one of them uploaded
+datasets go to the mapped store (`settings.SHARED_DATASETS`): every worker
+maps the same files, and the operating system holds a single copy of their
+columns and events in the page cache for all of them. Mapped datasets are
+read-only, so running several workers gives up the dataset update endpoints;
+that is why a single worker is the default. Each worker starts its own
+parallel engine pool when `settings.PARALLEL_WORKERS` enables one, so size it
+so the workers together use about one process per CPU.
+"""
+import argparse
+import importlib
+import os
+from typing import List, Dict, Any, Optional
+
+import uvicorn
+
+from app import settings
+from app.settings import CGROUP_ROOT, available_cpus
+
+
+def worker_count(configured: Optional[int] = None, root: str = CGROUP_ROOT) -> int:
+    """`configured` (default `settings.WORKERS`) if positive, else one worker per available CPU."""
+    configured = settings.WORKERS if configured is None else configured
+    return configured if configured > 0 else available_cpus(root)
+
+
+def configure_workers(workers: int) -> None:
+    """
+    Sets the environment the worker processes read their settings from.
+
+    Variables already set by the deployment are left as they are.
+    """
+    if workers > 1:
+        os.environ.setdefault("PREPROCESSING_SHARED_DATASETS", "1")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.server", description=__doc__.split("\n\n")[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: settings.WORKERS; 0: one per available CPU)")
+    parser.add_argument("--ssl-keyfile")
+    parser.add_argument("--ssl-certfile")
+    args = parser.parse_args(argv)
+
+    workers = worker_count(args.workers)
+    configure_workers(workers)
+    importlib.import_module("app.main")  # Preload, see the module docstring
+
+    options: Dict[str, Any] = {}
+    if workers > 1 and settings.WORKER_MAX_REQUESTS > 0:
+        # Only the supervisor of several workers replaces one that exits
+        options["limit_max_requests"] = settings.WORKER_MAX_REQUESTS
+        options["limit_max_requests_jitter"] = settings.WORKER_MAX_REQUESTS_JITTER
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_graceful_shutdown=settings.WORKER_GRACEFUL_TIMEOUT_SECONDS,
+        ssl_keyfile=args.ssl_keyfile,
+        ssl_certfile=args.ssl_certfile,
+        **options,
+    )
+
+
+if __name__ == "__main__":
+    main()
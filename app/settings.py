@@ -0,0 +1,125 @@
+"""Runtime tunables for the preprocessing service, read from the environment."""
+import os
+from typing import Optional
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """
+    The CPUs the container may use, from its cgroup CPU quota (v2, then v1).
+
+    Returns `None` when no quota is set, as outside of a container.
+    """
+    limit = _read(os.path.join(root, "cpu.max"))  # "<quota> <period>", or "max <period>"
+    if limit is not None:
+        quota, _, period = limit.partition(" ")
+        if quota != "max":
+            try:
+                return int(quota) / int(period)
+            except (ValueError, ZeroDivisionError):
+                return None
+        return None
+
+    cfs_quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+    cfs_period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    try:
+        if cfs_quota is not None and cfs_period is not None and int(cfs_quota) > 0:
+            return int(cfs_quota) / int(cfs_period)
+    except (ValueError, ZeroDivisionError):
+        pass
+    return None
+
+
+def available_cpus(root: str = CGROUP_ROOT) -> int:
+    """The CPUs this process may run on, capped by the container's CPU quota."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = cpu_quota(root)
+    if quota is not None:
+        cpus = min(cpus, max(int(quota), 1))  # A fractional CPU would only throttle an extra worker
+    return cpus
+
+
+# Event count from which `engine="auto"` batches may switch to the columnar engine
+COLUMNAR_MIN_EVENTS = _int_env("PREPROCESSING_COLUMNAR_MIN_EVENTS", 50000)
+
+# Queries from which an `engine="auto"` batch shares one columnar view: below it,
+# building the view costs more than the vectorized masks save (see app/batch.py)
+BATCH_COLUMNAR_MIN_QUERIES = _int_env("PREPROCESSING_BATCH_COLUMNAR_MIN_QUERIES", 24)
+
+# Upper bound on the uploaded JSON bytes held by the in-process dataset store, and on
+# the files of the mapped store under `DATASET_DIR` that uploads are added to
+DATASET_CACHE_BYTES = _int_env("PREPROCESSING_DATASET_CACHE_BYTES", 256 * 1024 * 1024)
+
+# Attributes with more distinct values than this are not given an inverted index
+INDEX_MAX_CARDINALITY = _int_env("PREPROCESSING_INDEX_MAX_CARDINALITY", 4096)
+
+# Months of event timestamps per partition of a stored dataset (0: no time partitions)
+PARTITION_MONTHS = _int_env("PREPROCESSING_PARTITION_MONTHS", 1)
+
+# Events whose partitions may hold built indexes at once, over every stored dataset;
+# the least recently queried partitions drop theirs past it, and rebuild them on demand
+PARTITION_INDEX_EVENTS = _int_env("PREPROCESSING_PARTITION_INDEX_EVENTS", 2000000)
+
+# Upper bound on the response bytes held by the result cache (0 disables it)
+RESULT_CACHE_BYTES = _int_env("PREPROCESSING_RESULT_CACHE_BYTES", 64 * 1024 * 1024)
+
+# Seconds a cached result stays valid
+RESULT_CACHE_TTL_SECONDS = _int_env("PREPROCESSING_RESULT_CACHE_TTL_SECONDS", 300)
+
+# Worker processes used by the parallel engine (1 disables it). Off by default: shipping the
+# events to the workers as JSON costs more than filtering them in-process in the benchmarks
+PARALLEL_WORKERS = _int_env("PREPROCESSING_PARALLEL_WORKERS", 1)
+
+# Event count from which `engine="auto"` switches to the parallel engine
+PARALLEL_MIN_EVENTS = _int_env("PREPROCESSING_PARALLEL_MIN_EVENTS", 200000)
+
+# Events handed to a worker process at a time
+PARALLEL_CHUNK_EVENTS = _int_env("PREPROCESSING_PARALLEL_CHUNK_EVENTS", 25000)
+
+# Filter queries computed at once, off the event loop
+MAX_CONCURRENT_QUERIES = _int_env("PREPROCESSING_MAX_CONCURRENT_QUERIES", 4)
+
+# Further queries allowed to wait for a slot before new ones get a 429
+MAX_QUEUED_QUERIES = _int_env("PREPROCESSING_MAX_QUEUED_QUERIES", 16)
+
+# Seconds a query may wait and run before it is cancelled
+QUERY_TIMEOUT_SECONDS = _int_env("PREPROCESSING_QUERY_TIMEOUT_SECONDS", 60)
+
+# Smallest response body, in bytes, compressed for clients that accept it
+COMPRESSION_MIN_BYTES = _int_env("PREPROCESSING_COMPRESSION_MIN_BYTES", 1024)
+
+# Largest request body, in bytes, a compressed upload may decode to
+DECOMPRESSED_MAX_BYTES = _int_env("PREPROCESSING_DECOMPRESSED_MAX_BYTES", 512 * 1024 * 1024)
+
+# Directory holding the memory-mapped datasets made by `python -m app.mapped convert`
+DATASET_DIR = os.environ.get("PREPROCESSING_DATASET_DIR", "datasets")
+
+# Whether uploaded datasets are converted into the mapped store under `DATASET_DIR`,
+# so every worker process of `python -m app.server` serves them from one shared copy
+SHARED_DATASETS = _int_env("PREPROCESSING_SHARED_DATASETS", 0)
+
+# Server worker processes started by `python -m app.server` (0: one per CPU of the container's
+# quota). More than one serves uploads from the shared mapped store, where they cannot be updated
+WORKERS = _int_env("PREPROCESSING_WORKERS", 1)
+
+# Requests a server worker handles before it is replaced (0: never), plus a random
+# extra of up to `WORKER_MAX_REQUESTS_JITTER` so the workers are not all replaced at once
+WORKER_MAX_REQUESTS = _int_env("PREPROCESSING_WORKER_MAX_REQUESTS", 0)
+WORKER_MAX_REQUESTS_JITTER = _int_env("PREPROCESSING_WORKER_MAX_REQUESTS_JITTER", 1000)
+
+# Seconds a stopping server worker is given to finish the requests in progress
+WORKER_GRACEFUL_TIMEOUT_SECONDS = _int_env("PREPROCESSING_WORKER_GRACEFUL_TIMEOUT_SECONDS", 30)
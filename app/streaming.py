@@ -0,0 +1,184 @@
+import codecs
+import json
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+
+from app import fastjson
+
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+# Parser states
+_OBJECT_START = "object_start"
+_FIRST_KEY = "first_key"
+_KEY = "key"
+_COLON = "colon"
+_VALUE = "value"
+_AFTER_MEMBER = "after_member"
+_EVENTS_START = "events_start"
+_FIRST_EVENT = "first_event"
+_EVENT = "event"
+_AFTER_EVENT = "after_event"
+_END = "end"
+
+
+class StreamParseError(ValueError):
+    """Raised when a streamed ADAGE document is not valid JSON."""
+
+
+class EventStreamParser:
+    """
+    Incremental parser for an ADAGE document.
+
+    Bytes are fed in as they arrive and every complete item of the top-level
+    `events` array is returned as soon as it has been read, so the caller can
+    filter and discard events without the whole document ever being held in
+    memory. All other top-level members are collected into `metadata`.
+    """
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = _OBJECT_START
+        self._key = ""
+        self.metadata: Dict[str, Any] = {}
+        self.has_events = False
+
+    @property
+    def is_empty(self) -> bool:
+        """Whether the document was an empty object."""
+        return not self.metadata and not self.has_events
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Parses the next chunk of the document and returns the events it completed."""
+        try:
+            self._buffer += self._text.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise StreamParseError(f"Invalid UTF-8 in request body: {e}")
+        return self._parse(final=False)
+
+    def close(self) -> List[Any]:
+        """Parses whatever is left of the document once the body has ended."""
+        try:
+            self._buffer += self._text.decode(b"", final=True)
+        except UnicodeDecodeError as e:
+            raise StreamParseError(f"Invalid UTF-8 in request body: {e}")
+        events = self._parse(final=True)
+        if self._state != _END:
+            raise StreamParseError("Unexpected end of JSON document")
+        return events
+
+    def _decode_value(self, final: bool) -> Tuple[bool, Any]:
+        """Decodes one JSON value at the current position, if it is complete."""
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise StreamParseError(f"Invalid JSON: {e}")
+            return False, None
+        # A number running up to the end of the buffer may continue in the next chunk
+        if end == len(self._buffer) and not final and type(value) in (int, float):
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _expect(self, char: str, expected: str) -> None:
+        if char not in expected:
+            raise StreamParseError(
+                f"Invalid JSON: expected {' or '.join(repr(c) for c in expected)} "
+                f"but found {char!r}"
+            )
+        self._pos += 1
+
+    def _parse(self, final: bool) -> List[Any]:
+        events = []
+        buffer = self._buffer
+        while True:
+            while self._pos < len(buffer) and buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos == len(buffer):
+                break
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == _OBJECT_START:
+                self._expect(char, "{")
+                self._state = _FIRST_KEY
+            elif state == _FIRST_KEY and char == "}":
+                self._pos += 1
+                self._state = _END
+            elif state in (_FIRST_KEY, _KEY):
+                if char != '"':
+                    raise StreamParseError(f"Invalid JSON: expected a key but found {char!r}")
+                complete, self._key = self._decode_value(final)
+                if not complete:
+                    break
+                self._state = _COLON
+            elif state == _COLON:
+                self._expect(char, ":")
+                self._state = _EVENTS_START if self._key == "events" else _VALUE
+            elif state == _VALUE:
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                self.metadata[self._key] = value
+                self._state = _AFTER_MEMBER
+            elif state == _EVENTS_START:
+                if char != "[":
+                    raise StreamParseError("Invalid JSON format: 'events' must be a list")
+                self._pos += 1
+                self.has_events = True
+                self._state = _FIRST_EVENT
+            elif state == _FIRST_EVENT and char == "]":
+                self._pos += 1
+                self._state = _AFTER_MEMBER
+            elif state in (_FIRST_EVENT, _EVENT):
+                complete, value = self._decode_value(final)
+                if not complete:
+                    break
+                events.append(value)
+                self._state = _AFTER_EVENT
+            elif state == _AFTER_EVENT:
+                self._expect(char, ",]")
+                self._state = _EVENT if char == "," else _AFTER_MEMBER
+            elif state == _AFTER_MEMBER:
+                self._expect(char, ",}")
+                self._state = _KEY if char == "," else _END
+            else:
+                raise StreamParseError(f"Invalid JSON: unexpected {char!r} after document")
+
+        # Drop everything already consumed so memory stays bounded by one item
+        self._buffer = buffer[self._pos:]
+        self._pos = 0
+        return events
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_CHUNK_BYTES = 64 * 1024
+
+
+def iter_ndjson(events: Iterable[Any]) -> Iterator[bytes]:
+    """
+    Encodes events as newline-delimited JSON.
+
+    The first line is sent on its own to keep time-to-first-byte low; after
+    that, lines are grouped into chunks of about `NDJSON_CHUNK_BYTES`.
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=fastjson.default).encode
+    chunk: List[str] = []
+    size = 0
+    first = True
+    for event in events:
+        line = encode(event) + "\n"
+        if first:
+            yield line.encode("utf-8")
+            first = False
+            continue
+        chunk.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield "".join(chunk).encode("utf-8")
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk).encode("utf-8")
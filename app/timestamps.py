@@ -0,0 +1,126 @@
+from array import array
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_MICROSECONDS_PER_DAY = 86400 * 1000000
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+# Distinct timestamps remembered per parser before its cache is reset
+CACHE_SIZE = 1 << 16
+
+# States of an event timestamp: events without one pass any time window,
+# events with one that cannot be parsed never match
+VALID_TIMESTAMP, MISSING_TIMESTAMP, INVALID_TIMESTAMP = 0, 1, 2
+
+
+def to_epoch(value: datetime) -> int:
+    """
+    Converts a datetime to integer microseconds since the Unix epoch.
+
+    Naive datetimes are taken as they are; offset-aware ones are first moved to
+    UTC, so both kinds share one timeline.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _ONE_MICROSECOND
+
+
+def parse_bound(timestamp: Optional[str], name: str) -> Optional[int]:
+    """Parses a `start_timestamp`/`end_timestamp` bound to epoch microseconds."""
+    try:
+        return to_epoch(datetime.fromisoformat(timestamp)) if timestamp else None
+    except ValueError:
+        raise ValueError(f"Invalid {name} format: {timestamp}")
+
+
+def _parse_iso(value: str) -> Optional[int]:
+    try:
+        # Trim extra precision such as 7-digit fractions
+        return to_epoch(datetime.fromisoformat(value[:26]))
+    except ValueError:
+        return None
+
+
+def _parse_compact_date(value: str) -> Optional[int]:
+    if len(value) != 8 or not value.isascii() or not value.isdigit():
+        return _parse_iso(value)
+    try:
+        day = date(int(value[:4]), int(value[4:6]), int(value[6:]))
+    except ValueError:
+        return None
+    return (day.toordinal() - _EPOCH_ORDINAL) * _MICROSECONDS_PER_DAY
+
+
+def detect_format(value: Any) -> Callable[[str], Optional[int]]:
+    """Picks the parse function suited to a sample timestamp from a dataset."""
+    if isinstance(value, str) and len(value) == 8 and value.isdigit():
+        return _parse_compact_date
+    return _parse_iso
+
+
+class TimestampParser:
+    """
+    Normalizes event timestamps to integer epoch microseconds.
+
+    The timestamp format is detected from the first value seen and every
+    distinct string is parsed only once, which pays off on sales data where
+    the same dates repeat across many events. `parse` returns `None` for
+    timestamps that cannot be parsed.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, Optional[int]] = {}
+        self._parse: Optional[Callable[[str], Optional[int]]] = None
+
+    def __getstate__(self):
+        # Plans are pickled for worker processes; the cache is not worth sending
+        return {"_cache": {}, "_parse": None}
+
+    def parse(self, value: str) -> Optional[int]:
+        cache = self._cache
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+        if self._parse is None:
+            self._parse = detect_format(value)
+        if len(cache) >= CACHE_SIZE:
+            cache.clear()
+        epoch = cache[value] = self._parse(value)
+        return epoch
+
+
+def read_timestamp(event: Any, parse: Callable[[str], Optional[int]]) -> Tuple[int, int]:
+    """
+    Reads `time_object.timestamp` of an event the way every engine does.
+
+    Returns the state of the timestamp and, for `VALID_TIMESTAMP`, its epoch
+    microseconds (0 otherwise). Raises `AttributeError` or `TypeError` for
+    events not shaped like ADAGE events.
+    """
+    event_time_str = event.get("time_object", {}).get("timestamp")
+    if not event_time_str:
+        return MISSING_TIMESTAMP, 0
+    event_time = parse(event_time_str)
+    if event_time is None:
+        return INVALID_TIMESTAMP, 0
+    return VALID_TIMESTAMP, event_time
+
+
+def read_timestamps(events: Iterable[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `read_timestamp` over many events, with a fresh parser: the states as an
+    int8 array and the epochs as an int64 array.
+    """
+    parse = TimestampParser().parse
+    states = array("b")
+    epochs = array("q")
+    for event in events:
+        state, epoch = read_timestamp(event, parse)
+        states.append(state)
+        epochs.append(epoch)
+    return np.frombuffer(states, dtype=np.int8), np.frombuffer(epochs, dtype=np.int64)
@@ -0,0 +1,65 @@
+"""
+Compares `/filter-data` with `/filter-data/fast` on a scaled-up copy of
+`tests/sample-input/input1.json`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_fast_json --events 100000 --repeat 5
+"""
+import argparse
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+SAMPLE = "tests/sample-input/input1.json"
+
+
+def scaled_request(events: int, projected: bool) -> bytes:
+    with open(SAMPLE, "r") as file:
+        request = json.load(file)
+    sample_events = request["json_data"]["events"]
+    request["json_data"]["events"] = [sample_events[n % len(sample_events)] for n in range(events)]
+    request["start_timestamp"] = None
+    request["end_timestamp"] = None
+    if not projected:
+        request["include_attributes"] = None
+    return json.dumps(request).encode("utf-8")
+
+
+def best_of(client: TestClient, path: str, body: bytes, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.post(
+            path,
+            content=body,
+            headers={"Content-Type": "application/json", "Cache-Control": "no-store"},
+        )
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = TestClient(app)
+    print(f"events: {args.events}")
+    for projected in (True, False):
+        body = scaled_request(args.events, projected)
+        standard = best_of(client, "/filter-data", body, args.repeat)
+        fast = best_of(client, "/filter-data/fast", body, args.repeat)
+        label = "price, suburb" if projected else "all attributes"
+        print(f"\n{label} ({len(body)} request bytes)")
+        print(f"  /filter-data:      {standard * 1000:9.1f} ms")
+        print(f"  /filter-data/fast: {fast * 1000:9.1f} ms  ({standard / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
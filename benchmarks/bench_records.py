@@ -0,0 +1,98 @@
+"""
+Measures the memory held by a stored dataset with plain dict events and with
+compact `EventRecord`s, on a scaled-up copy of
+`tests/sample-input/realistic_input.json`.
+
+Each variant is parsed in a fresh interpreter, so the reported resident set
+size (RSS) growth is not skewed by memory left over from the other. Run from
+the repository root:
+
+    python -m benchmarks.bench_records --events 500000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+SAMPLE = "tests/sample-input/realistic_input.json"
+
+
+def scaled_document(events: int) -> bytes:
+    """The sample dataset repeated to `events` events, with varied dates and prices."""
+    with open(SAMPLE, "r") as file:
+        data = json.load(file)["json_data"]
+    sample_events = data["events"]
+    rng = random.Random(0)
+    scaled = []
+    for n in range(events):
+        event = json.loads(json.dumps(sample_events[n % len(sample_events)]))
+        event["time_object"]["timestamp"] = f"20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 00:00:00"
+        if "price" in event["attribute"]:
+            event["attribute"]["price"] = rng.randint(300, 3000) * 1000
+        if "transaction_id" in event["attribute"]:
+            event["attribute"]["transaction_id"] = f"TX{n:09d}"
+        scaled.append(event)
+    data["events"] = scaled
+    return json.dumps(data).encode("utf-8")
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm", "r") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(path: str, compact: bool) -> None:
+    """Runs in a child process: prints the RSS growth of parsing the document."""
+    from app.records import Compactor
+    from app.streaming import EventStreamParser
+
+    gc.collect()
+    before = rss_bytes()
+    parser = EventStreamParser()
+    convert = Compactor().event if compact else (lambda event: event)
+    events = []
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 16), b""):
+            events.extend(map(convert, parser.feed(chunk)))
+    events.extend(map(convert, parser.close()))
+    gc.collect()
+    print(json.dumps({"events": len(events), "rss_bytes": rss_bytes() - before}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--measure", choices=["dict", "records"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.path, args.measure == "records")
+        return
+
+    if not os.path.exists("/proc/self/statm"):
+        sys.exit("RSS is read from /proc/self/statm, which this platform does not have")
+
+    with tempfile.NamedTemporaryFile(suffix=".json") as document:
+        document.write(scaled_document(args.events))
+        document.flush()
+        print(f"events: {args.events} ({document.tell()} bytes of JSON)")
+        results = {}
+        for variant in ("dict", "records"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_records", "--measure", variant, "--path", document.name],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results[variant] = json.loads(output)["rss_bytes"]
+            print(f"  {variant:>7}: {results[variant] / (1 << 20):8.1f} MiB")
+        print(f"  saving:  {1 - results['records'] / results['dict']:8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmark suite for `process_data` and `/filter-data` on synthetic ADAGE data.
+
+Runs microbenchmarks (timestamp parsing, filtering per engine, projection),
+end-to-end `/filter-data` requests through the test client with latency
+percentiles, and peak memory tracking, then writes every figure to a JSON
+results file. Passing an earlier results file to `--compare` reports how each
+figure moved. Run from the repository root:
+
+    python -m benchmarks.suite --events 100000 --output bench.json
+    python -m benchmarks.suite --events 100000 --compare bench.json --max-regression 0.2
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.testclient import TestClient
+
+from app.main import FilterQuery, app
+from app.preprocessing import process_data
+from app.timestamps import TimestampParser
+from benchmarks.synthetic import TIMESTAMP_FORMATS, generate, query
+
+# Figures where a larger value is the better one; every other timing is better smaller
+_HIGHER_IS_BETTER = ("events_per_s", "requests_per_s")
+
+
+def timed(func: Callable[[], Any], repeat: int, events: int) -> Dict[str, float]:
+    """Times `func` over `repeat` runs."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    best = min(samples)
+    return {
+        "best_ms": best * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "events_per_s": events / best if best else 0.0,
+    }
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency percentiles, in milliseconds, of a list of durations in seconds."""
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {"p50_ms": at(0.50), "p90_ms": at(0.90), "p99_ms": at(0.99), "max_ms": ordered[-1] * 1000}
+
+
+def microbenchmarks(data: Dict[str, Any], body: Dict[str, Any], repeat: int) -> Dict[str, Dict[str, float]]:
+    events = data["events"]
+    plan = FilterQuery.model_validate(body).to_plan()
+    matches = plan.select(data)
+    timestamps = [event["time_object"]["timestamp"] for event in events]
+
+    def parse_timestamps():
+        parse = TimestampParser().parse  # A fresh parser, so its cache starts cold
+        for timestamp in timestamps:
+            parse(timestamp)
+
+    results = {"timestamps.parse": timed(parse_timestamps, repeat, len(events))}
+    for engine in ("python", "columnar"):
+        results[f"filter.{engine}"] = timed(lambda: plan.select(data, engine=engine), repeat, len(events))
+    results["project"] = timed(lambda: [plan.project(event) for event in matches], repeat, len(matches))
+    arguments = _process_data_arguments(body)
+    for engine in ("python", "columnar"):
+        results[f"process_data.{engine}"] = timed(
+            lambda: process_data(data, engine=engine, **arguments), repeat, len(events)
+        )
+    return results
+
+
+def _process_data_arguments(body: Dict[str, Any]) -> Dict[str, Any]:
+    query_model = FilterQuery.model_validate(body)
+    return {
+        "event_types": query_model.event_type,
+        "filters": query_model.filters,
+        "include_attributes": query_model.include_attributes,
+        "start_timestamp": query_model.start_timestamp,
+        "end_timestamp": query_model.end_timestamp,
+    }
+
+
+def end_to_end(data: Dict[str, Any], body: Dict[str, Any], requests: int) -> Dict[str, Dict[str, float]]:
+    client = TestClient(app)
+    payload = json.dumps({"json_data": data, **body}).encode("utf-8")
+    headers = {"Content-Type": "application/json", "Cache-Control": "no-store"}
+    results = {}
+    for path in ("/filter-data", "/filter-data/fast"):
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.post(path, content=payload, headers=headers)
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+        total = sum(samples)
+        results[f"http{path.replace('/', '.')}"] = {
+            **percentiles(samples),
+            "requests_per_s": requests / total,
+            "events_per_s": requests * len(data["events"]) / total,
+            "request_bytes": len(payload),
+        }
+    return results
+
+
+def memory_peaks(data: Dict[str, Any], body: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Peak memory allocated while `process_data` runs, over the dataset already in memory."""
+    results = {}
+    arguments = _process_data_arguments(body)
+    for engine in ("python", "columnar"):
+        tracemalloc.start()
+        process_data(data, engine=engine, **arguments)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[f"memory.process_data.{engine}"] = {"peak_bytes": peak}
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    events: int,
+    attributes: int = 12,
+    cardinality: int = 50,
+    timestamp_format: str = "iso",
+    repeat: int = 5,
+    requests: int = 20,
+) -> Dict[str, Any]:
+    """Runs the whole suite and returns the results document."""
+    data = generate(events, attributes=attributes, cardinality=cardinality, timestamp_format=timestamp_format)
+    body = query(cardinality)
+    results: Dict[str, Dict[str, float]] = {}
+    results.update(microbenchmarks(data, body, repeat))
+    results.update(end_to_end(data, body, requests))
+    results.update(memory_peaks(data, body))
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "parameters": {
+            "events": events,
+            "attributes": attributes,
+            "cardinality": cardinality,
+            "timestamp_format": timestamp_format,
+            "repeat": repeat,
+            "requests": requests,
+            "matches": len(FilterQuery.model_validate(body).to_plan().select(data)),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Relative change of every figure present in both result documents.
+
+    `regression` is the fraction by which a figure got worse (negative when
+    it improved), whichever direction is better for it.
+    """
+    changes = []
+    for name, figures in current["results"].items():
+        for figure, value in figures.items():
+            before = baseline.get("results", {}).get(name, {}).get(figure)
+            if not before or not value or figure == "request_bytes":
+                continue
+            ratio = value / before
+            regression = (1 / ratio - 1) if figure in _HIGHER_IS_BETTER else (ratio - 1)
+            changes.append({"name": name, "figure": figure, "before": before, "after": value, "regression": regression})
+    return changes
+
+
+def _print_results(document: Dict[str, Any]) -> None:
+    parameters = document["parameters"]
+    print(f"events: {parameters['events']} ({parameters['matches']} matching the query)")
+    for name, figures in document["results"].items():
+        print(f"  {name:<28} " + "  ".join(f"{figure}={value:,.1f}" for figure, value in figures.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--attributes", type=int, default=12)
+    parser.add_argument("--cardinality", type=int, default=50)
+    parser.add_argument("--timestamp-format", choices=[*TIMESTAMP_FORMATS, "mixed"], default="iso")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per microbenchmark")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare against an earlier results file")
+    parser.add_argument(
+        "--max-regression", type=float,
+        help="With --compare, exit with status 1 if a timing got worse by more than this fraction",
+    )
+    args = parser.parse_args()
+
+    document = run(
+        args.events,
+        attributes=args.attributes,
+        cardinality=args.cardinality,
+        timestamp_format=args.timestamp_format,
+        repeat=args.repeat,
+        requests=args.requests,
+    )
+    _print_results(document)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(document, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        if baseline.get("parameters", {}).get("events") != args.events:
+            print("\nwarning: the baseline was run with a different event count")
+        print(f"\ncompared with {args.compare} (positive changes are regressions):")
+        changes = compare(document, baseline)
+        for change in changes:
+            print(
+                f"  {change['name']:<28} {change['figure']:<14} "
+                f"{change['before']:>14,.1f} -> {change['after']:>14,.1f}  ({change['regression']:+.1%})"
+            )
+        worst = max((change["regression"] for change in changes if change["figure"] != "peak_bytes"), default=0.0)
+        if args.max_regression is not None and worst > args.max_regression:
+            sys.exit(f"\nregression of {worst:.1%} exceeds --max-regression {args.max_regression:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Synthetic ADAGE datasets shaped like the NSW house sales in `tests/sample-input/`.
+
+    from benchmarks.synthetic import generate
+    data = generate(100000, attributes=12, cardinality=50, timestamp_format="mixed")
+"""
+import random
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+EVENT_TYPES = ("sales report", "market update", "rental listing")
+
+# Timestamp formats found in the sample inputs
+TIMESTAMP_FORMATS = {
+    "compact": lambda moment: moment.strftime("%Y%m%d"),
+    "iso": lambda moment: moment.strftime("%Y-%m-%dT%H:%M:%S"),
+    "iso_fraction": lambda moment: moment.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+    "space_7_digits": lambda moment: moment.strftime("%Y-%m-%d %H:%M:%S.%f") + "0",
+}
+
+_START = datetime(2015, 1, 1)
+_SPAN_SECONDS = 10 * 365 * 86400
+
+
+def _moment(rng: random.Random, timestamp_format: str) -> datetime:
+    moment = _START + timedelta(seconds=rng.randrange(_SPAN_SECONDS))
+    if timestamp_format == "compact":
+        return moment.replace(hour=0, minute=0, second=0)  # Whole days repeat, as in daily sales data
+    return moment.replace(microsecond=rng.randrange(1000000))
+
+
+def generate(
+    events: int,
+    attributes: int = 12,
+    cardinality: int = 50,
+    timestamp_format: str = "iso",
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Builds an ADAGE document with `events` synthetic sales events.
+
+    Parameters:
+    - `events` (int): The number of events.
+    - `attributes` (int, optional): Attributes per event, at least 4: `suburb`
+      (low-cardinality), `price` (numeric), `transaction_id` (unique) and
+      `property_type`, then generic `attr_<n>` string attributes.
+    - `cardinality` (int, optional): Distinct values of `suburb` and the generic attributes.
+    - `timestamp_format` (str, optional): One of `TIMESTAMP_FORMATS`, or `"mixed"`
+      to draw each event's format from all of them.
+    - `seed` (int, optional): Seed of the random generator, for repeatable datasets.
+
+    Returns:
+    - `Dict[str, Any]`: The dataset, as `/filter-data` takes it in `json_data`.
+    """
+    if timestamp_format != "mixed" and timestamp_format not in TIMESTAMP_FORMATS:
+        raise ValueError(f"Invalid timestamp_format: {timestamp_format}")
+    rng = random.Random(seed)
+    formats = list(TIMESTAMP_FORMATS) if timestamp_format == "mixed" else [timestamp_format]
+    suburbs = [f"SUBURB {n}" for n in range(cardinality)]
+    property_types = ["RESIDENCE", "VACANT LAND", "UNIT", "COMMERCIAL"]
+
+    generated: List[Dict[str, Any]] = []
+    for n in range(events):
+        event_format = rng.choice(formats)
+        attribute: Dict[str, Any] = {
+            "suburb": rng.choice(suburbs),
+            "price": rng.randrange(200, 4000) * 1000,
+            "transaction_id": f"AU{n:08d}",
+            "property_type": rng.choice(property_types),
+        }
+        for extra in range(max(attributes - len(attribute), 0)):
+            attribute[f"attr_{extra}"] = f"value {rng.randrange(cardinality)}"
+        generated.append({
+            "time_object": {
+                "timestamp": TIMESTAMP_FORMATS[event_format](_moment(rng, event_format)),
+                "duration": 0,
+                "duration_unit": "day",
+                "timezone": "AEDT",
+            },
+            "event_type": rng.choice(EVENT_TYPES),
+            "attribute": attribute,
+        })
+
+    return {
+        "data_source": "synthetic",
+        "dataset_type": "house sales",
+        "dataset_id": f"synthetic-{events}-{seed}",
+        "time_object": {"timestamp": "2024-03-10T14:30:45.123456", "timezone": "AEDT"},
+        "events": generated,
+    }
+
+
+def query(cardinality: int = 50) -> Dict[str, Any]:
+    """A representative `/filter-data` query over a generated dataset, matching about one event in twenty."""
+    return {
+        "event_type": ["sales report"],
+        "filters": [{"attribute": "suburb", "values": [f"SUBURB {n}" for n in range(max(cardinality // 4, 1))]}],
+        "include_attributes": ["price", "suburb", "property_type"],
+        "start_timestamp": "2017-01-01T00:00:00",
+        "end_timestamp": "2022-12-31T23:59:59",
+    }
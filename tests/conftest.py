@@ -0,0 +1,19 @@
+import json
+import pytest
+
+SAMPLE_INPUT_DIR = "tests/sample-input"
+
+def load_sample_input(name):
+    """Loads the `json_data` document of a file under tests/sample-input."""
+    with open(f"{SAMPLE_INPUT_DIR}/{name}", "r") as file:
+        return json.load(file)["json_data"]
+
+@pytest.fixture
+def sample_input():
+    """Loads sample input files by name, as fresh copies the test may change."""
+    return load_sample_input
+
+@pytest.fixture
+def realistic_data():
+    """A fresh copy of the realistic sample dataset."""
+    return load_sample_input("realistic_input.json")
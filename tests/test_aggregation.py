@@ -0,0 +1,115 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.aggregation import aggregate
+from app.cache import results
+from app.main import Metric, app
+
+client = TestClient(app)
+
+@pytest.fixture
+def sales(realistic_data):
+    return [event for event in realistic_data["events"] if event["event_type"] == "sales report"]
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    results.clear()
+    yield
+    results.clear()
+
+def test_aggregate_by_suburb(sales):
+    """Test grouped count and price metrics against a hand-rolled reference."""
+    aggregations = aggregate(sales, ["suburb"], metrics=[
+        Metric(op="count"),
+        Metric(op="mean", attribute="price"),
+        Metric(op="max", attribute="price"),
+        Metric(op="percentile", attribute="price", percentile=50),
+    ])
+    suburbs = sorted({event["attribute"]["suburb"] for event in sales})
+    assert [entry["group"] for entry in aggregations] == [{"suburb": suburb} for suburb in suburbs]
+    for entry in aggregations:
+        group_prices = [e["attribute"]["price"] for e in sales if e["attribute"]["suburb"] == entry["group"]["suburb"]]
+        assert entry["count"] == len(group_prices)
+        assert entry["mean_price"] == pytest.approx(sum(group_prices) / len(group_prices))
+        assert entry["max_price"] == max(group_prices)
+        assert "p50_price" in entry
+
+def test_aggregate_extreme_percentiles(realistic_data, sales):
+    """Test that p0 and p100 are the minimum and maximum."""
+    aggregations = aggregate(sales, metrics=[
+        Metric(op="percentile", attribute="price", percentile=0),
+        Metric(op="percentile", attribute="price", percentile=100),
+    ])
+    prices = [event["attribute"]["price"] for event in sales]
+    assert aggregations[0]["p0_price"] == min(prices)
+    assert aggregations[0]["p100_price"] == max(prices)
+
+    response = client.post("/filter-data", json={"json_data": realistic_data, "aggregate": {
+        "metrics": [{"op": "percentile", "attribute": "price", "percentile": 0}],
+    }})
+    assert response.status_code == 200
+
+def test_aggregate_time_bucket(sales):
+    """Test grouping by calendar period of the event timestamp."""
+    aggregations = aggregate(sales, time_bucket="year")
+    assert sum(entry["count"] for entry in aggregations) == len(sales)
+    assert [entry["group"]["year"] for entry in aggregations] == sorted({e["time_object"]["timestamp"][:4] for e in sales})
+
+def test_aggregate_missing_and_non_numeric_values():
+    """Test that missing attributes form their own group and non-numeric values are ignored."""
+    events = [
+        {"time_object": {}, "event_type": "t", "attribute": {"kind": "a", "price": 10}},
+        {"time_object": {}, "event_type": "t", "attribute": {"kind": "a", "price": "n/a"}},
+        {"time_object": {}, "event_type": "t", "attribute": {"price": 4}},
+    ]
+    aggregations = aggregate(events, ["kind"], metrics=[Metric(op="count", attribute="price"), Metric(op="sum", attribute="price")])
+    assert aggregations == [
+        {"group": {"kind": "a"}, "count_price": 2, "sum_price": 10.0},
+        {"group": {"kind": None}, "count_price": 1, "sum_price": 4.0},
+    ]
+    assert aggregate([], metrics=[Metric(op="count"), Metric(op="mean", attribute="price")]) == [
+        {"group": {}, "count": 0, "mean_price": None}
+    ]
+
+def test_filter_data_aggregate_endpoint(realistic_data, sales):
+    """Test that /filter-data returns aggregations over the filtered events."""
+    body = {
+        "json_data": realistic_data,
+        "event_type": ["sales report"],
+        "include_attributes": ["price"],  # Projection does not affect grouping
+        "aggregate": {"group_by": ["suburb"], "metrics": [{"op": "count"}]},
+    }
+    response = client.post("/filter-data", json=body)
+    assert response.status_code == 200
+    assert response.json()["aggregations"] == aggregate(sales, ["suburb"])
+    assert "filtered_data" not in response.json()
+
+    # Aggregated and plain responses are cached separately
+    plain = client.post("/filter-data", json={**body, "aggregate": None})
+    assert plain.headers["X-Cache"] == "MISS"
+    assert len(plain.json()["filtered_data"]) == len(sales)
+    assert client.post("/filter-data", json=body).headers["X-Cache"] == "HIT"
+
+def test_dataset_and_fast_aggregate_endpoints(realistic_data, sales):
+    """Test aggregation on stored datasets and the fast endpoint."""
+    query = {"event_type": ["sales report"], "aggregate": {"metrics": [{"op": "median", "attribute": "price"}]}}
+    expected = aggregate(sales, metrics=[Metric(op="median", attribute="price")])
+
+    dataset_id = client.post("/datasets", content=json.dumps(realistic_data)).json()["dataset_id"]
+    response = client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    assert response.json()["aggregations"] == expected
+
+    response = client.post("/filter-data/fast", json={**query, "json_data": realistic_data})
+    assert response.json()["aggregations"] == expected
+
+@pytest.mark.parametrize("aggregation", [
+    {"metrics": [{"op": "mean"}]},
+    {"metrics": [{"op": "percentile", "attribute": "price"}]},
+    {"metrics": [{"op": "percentile", "attribute": "price", "percentile": 101}]},
+    {"metrics": [{"op": "mode", "attribute": "price"}]},
+    {"time_bucket": "hour"},
+])
+def test_invalid_aggregations(aggregation, realistic_data):
+    """Test that malformed aggregation specs are rejected."""
+    response = client.post("/filter-data", json={"json_data": realistic_data, "aggregate": aggregation})
+    assert response.status_code == 422
@@ -0,0 +1,70 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.batch import select_batch
+from app.datasets import StoredDataset
+from app.main import app
+from app.preprocessing import FilterPlan, process_data
+
+client = TestClient(app)
+
+plans = [
+    FilterPlan(["sales report"]),
+    FilterPlan(["sales report", "market update"], end_timestamp="2023-09-01T00:00:00"),
+    FilterPlan(["sales report"], filters=[MagicMock(attribute="suburb", operator="not_in", values=["NELSON BAY"])]),
+    FilterPlan(["sales report"], filters=[MagicMock(attribute="unit_number", operator="null", values=[])]),
+    FilterPlan([]),
+]
+
+@pytest.mark.parametrize("engine", ["python", "columnar", "auto"])
+def test_select_batch_matches_single_queries(engine, realistic_data):
+    """Test that a batch returns what each plan returns on its own."""
+    assert select_batch(plans, realistic_data, engine=engine) == [plan.select(realistic_data) for plan in plans]
+
+def test_select_batch_skips_invalid_timestamps():
+    """Test that invalid timestamps are excluded from every query of a batch."""
+    data = {"events": [
+        {"time_object": {"timestamp": "invalid"}, "event_type": "t", "attribute": {}},
+        {"time_object": {}, "event_type": "t", "attribute": {}},
+        {"time_object": {"timestamp": "2024-01-01"}, "event_type": ["t"], "attribute": {}},
+    ]}
+    assert select_batch([FilterPlan(["t"]), FilterPlan(["t"], start_timestamp="2020-01-01")], data) == [[data["events"][1]]] * 2
+
+def test_filter_data_batch_endpoint(realistic_data):
+    """Test the batch endpoint against one /filter-data call per query."""
+    queries = [
+        {"event_type": ["sales report"], "include_attributes": ["price"]},
+        {"event_type": ["sales report"], "filters": [{"attribute": "price", "operator": "gte", "values": [1000000]}]},
+        {"event_type": ["sales report"], "limit": 2, "sort_by": "price", "descending": True},
+        {"event_type": ["sales report"], "aggregate": {"group_by": ["suburb"]}},
+    ]
+    response = client.post("/filter-data/batch", json={"json_data": realistic_data, "queries": queries})
+    assert response.status_code == 200
+    expected = [client.post("/filter-data", json={"json_data": realistic_data, **query}).json() for query in queries]
+    assert response.json() == {"status": "success", "results": expected}
+
+def test_dataset_batch_endpoint(realistic_data):
+    """Test batches over a stored dataset."""
+    dataset_id = client.post("/datasets", content=json.dumps(realistic_data)).json()["dataset_id"]
+    queries = [{"event_type": ["sales report"]}, {"event_type": ["market update"]}]
+    response = client.post(f"/datasets/{dataset_id}/filter-data/batch", json={"queries": queries})
+    assert [result["filtered_data"] for result in response.json()["results"]] == [
+        process_data(realistic_data, query["event_type"]) for query in queries
+    ]
+
+@pytest.mark.parametrize("engine", ["python", "columnar", "auto"])
+def test_stored_dataset_select_batch(engine, realistic_data):
+    """Test batches over a stored dataset split into segments with a removed event."""
+    events = realistic_data["events"]
+    dataset = StoredDataset("batch", {"events": events[:6]}, 0)
+    dataset.append(events[6:], max_bytes=10 ** 9)
+    dataset.remove([events[0]["attribute"]["transaction_id"]])
+    data = {"events": dataset.events}
+    assert dataset.select_batch(plans, engine=engine) == [plan.select(data) for plan in plans]
+
+def test_batch_validation(realistic_data):
+    """Test that empty batches and missing events are rejected."""
+    assert client.post("/filter-data/batch", json={"json_data": realistic_data, "queries": []}).status_code == 422
+    response = client.post("/filter-data/batch", json={"json_data": {"x": 1}, "queries": [{}]})
+    assert response.status_code == 400
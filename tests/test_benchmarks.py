@@ -0,0 +1,24 @@
+import pytest
+from app.preprocessing import process_data
+from benchmarks import suite
+from benchmarks.synthetic import TIMESTAMP_FORMATS, generate, query
+
+@pytest.mark.parametrize("timestamp_format", [*TIMESTAMP_FORMATS, "mixed"])
+def test_generated_timestamps_parse(timestamp_format):
+    """Test that every synthetic timestamp format is accepted by the filter."""
+    data = generate(50, timestamp_format=timestamp_format)
+    assert len(process_data(data, event_types=["sales report", "market update", "rental listing"])) == 50
+
+def test_generator_shape():
+    """Test the generator's attribute count, cardinality and repeatability."""
+    data = generate(200, attributes=6, cardinality=3, seed=1)
+    assert all(len(event["attribute"]) == 6 for event in data["events"])
+    assert len({event["attribute"]["suburb"] for event in data["events"]}) == 3
+    assert generate(200, attributes=6, cardinality=3, seed=1) == data
+
+def test_suite_smoke():
+    """Test that the benchmark suite runs end to end and compares result files."""
+    document = suite.run(300, repeat=1, requests=2)
+    assert document["parameters"]["matches"] == len(suite.FilterQuery.model_validate(query()).to_plan().select(generate(300)))
+    assert {"filter.python", "http.filter-data", "memory.process_data.python"} <= document["results"].keys()
+    assert all(change["regression"] == pytest.approx(0) for change in suite.compare(document, document))
@@ -0,0 +1,72 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.main import app
+from app.cache import ResultCache, plan_key, render_json, results
+from app.preprocessing import FilterPlan
+
+client = TestClient(app)
+
+test_input = {
+    "json_data": {"events": [
+        {"time_object": {"timestamp": "2024-01-01T00:00:00"}, "event_type": "type1", "attribute": {"key": "välue", "price": 1}},
+        {"time_object": {"timestamp": "2024-02-01T00:00:00"}, "event_type": "type2", "attribute": {"key": "other", "price": 2}},
+    ]},
+    "event_type": ["type1", "type2"],
+    "filters": [{"attribute": "key", "values": ["välue", "other"]}],
+}
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    results.clear()
+    yield
+    results.clear()
+
+def test_filter_data_cache_hit_and_miss():
+    """Test that repeated /filter-data requests are served from the cache."""
+    first = client.post("/filter-data", json=test_input)
+    assert first.headers["x-cache"] == "MISS"
+    hits = results.hits
+    reordered = dict(test_input, event_type=["type2", "type1", "type1"], filters=[{"attribute": "key", "values": ["other", "välue"]}])
+    second = client.post("/filter-data", json=reordered)
+    assert second.headers["x-cache"] == "HIT"
+    assert second.content == first.content
+    assert results.hits == hits + 1
+    assert json.loads(first.content)["filtered_data"][0]["attribute"]["key"] == "välue"
+
+def test_filter_data_cache_control():
+    """Test the cache bypass headers."""
+    client.post("/filter-data", json=test_input)
+    assert client.post("/filter-data", json=test_input, headers={"Cache-Control": "no-cache"}).headers["x-cache"] == "MISS"
+    assert client.post("/filter-data", json=test_input, headers={"Cache-Control": "no-store"}).headers["x-cache"] == "BYPASS"
+    other_data = dict(test_input, json_data={"events": test_input["json_data"]["events"][:1]})
+    assert client.post("/filter-data", json=other_data).headers["x-cache"] == "MISS"
+    stats = client.get("/cache/stats").json()
+    assert stats["entries"] == 2
+
+def test_plan_key_normalization():
+    """Test that equivalent plans share a key and different plans do not."""
+    filters = [MagicMock(attribute="a", values=[2, 1])]
+    assert plan_key(FilterPlan(["x", "y"], filters=filters, start_timestamp="2024-01-01")) == plan_key(
+        FilterPlan(["y", "x"], filters=[MagicMock(attribute="a", values=[1, 2, 2])], start_timestamp="2024-01-01T00:00:00")
+    )
+    assert plan_key(FilterPlan(["x"], include_attributes=["a"])) != plan_key(FilterPlan(["x"]))
+
+def test_result_cache_ttl_and_eviction():
+    """Test that entries expire and the byte budget is respected."""
+    now = [0.0]
+    cache = ResultCache(max_bytes=10, ttl_seconds=5, clock=lambda: now[0])
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"123")
+    assert cache.get("b") is None and cache.evictions == 1
+    now[0] = 6.0
+    assert cache.get("a") is None
+    assert cache.stats()["size_bytes"] == 3 and cache.stats()["entries"] == 1
+
+def test_render_json_matches_fastapi():
+    """Test that cached bodies match FastAPI's own encoding."""
+    content = {"status": "success", "filtered_data": [{"a": "é", "b": [1, 2.5, None]}]}
+    assert render_json(content) == b'{"status":"success","filtered_data":[{"a":"\xc3\xa9","b":[1,2.5,null]}]}'
@@ -0,0 +1,60 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from app import batch, preprocessing, settings
+from app.columnar import ColumnarUnsupported, EventColumns
+from app.preprocessing import FilterPlan, process_data
+
+@pytest.mark.parametrize("sample", ["realistic_input.json", "input1.json"])
+@pytest.mark.parametrize("kwargs", [
+    {"event_types": ["sales report"]},
+    {"event_types": ["sales report", "market update"], "include_attributes": ["price", "suburb"]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="suburb", values=["NELSON BAY", "SALAMANDER BAY"])]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="unit_number", values=[None])]},
+    {"event_types": ["sales report"], "start_timestamp": "2023-09-05T00:00:00", "end_timestamp": "2024-08-13"},
+    {"event_types": []},
+])
+def test_columnar_engine_matches_python_engine(sample, kwargs, sample_input):
+    """Test that the columnar engine returns exactly what the row-wise scan returns."""
+    data = sample_input(sample)
+    expected = process_data(data, engine="python", **kwargs)
+    actual = process_data(data, engine="columnar", **kwargs)
+    assert json.dumps(actual) == json.dumps(expected)
+
+def test_columnar_engine_invalid_and_missing_timestamps():
+    """Test that missing timestamps pass and invalid ones are dropped."""
+    data = {"events": [
+        {"time_object": {}, "event_type": "type1", "attribute": {}},
+        {"time_object": {"timestamp": "invalid"}, "event_type": "type1", "attribute": {}},
+        {"time_object": {"timestamp": "2024-01-01"}, "event_type": "type1", "attribute": {}},
+    ]}
+    columns = EventColumns(data["events"])
+    assert columns.select(FilterPlan(["type1"])).tolist() == [0, 2]
+    assert columns.select(FilterPlan(["type1"], start_timestamp="2025-01-01")).tolist() == [0]
+
+def test_columnar_engine_falls_back_for_unhashable_values():
+    """Test that datasets the columnar engine cannot encode use the row-wise scan."""
+    data = {"events": [{"time_object": {}, "event_type": ["type1"], "attribute": {}}]}
+    with pytest.raises(ColumnarUnsupported):
+        EventColumns(data["events"])
+    assert process_data(data, event_types=["type1"], engine="columnar") == []
+
+def test_invalid_engine():
+    """Test that unknown engines are rejected."""
+    with pytest.raises(ValueError, match="Invalid engine"):
+        process_data({"events": []}, event_types=["type1"], engine="gpu")
+
+def test_auto_engine_builds_columns_only_for_large_batches(monkeypatch, realistic_data):
+    """Test that "auto" scans inline events row-wise, unless a batch shares the columns between enough plans."""
+    built = []
+    monkeypatch.setattr(settings, "COLUMNAR_MIN_EVENTS", 0)
+    monkeypatch.setattr(settings, "BATCH_COLUMNAR_MIN_QUERIES", 3)
+    monkeypatch.setattr(batch, "EventColumns", lambda events: built.append(events) or EventColumns(events))
+    monkeypatch.setattr(preprocessing, "EventColumns", lambda events: built.append(events) or EventColumns(events))
+    plans = [FilterPlan(["sales report"]), FilterPlan(["market update"]), FilterPlan(["sales report"], start_timestamp="2024-01-01")]
+    expected = [plan.select(realistic_data, engine="python") for plan in plans]
+    assert [plan.select(realistic_data, engine="auto") for plan in plans] == expected
+    assert batch.select_batch(plans[:2], realistic_data, engine="auto") == expected[:2]
+    assert built == []
+    assert batch.select_batch(plans, realistic_data, engine="auto") == expected
+    assert len(built) == 1
@@ -0,0 +1,105 @@
+import gzip
+import json
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.cache import results
+from app.compression import ENCODINGS, CompressionMiddleware, negotiate
+from app.main import app
+from app.preprocessing import process_data
+
+client = TestClient(app)
+
+@pytest.fixture
+def expected(realistic_data):
+    return process_data(realistic_data, event_types=["sales report"])
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    results.clear()
+    yield
+    results.clear()
+
+def test_negotiate():
+    """Test Accept-Encoding negotiation."""
+    assert negotiate(None) is None
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("br, gzip;q=0.5") == "gzip"
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("identity") is None
+    assert negotiate("*") == ENCODINGS[0]
+
+def test_gzip_request_body(realistic_data, expected):
+    """Test that gzip request bodies are decoded before validation."""
+    body = gzip.compress(json.dumps({"json_data": realistic_data, "event_type": ["sales report"]}).encode())
+    response = client.post("/filter-data", content=body, headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+    assert response.status_code == 200
+    assert response.json()["filtered_data"] == expected
+
+def test_gzip_streamed_upload(realistic_data, expected):
+    """Test that streaming endpoints decode gzip bodies chunk by chunk."""
+    compressed = gzip.compress(json.dumps(realistic_data).encode())
+    chunks = (compressed[start:start + 100] for start in range(0, len(compressed), 100))
+    response = client.post("/filter-data/stream?event_type=sales%20report", content=chunks, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.json()["filtered_data"] == expected
+
+def test_invalid_request_encodings(realistic_data):
+    """Test corrupt, truncated and unsupported request encodings."""
+    headers = {"Content-Type": "application/json"}
+    response = client.post("/filter-data", content=b"not gzip", headers={**headers, "Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    truncated = gzip.compress(json.dumps({"json_data": realistic_data}).encode())[:-10]
+    response = client.post("/datasets", content=truncated, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    response = client.post("/filter-data", content=b"{}", headers={**headers, "Content-Encoding": "br"})
+    assert response.status_code == 415
+
+def test_decompressed_size_cap():
+    """Test that a body decoding past the size cap is refused with 413."""
+    capped = FastAPI()
+    capped.add_middleware(CompressionMiddleware, max_decompressed_size=10_000)
+
+    @capped.post("/echo")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    capped_client = TestClient(capped)
+    headers = {"Content-Encoding": "gzip"}
+    response = capped_client.post("/echo", content=gzip.compress(b"0" * 10_000), headers=headers)
+    assert response.json() == {"size": 10_000}
+    response = capped_client.post("/echo", content=gzip.compress(b"0" * 10_000_000), headers=headers)
+    assert response.status_code == 413
+
+def test_compressed_responses(realistic_data, expected):
+    """Test that large responses are compressed and small ones are not."""
+    body = {"json_data": realistic_data, "event_type": ["sales report"]}
+    response = client.post("/filter-data", json=body, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.json()["filtered_data"] == expected
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+    response = client.post("/filter-data", json=body, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+def test_compressed_ndjson_stream(realistic_data, expected):
+    """Test that streamed responses are compressed incrementally."""
+    body = {"json_data": realistic_data, "event_type": ["sales report"]}
+    response = client.post("/filter-data", json=body, headers={"Accept": "application/x-ndjson", "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+def test_zstd_round_trip(realistic_data, expected):
+    """Test zstd request and response bodies when zstandard is installed."""
+    zstandard = pytest.importorskip("zstandard")
+    body = zstandard.ZstdCompressor().compress(json.dumps({"json_data": realistic_data, "event_type": ["sales report"]}).encode())
+    response = client.post(
+        "/filter-data",
+        content=body,
+        headers={"Content-Encoding": "zstd", "Content-Type": "application/json", "Accept-Encoding": "zstd"},
+    )
+    assert response.headers["Content-Encoding"] == "zstd"
+    assert response.json()["filtered_data"] == expected
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.datasets import DatasetStore, DatasetTooLarge, StoredDataset, datasets
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def empty_store():
+    datasets.clear()
+    yield
+    datasets.clear()
+
+def upload(data):
+    body = json.dumps(data).encode("utf-8")
+    response = client.post("/datasets", content=body)
+    assert response.status_code == 200
+    assert response.json()["dataset_id"] == hashlib.sha256(body).hexdigest()
+    return response.json()["dataset_id"]
+
+def test_upload_and_query_dataset(realistic_data):
+    """Test that a stored dataset answers queries like /filter-data."""
+    data = realistic_data
+    dataset_id = upload(data)
+    queries = [
+        {"event_type": ["sales report"], "include_attributes": ["price", "suburb"]},
+        {"event_type": ["sales report", "market update"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY"]}]},
+        {"event_type": ["sales report"], "start_timestamp": "2023-09-01T00:00:00", "engine": "python"},
+    ]
+    for query in queries:
+        expected = client.post("/filter-data", json={"json_data": data, **query}).json()
+        response = client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+        assert response.status_code == 200
+        assert response.json() == expected
+
+def test_describe_and_delete_dataset():
+    """Test dataset metadata and removal."""
+    dataset_id = upload({"events": [{"time_object": {}, "event_type": "type1"}]})
+    assert upload({"events": [{"time_object": {}, "event_type": "type1"}]}) == dataset_id
+    assert len(datasets) == 1
+    response = client.get(f"/datasets/{dataset_id}")
+    assert response.json()["event_count"] == 1
+    assert client.delete(f"/datasets/{dataset_id}").status_code == 200
+    assert client.get(f"/datasets/{dataset_id}").status_code == 404
+    assert client.post(f"/datasets/{dataset_id}/filter-data", json={}).status_code == 404
+
+def test_upload_invalid_datasets():
+    """Test upload validation."""
+    assert client.post("/datasets", content=b"{}").json()["detail"] == "No JSON data provided"
+    response = client.post("/datasets", content=b'{"dataset_type": "house sales"}')
+    assert response.json()["detail"] == "Invalid JSON format: Missing 'events' key"
+    assert client.post("/datasets", content=b'{"events": [').status_code == 400
+
+def test_store_evicts_least_recently_used():
+    """Test that the store stays within its byte budget."""
+    store = DatasetStore(max_bytes=100)
+    for name in ("a", "b", "c"):
+        store.put(StoredDataset(name, {"events": []}, 40))
+    assert "a" not in store and "b" in store and "c" in store
+    store.get("b")
+    store.put(StoredDataset("d", {"events": []}, 40))
+    assert "c" not in store and "b" in store
+    assert store.size_bytes == 80
+    with pytest.raises(DatasetTooLarge):
+        store.put(StoredDataset("e", {"events": []}, 101))
+
+def test_describe_dataset_index_stats(realistic_data):
+    """Test that index statistics are reported once a query has built them."""
+    dataset_id = upload(realistic_data)
+    assert "indexes" not in client.get(f"/datasets/{dataset_id}").json()
+    query = {"event_type": ["sales report"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY"]}]}
+    client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    description = client.get(f"/datasets/{dataset_id}").json()
+    assert description["partitions"] == 7  # One per month of the sample
+    assert description["indexed_partitions"] == 7
+    indexes = description["indexes"]
+    assert indexes["event_type"]["keys"] == 1
+    assert indexes["attribute.suburb"]["indexed"] is True
+    assert indexes["attribute.suburb"]["lookups"] == 6  # Not in the month without sales reports
+
+def reference(dataset_id, data, query):
+    """Asserts that a stored dataset answers a query like /filter-data over `data`, with every engine."""
+    expected = client.post("/filter-data", json={"json_data": data, **query}).json()
+    for engine in ("auto", "python", "columnar"):
+        response = client.post(f"/datasets/{dataset_id}/filter-data", json={**query, "engine": engine})
+        assert response.status_code == 200
+        assert response.json() == expected
+
+def test_append_and_remove_events(realistic_data):
+    """Test that appended and removed events are reflected in later queries."""
+    data = realistic_data
+    dataset_id = upload(data)
+    query = {"event_type": ["sales report"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY", "NEWCASTLE"]}]}
+    reference(dataset_id, data, query)
+
+    new_event = json.loads(json.dumps(data["events"][0]))
+    new_event["attribute"].update(transaction_id="AU999999", suburb="NEWCASTLE")
+    response = client.post(f"/datasets/{dataset_id}/events", json={"events": [new_event]})
+    assert response.status_code == 200
+    assert response.json()["appended"] == 1 and response.json()["event_count"] == 9
+    assert response.json()["dataset_id"] == dataset_id
+    data["events"].append(new_event)
+    reference(dataset_id, data, query)
+
+    response = client.post(f"/datasets/{dataset_id}/events/remove", json={"transaction_ids": ["AU123456", "AU999999", "missing"]})
+    assert response.json()["removed"] == 2 and response.json()["event_count"] == 7
+    data["events"] = [event for event in data["events"] if event["attribute"].get("transaction_id") not in ("AU123456", "AU999999")]
+    reference(dataset_id, data, query)
+
+def test_upsert_events(realistic_data):
+    """Test that upserted events replace the stored events with the same transaction_id."""
+    data = realistic_data
+    dataset_id = upload(data)
+    first, second = (json.loads(json.dumps(data["events"][0])) for _ in range(2))
+    first["attribute"]["price"] = 1
+    second["attribute"]["price"] = 2  # The last of several events with one ID wins
+    untracked = {"time_object": {"timestamp": "2024-01-01T00:00:00"}, "event_type": "sales report", "attribute": {}}
+    response = client.post(f"/datasets/{dataset_id}/events", json={"events": [first, second, untracked], "upsert": True})
+    assert response.json()["appended"] == 2 and response.json()["replaced"] == 1
+
+    data["events"] = data["events"][1:] + [second, untracked]
+    reference(dataset_id, data, {"event_type": ["sales report", "market update"]})
+    reference(dataset_id, data, {"event_type": ["sales report"], "filters": [{"attribute": "price", "values": [1, 2]}]})
+
+def test_updates_only_index_new_events(realistic_data):
+    """Test that appends leave the structures built for earlier events in place."""
+    data = realistic_data
+    data["events"] = data["events"] * 8
+    dataset_id = upload(data)
+    query = {"event_type": ["sales report"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY"]}]}
+    client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    dataset = datasets.get(dataset_id)
+    partition = dataset._segments[0].partitions[0]
+    index = partition._index
+    assert index is not None
+
+    client.post(f"/datasets/{dataset_id}/events", json={"events": data["events"][:2]})
+    assert dataset._segments[0].partitions[0] is partition and len(dataset._segments) == 2
+    client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    assert partition._index is index and index.stats["attribute.suburb"].lookups == 2
+
+def test_many_updates_match_a_rebuilt_dataset():
+    """Test a long run of appends, upserts and removals against re-uploading the whole dataset."""
+    from benchmarks.synthetic import generate
+    data = generate(400, seed=1)
+    base, deltas = data["events"][:100], data["events"][100:]
+    dataset_id = upload({**data, "events": base})
+    expected = list(base)
+    for step in range(0, len(deltas), 20):
+        delta = deltas[step:step + 20]
+        client.post(f"/datasets/{dataset_id}/events", json={"events": delta})
+        expected.extend(delta)
+        if step % 60 == 0:
+            removed = {event["attribute"]["transaction_id"] for event in expected[step // 2:step // 2 + 15]}
+            client.post(f"/datasets/{dataset_id}/events/remove", json={"transaction_ids": sorted(removed)})
+            expected = [event for event in expected if event["attribute"]["transaction_id"] not in removed]
+        if step % 80 == 0:
+            replacement = json.loads(json.dumps(expected[3]))
+            replacement["attribute"]["price"] = 123
+            client.post(f"/datasets/{dataset_id}/events", json={"events": [replacement], "upsert": True})
+            expected = [event for event in expected if event["attribute"]["transaction_id"] != replacement["attribute"]["transaction_id"]]
+            expected.append(replacement)
+
+    description = client.get(f"/datasets/{dataset_id}").json()
+    assert description["event_count"] == len(expected)
+    assert description["segments"] <= 6
+    query = {"event_type": ["sales report", "rental listing"], "filters": [{"attribute": "suburb", "values": ["SUBURB 1", "SUBURB 2"]}]}
+    reference(dataset_id, {**data, "events": expected}, query)
+    reference(dataset_id, {**data, "events": expected}, {"event_type": ["sales report"], "start_timestamp": "2020-01-01T00:00:00"})
+
+def test_updates_invalidate_cached_results(realistic_data):
+    """Test that results cached before an update are not served after it."""
+    data = realistic_data
+    dataset_id = upload(data)
+    query = {"event_type": ["sales report"]}
+    before = client.post(f"/datasets/{dataset_id}/filter-data", json=query).json()["filtered_data"]
+    client.post(f"/datasets/{dataset_id}/events", json={"events": [data["events"][0]]})
+    response = client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(response.json()["filtered_data"]) == len(before) + 1
+
+def test_reupload_after_updates(realistic_data):
+    """Test that re-uploading the bytes of an updated dataset restores them, under a newer version."""
+    data = realistic_data
+    dataset_id = upload(data)
+    query = {"event_type": ["sales report", "market update"]}
+    version = client.post(f"/datasets/{dataset_id}/events/remove", json={"transaction_ids": ["AU123456"]}).json()["version"]
+
+    upload(data)
+    assert "version" not in client.get(f"/datasets/{dataset_id}").json()
+    reference(dataset_id, data, query)
+
+    # Deleted, re-uploaded and changed differently: a new version, not a stale cached one
+    client.post(f"/datasets/{dataset_id}/events", json={"events": [data["events"][0]]})
+    client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    client.delete(f"/datasets/{dataset_id}")
+    upload(data)
+    response = client.post(f"/datasets/{dataset_id}/events/remove", json={"transaction_ids": ["AU123456"]})
+    assert response.json()["version"] == version + 2
+    data["events"] = [event for event in data["events"] if event["attribute"].get("transaction_id") != "AU123456"]
+    reference(dataset_id, data, query)
+
+def test_update_errors():
+    """Test updates of missing datasets and past the store budget."""
+    assert client.post("/datasets/missing/events", json={"events": [{}]}).status_code == 404
+    assert client.post("/datasets/missing/events/remove", json={"transaction_ids": ["x"]}).status_code == 404
+    dataset_id = upload({"events": []})
+    assert client.post(f"/datasets/{dataset_id}/events", json={"events": []}).status_code == 422
+
+    event = {"time_object": {}, "event_type": "t", "attribute": {"text": "x" * 1000}}
+    store = DatasetStore(max_bytes=1500)
+    dataset = store.put(StoredDataset("a", {"events": []}, 100))
+    dataset.append([event], max_bytes=store.max_bytes)
+    with pytest.raises(DatasetTooLarge):
+        dataset.append([event], max_bytes=store.max_bytes)
+    assert dataset.event_count == 1
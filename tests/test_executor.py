@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from app.executor import QueryCancelled, QueryExecutor, QueueFull, check_cancelled
+from app.preprocessing import FilterPlan
+
+def test_executor_runs_off_the_event_loop():
+    """Test that queries run on worker threads and return their result."""
+    executor = QueryExecutor(max_concurrency=2, max_queue=0, timeout=5)
+    loop_thread = threading.get_ident()
+    assert asyncio.run(executor.run(threading.get_ident)) != loop_thread
+    assert executor.pending == 0
+
+def test_executor_rejects_when_queue_is_full():
+    """Test that queries beyond the concurrency and queue limits are rejected."""
+    executor = QueryExecutor(max_concurrency=1, max_queue=1, timeout=5)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFull):
+            await executor.run(lambda: None)
+        release.set()
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(scenario()) == [True, True]
+
+def test_executor_timeout_cancels_query():
+    """Test that a timed-out query is cancelled at its next check."""
+    executor = QueryExecutor(max_concurrency=1, max_queue=0, timeout=0.05)
+    outcome = []
+
+    def slow_query():
+        try:
+            while True:
+                time.sleep(0.01)
+                check_cancelled()
+        except QueryCancelled:
+            outcome.append("cancelled")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.run(slow_query))
+    deadline = time.monotonic() + 2
+    while not outcome and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert outcome == ["cancelled"]
+
+def test_cancelled_plan_stops_scanning():
+    """Test that a plan run under a cancelled query raises QueryCancelled."""
+    executor = QueryExecutor(max_concurrency=1, max_queue=0, timeout=0.01)
+    events = [{"time_object": {}, "event_type": "type1"}] * 10
+    started = threading.Event()
+    raised = []
+
+    def query():
+        started.set()
+        time.sleep(0.1)
+        try:
+            FilterPlan(["type1"]).apply({"events": events})
+        except QueryCancelled:
+            raised.append(True)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.run(query))
+    started.wait(1)
+    deadline = time.monotonic() + 2
+    while not raised and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert raised == [True]
+
+def test_filter_data_returns_429_when_busy(monkeypatch):
+    """Test that /filter-data sheds load once the query queue is full."""
+    from fastapi.testclient import TestClient
+    from app.main import app, queries
+    client = TestClient(app)
+    monkeypatch.setattr(queries, "pending", queries.max_concurrency + queries.max_queue)
+    test_input = {"json_data": {"events": [{"time_object": {}, "event_type": "type1"}]}, "event_type": ["type1"]}
+    response = client.post("/filter-data", json=test_input, headers={"Cache-Control": "no-store"})
+    assert response.status_code == 429
+    assert client.get("/").status_code == 200
+
+def test_streamed_queries_run_on_the_executor(monkeypatch):
+    """Test that NDJSON responses and /filter-data/stream are bounded by the query executor."""
+    from fastapi.testclient import TestClient
+    from app.main import app, queries
+    client = TestClient(app)
+    events = [{"time_object": {}, "event_type": "type1", "attribute": {}}]
+    test_input = {"json_data": {"events": events}, "event_type": ["type1"]}
+    ndjson = {"Accept": "application/x-ndjson"}
+    assert client.post("/filter-data", json=test_input, headers=ndjson).status_code == 200
+    assert client.post("/filter-data/stream?event_type=type1", content=json.dumps({"events": events})).status_code == 200
+
+    monkeypatch.setattr(queries, "pending", queries.max_concurrency + queries.max_queue)
+    assert client.post("/filter-data", json=test_input, headers=ndjson).status_code == 429
+    assert client.post("/filter-data/stream?event_type=type1", content=json.dumps({"events": events})).status_code == 429
+
+def test_session_holds_one_slot_and_one_deadline():
+    """Test that the steps of a session count as one pending query and share its timeout."""
+    executor = QueryExecutor(max_concurrency=1, max_queue=0, timeout=0.3)
+
+    async def scenario():
+        session = executor.session()
+        assert executor.pending == 1
+        with pytest.raises(QueueFull):
+            executor.session()
+        assert await session.run(time.sleep, 0.2) is None
+        with pytest.raises(asyncio.TimeoutError):
+            await session.run(time.sleep, 0.2)  # Within the timeout on its own, not after the first step
+        session.close()
+        session.close()
+        assert executor.pending == 0
+
+    asyncio.run(scenario())
+
+def test_ndjson_response_is_one_query(monkeypatch):
+    """Test that every chunk of an NDJSON response is computed under the session admitted before it started."""
+    from fastapi.testclient import TestClient
+    from app import main
+    client = TestClient(main.app)
+    sessions = []
+    open_session = main.queries.session
+    monkeypatch.setattr(main.queries, "session", lambda: sessions.append(open_session()) or sessions[-1])
+    events = [{"time_object": {}, "event_type": "type1", "attribute": {"n": n}} for n in range(5000)]
+    test_input = {"json_data": {"events": events}, "event_type": ["type1"]}
+    response = client.post("/filter-data", json=test_input, headers={"Accept": "application/x-ndjson", "Cache-Control": "no-store"})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 5000
+    assert len(sessions) == 1
+    assert main.queries.pending == 0
+
+def test_dataset_upload_is_parsed_on_the_executor(monkeypatch):
+    """Test that uploads are parsed and compacted on the query executor, and shed when it is busy."""
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.datasets import DatasetIngest, datasets
+    client = TestClient(main.app)
+    threads = []
+    feed = DatasetIngest.feed
+    monkeypatch.setattr(DatasetIngest, "feed", lambda self, chunk: threads.append(threading.current_thread().name) or feed(self, chunk))
+    body = json.dumps({"events": [{"time_object": {}, "event_type": "type1", "attribute": {}}]})
+    response = client.post("/datasets", content=body)
+    assert response.status_code == 200
+    assert threads and all(name.startswith("query") for name in threads)
+    datasets.clear()
+
+    monkeypatch.setattr(main.queries, "pending", main.queries.max_concurrency + main.queries.max_queue)
+    assert client.post("/datasets", content=body).status_code == 429
@@ -0,0 +1,51 @@
+import json
+from fastapi.testclient import TestClient
+from app import fastjson
+from app.main import app
+
+client = TestClient(app)
+
+def test_filter_data_fast_matches_filter_data(realistic_data):
+    """Test that /filter-data/fast returns the same result as /filter-data."""
+    test_input = {"json_data": realistic_data, "event_type": ["sales report"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY"]}]}
+    expected = client.post("/filter-data", json=test_input)
+    response = client.post("/filter-data/fast", json=test_input)
+    assert response.status_code == 200
+    assert response.json() == expected.json()
+
+def test_filter_data_fast_errors():
+    """Test /filter-data/fast validation."""
+    assert client.post("/filter-data/fast", content=b"{").status_code == 400
+    assert client.post("/filter-data/fast", json=[]).status_code == 400
+    assert client.post("/filter-data/fast", json={"json_data": {}}).json()["detail"] == "No JSON data provided"
+    response = client.post("/filter-data/fast", json={"json_data": {"time_object": {}}})
+    assert response.json()["detail"] == "Invalid JSON format: Missing 'events' key"
+    response = client.post("/filter-data/fast", json={"json_data": {"events": []}, "filters": [{"attribute": "a"}]})
+    assert response.status_code == 422
+    response = client.post("/filter-data/fast", json={"json_data": {"events": []}, "start_timestamp": "invalid-timestamp"})
+    assert response.status_code == 500
+    assert "Invalid start_timestamp format" in response.json()["detail"]
+
+def test_filter_data_fast_keeps_large_integers():
+    """Test that integers past 64 bits come back exactly as /filter-data returns them."""
+    large = 123456789012345678901234
+    test_input = {"json_data": {"events": [
+        {"time_object": {}, "event_type": "t", "attribute": {"id": large, "small": -(2 ** 63) - 1}},
+    ]}, "event_type": ["t"], "filters": [{"attribute": "id", "values": [large]}]}
+    body = json.dumps(test_input)
+    expected = client.post("/filter-data", content=body)
+    response = client.post("/filter-data/fast", content=body)
+    assert response.status_code == 200
+    assert response.json() == expected.json()
+    assert response.json()["filtered_data"][0]["attribute"]["id"] == large
+
+def test_loads_reads_large_integers_exactly():
+    """Test that only documents with long digit runs go through the standard library, with the same result."""
+    for document in [
+        {"id": 123456789012345678901234, "small": -(2 ** 63) - 1, "max": 2 ** 64 - 1},
+        {"id": "12345678901234567890", "price": 1.5},  # A false positive
+        {"id": 1234567890123456789, "price": 1e300},
+    ]:
+        body = json.dumps(document).encode("utf-8")
+        assert fastjson.loads(body) == document
+        assert [type(value) for value in fastjson.loads(body).values()] == [type(value) for value in document.values()]
@@ -0,0 +1,51 @@
+import pytest
+from unittest.mock import MagicMock
+from app.preprocessing import FilterPlan, iter_process_data, process_data
+
+test_data = {
+    "events": [
+        {"time_object": {"timestamp": "2024-01-01T00:00:00"}, "event_type": "type1", "attribute": {"key": "value", "other": 1}},
+        {"time_object": {"timestamp": "2024-02-01T00:00:00"}, "event_type": "type2", "attribute": {"key": "value", "other": 2}},
+        {"time_object": {"timestamp": "invalid"}, "event_type": "type1", "attribute": {"key": "value"}},
+    ]
+}
+
+def test_filter_plan_matches_process_data():
+    """Test that a compiled plan gives the same result as process_data."""
+    filters = [MagicMock(attribute="key", values=["value"])]
+    plan = FilterPlan(["type1", "type2"], filters=filters, include_attributes=["other"])
+    expected = process_data(test_data, event_types=["type1", "type2"], filters=filters, include_attributes=["other"])
+    assert plan.apply(test_data) == expected
+    assert [event["attribute"] for event in expected] == [{"other": 1}, {"other": 2}]
+
+def test_filter_plan_reused_across_datasets():
+    """Test that one plan can be applied to several datasets."""
+    plan = FilterPlan(["type1"], end_timestamp="2024-01-31T00:00:00")
+    assert len(plan.apply(test_data)) == 1
+    assert plan.apply({"events": []}) == []
+    assert plan.apply({"events": test_data["events"][:1] * 3}) == [plan.project(test_data["events"][0])] * 3
+
+def test_filter_plan_projection_copies_attributes():
+    """Test that projected events do not share the input attribute dict."""
+    plan = FilterPlan(["type1"])
+    result = plan.apply(test_data)
+    assert result[0]["attribute"] == test_data["events"][0]["attribute"]
+    assert result[0]["attribute"] is not test_data["events"][0]["attribute"]
+
+def test_filter_plan_unhashable_event_type():
+    """Test that events with unhashable event types are skipped."""
+    plan = FilterPlan(["type1"])
+    assert not plan.matches({"time_object": {}, "event_type": ["type1"]})
+
+def test_filter_plan_invalid_bounds():
+    """Test that invalid time bounds are rejected when the plan is built."""
+    with pytest.raises(ValueError, match="Invalid end_timestamp format"):
+        FilterPlan(["type1"], end_timestamp="not-a-date")
+
+def test_iter_process_data_is_lazy():
+    """Test that the generator variant yields the same events lazily."""
+    result = iter_process_data(test_data, event_types=["type1", "type2"])
+    assert next(result) == process_data(test_data, event_types=["type1", "type2"])[0]
+    assert len(list(result)) == 1
+    with pytest.raises(ValueError, match="Invalid start_timestamp format"):
+        iter_process_data(test_data, event_types=["type1"], start_timestamp="invalid")
@@ -0,0 +1,39 @@
+import pytest
+from unittest.mock import MagicMock
+from app.indexes import DatasetIndex
+from app.preprocessing import FilterPlan, process_data
+
+@pytest.mark.parametrize("kwargs", [
+    {"event_types": ["sales report"]},
+    {"event_types": ["sales report", "market update"], "include_attributes": ["price"]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="suburb", values=["NELSON BAY", "NOWHERE"])]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="price", values=[845000])]},
+    {"event_types": ["sales report"], "start_timestamp": "2023-09-05T00:00:00", "end_timestamp": "2024-01-15T00:00:00"},
+    {"event_types": ["nothing"]},
+])
+def test_index_matches_scan(kwargs, realistic_data):
+    """Test that index lookups return exactly the scan results."""
+    index = DatasetIndex(realistic_data["events"], max_cardinality=4)
+    assert index.apply(FilterPlan(**kwargs)) == process_data(realistic_data, **kwargs)
+
+def test_index_candidates_and_stats():
+    """Test that candidates are narrowed and index hits are counted."""
+    events = [
+        {"time_object": {"timestamp": "2024-01-01"}, "event_type": "a", "attribute": {"suburb": "X"}},
+        {"time_object": {"timestamp": "2024-02-01"}, "event_type": "a", "attribute": {"suburb": "Y"}},
+        {"time_object": {}, "event_type": "a", "attribute": {"suburb": "X"}},
+        {"time_object": {"timestamp": "2024-03-01"}, "event_type": "b", "attribute": {"suburb": "X"}},
+        {"time_object": {"timestamp": "2024-01-01"}, "event_type": "a", "attribute": {"suburb": ["X"]}},
+    ]
+    index = DatasetIndex(events[:4])
+    plan = FilterPlan(["a"], filters=[MagicMock(attribute="suburb", values=["X"])], start_timestamp="2024-01-15")
+    assert index.candidates(plan).tolist() == [2]
+    stats = index.describe()
+    assert stats["event_type"]["keys"] == 2
+    assert stats["attribute.suburb"]["lookups"] == 1
+    assert stats["timestamp"]["lookups"] == 1
+
+    unindexable = DatasetIndex(events)
+    plan = FilterPlan(["a"], filters=[MagicMock(attribute="suburb", values=["X"])])
+    assert unindexable.candidates(plan).tolist() == [0, 1, 2, 4]
+    assert unindexable.describe()["attribute.suburb"]["indexed"] is False
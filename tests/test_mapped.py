@@ -0,0 +1,76 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app import main
+from app.cache import results
+from app.mapped import MappedStore, convert
+from app.preprocessing import FilterPlan, process_data
+
+client = TestClient(main.app)
+
+@pytest.fixture
+def source(tmp_path, realistic_data):
+    path = tmp_path / "adage.json"
+    path.write_text(json.dumps(realistic_data))
+    return str(path)
+
+@pytest.fixture
+def mapped(source, tmp_path):
+    return convert(source, str(tmp_path / "datasets"))
+
+@pytest.mark.parametrize("query", [
+    {"event_types": ["sales report"]},
+    {"event_types": ["sales report", "market update"], "start_timestamp": "2023-09-01T00:00:00"},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="suburb", values=["NELSON BAY"])], "include_attributes": ["price"]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="price", operator="gt", values=[900000])]},
+    {"event_types": ["sales report"], "filters": [MagicMock(attribute="no_such_attribute", operator="null", values=[])]},
+])
+def test_mapped_matches_process_data(mapped, query, realistic_data):
+    """Test that queries on a mapped dataset match process_data on the source."""
+    plan = FilterPlan(query.pop("event_types"), **query)
+    assert mapped.apply(plan) == plan.apply(realistic_data)
+
+def test_mapped_round_trips_events(mapped, realistic_data):
+    """Test that mapped events decode back to the source events."""
+    assert list(mapped.events) == realistic_data["events"]
+    assert mapped.describe()["event_count"] == len(realistic_data["events"])
+
+def test_convert_is_idempotent(source, mapped, tmp_path):
+    """Test that converting the same file again reuses the dataset."""
+    again = convert(source, str(tmp_path / "datasets"))
+    assert again.dataset_id == mapped.dataset_id
+    assert len(list((tmp_path / "datasets").iterdir())) == 1
+
+def test_unhashable_attributes_fall_back_to_rows(tmp_path):
+    """Test filters on attributes that cannot be dictionary-encoded."""
+    data = {"events": [
+        {"time_object": {"timestamp": "2024-01-01"}, "event_type": "t", "attribute": {"tags": ["a"], "n": 1}},
+        {"time_object": {"timestamp": "2024-01-02"}, "event_type": "t", "attribute": {"tags": ["b"], "n": 2}},
+    ]}
+    path = tmp_path / "adage.json"
+    path.write_text(json.dumps(data))
+    dataset = convert(str(path), str(tmp_path / "datasets"))
+    filters = [MagicMock(attribute="tags", operator="exists", values=[]), MagicMock(attribute="n", operator="gte", values=[2])]
+    assert dataset.apply(FilterPlan(["t"], filters=filters)) == process_data(data, ["t"], filters=filters)
+
+def test_mapped_dataset_endpoint(mapped, tmp_path, monkeypatch, realistic_data):
+    """Test that mapped datasets are served by the dataset endpoints."""
+    monkeypatch.setattr(main, "mapped_datasets", MappedStore(str(tmp_path / "datasets")))
+    results.clear()
+    response = client.get(f"/datasets/{mapped.dataset_id}")
+    assert response.json()["storage"] == "mapped"
+
+    response = client.post(f"/datasets/{mapped.dataset_id}/filter-data", json={"event_type": ["sales report"], "limit": 2})
+    assert response.status_code == 200
+    assert response.json()["filtered_data"] == process_data(realistic_data, ["sales report"])[:2]
+
+    queries = [{"event_type": ["sales report"]}, {"event_type": ["market update"]}]
+    response = client.post(f"/datasets/{mapped.dataset_id}/filter-data/batch", json={"queries": queries})
+    assert [result["filtered_data"] for result in response.json()["results"]] == [
+        process_data(realistic_data, query["event_type"]) for query in queries
+    ]
+
+    assert client.get("/datasets/../etc").status_code == 404
+    response = client.post(f"/datasets/{mapped.dataset_id}/events", json={"events": realistic_data["events"][:1]})
+    assert response.status_code == 400
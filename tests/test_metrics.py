@@ -0,0 +1,95 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app import metrics
+from app.batch import BATCH_ENGINES, select_batch
+from app.cache import results
+from app.main import app
+from app.preprocessing import FilterPlan
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    results.clear()
+    yield
+    results.clear()
+
+def server_timing(response):
+    return dict(entry.split(";dur=") for entry in response.headers["Server-Timing"].split(", "))
+
+def test_server_timing_stages(realistic_data):
+    """Test that filter responses report the time spent in each stage."""
+    body = {"json_data": realistic_data, "event_type": ["sales report"]}
+    stages = server_timing(client.post("/filter-data", json=body, headers={"Cache-Control": "no-store"}))
+    assert {"read", "decode", "filter", "encode", "total"} <= set(stages)
+    assert all(float(duration) >= 0 for duration in stages.values())
+
+    stages = server_timing(client.post("/filter-data/fast", content=json.dumps(body)))
+    assert {"read", "parse", "validate", "filter", "encode", "total"} <= set(stages)
+
+def test_metrics_endpoint(realistic_data):
+    """Test that /metrics renders request histograms and engine counters."""
+    client.post("/filter-data", json={"json_data": realistic_data, "event_type": ["sales report"]})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE preprocessing_request_duration_seconds histogram" in text
+    assert 'preprocessing_request_duration_seconds_count{method="POST",route="/filter-data",status="200"}' in text
+    assert 'preprocessing_request_duration_seconds_bucket{method="POST",route="/filter-data",status="200",le="+Inf"}' in text
+    assert 'preprocessing_stage_duration_seconds_count{stage="filter"}' in text
+    assert "preprocessing_events_scanned_total" in text
+    assert "preprocessing_queries_pending 0" in text
+
+def test_routes_are_labelled_by_template():
+    """Test that path parameters do not leak into the metric labels."""
+    client.get("/datasets/not-a-dataset")
+    assert 'route="/datasets/{dataset_id}"' in client.get("/metrics").text
+    assert "not-a-dataset" not in client.get("/metrics").text
+
+def test_byte_counters(realistic_data):
+    """Test that request and response bytes are counted per route."""
+    before_in = metrics.REQUEST_BYTES.value("/filter-data")
+    before_out = metrics.RESPONSE_BYTES.value("/filter-data")
+    body = json.dumps({"json_data": realistic_data, "event_type": ["sales report"]})
+    response = client.post("/filter-data", content=body, headers={"Content-Type": "application/json", "Accept-Encoding": "identity"})
+    assert metrics.REQUEST_BYTES.value("/filter-data") - before_in == len(body)
+    assert metrics.RESPONSE_BYTES.value("/filter-data") - before_out == len(response.content)
+
+@pytest.mark.parametrize("engine", ["python", "columnar", "parallel"])
+def test_scan_counters(engine):
+    """Test that every engine counts scanned, matched and unparseable events alike."""
+    data = {"events": [
+        {"time_object": {"timestamp": "2024-01-01T00:00:00"}, "event_type": "t", "attribute": {}},
+        {"time_object": {"timestamp": "not a time"}, "event_type": "t", "attribute": {}},
+        {"time_object": {"timestamp": "not a time"}, "event_type": "other", "attribute": {}},
+    ]}
+    scanned = metrics.EVENTS_SCANNED.value()
+    matched = metrics.EVENTS_MATCHED.value()
+    failures = metrics.TIMESTAMP_FAILURES.value()
+    assert len(FilterPlan(["t"]).select(data, engine=engine)) == 1
+    assert metrics.EVENTS_SCANNED.value() - scanned == 3
+    assert metrics.EVENTS_MATCHED.value() - matched == 1
+    assert metrics.TIMESTAMP_FAILURES.value() - failures == 1
+    if engine not in BATCH_ENGINES:
+        return
+
+    scanned = metrics.EVENTS_SCANNED.value()
+    failures = metrics.TIMESTAMP_FAILURES.value()
+    select_batch([FilterPlan(["t"]), FilterPlan(["t", "other"])], data, engine=engine)
+    assert metrics.EVENTS_SCANNED.value() - scanned == 3  # One pass for the whole batch
+    assert metrics.TIMESTAMP_FAILURES.value() - failures == 2
+
+def test_histogram_buckets_are_cumulative():
+    """Test the Prometheus rendering of a histogram."""
+    histogram = metrics.Histogram("h", "help", ("label",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "a")
+    assert histogram.samples() == [
+        'h_bucket{label="a",le="0.1"} 1',
+        'h_bucket{label="a",le="1"} 2',
+        'h_bucket{label="a",le="+Inf"} 3',
+        'h_sum{label="a"} 5.55',
+        'h_count{label="a"} 3',
+    ]
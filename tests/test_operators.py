@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app.main import app
+from app.indexes import DatasetIndex
+from app.operators import AttributeFilter
+from app.parallel import apply_parallel
+from app.preprocessing import FilterPlan, process_data
+
+client = TestClient(app)
+
+@pytest.fixture
+def sales(realistic_data):
+    return [event["attribute"] for event in realistic_data["events"] if event["event_type"] == "sales report"]
+
+@pytest.fixture
+def prices(realistic_data):
+    def prices(filters):
+        plan = FilterPlan(["sales report"], filters=filters)
+        return sorted(event["attribute"]["price"] for event in plan.apply(realistic_data))
+    return prices
+
+def test_range_operators(prices):
+    """Test numeric range operators."""
+    all_prices = prices([])
+    assert prices([MagicMock(attribute="price", operator="gt", values=[1000000])]) == [p for p in all_prices if p > 1000000]
+    assert prices([MagicMock(attribute="price", operator="lte", values=[920000])]) == [p for p in all_prices if p <= 920000]
+    assert prices([MagicMock(attribute="price", operator="between", values=[800000, 1200000])]) == [p for p in all_prices if 800000 <= p <= 1200000]
+
+def test_membership_prefix_and_null_operators(sales, prices):
+    """Test not_in, prefix, exists and null operators."""
+    suburbs = [attributes["suburb"] for attributes in sales]
+    assert len(prices([MagicMock(attribute="suburb", operator="not_in", values=["NELSON BAY"])])) == len([s for s in suburbs if s != "NELSON BAY"])
+    assert len(prices([MagicMock(attribute="suburb", operator="prefix", values=["NEL", "SAL"])])) == len([s for s in suburbs if s.startswith(("NEL", "SAL"))])
+    units = [attributes["unit_number"] for attributes in sales]
+    assert len(prices([MagicMock(attribute="unit_number", operator="exists", values=[])])) == len([u for u in units if u is not None])
+    assert len(prices([MagicMock(attribute="missing_attribute", operator="null", values=[])])) == len(units)
+
+def test_operators_skip_incomparable_values():
+    """Test that range operators do not match values of another type."""
+    test = AttributeFilter("price", "gte", [10]).test
+    assert test(10) and not test("11") and not test(None)
+    with pytest.raises(ValueError, match="takes 2 value"):
+        AttributeFilter("price", "between", [1])
+    with pytest.raises(ValueError, match="Invalid filter operator"):
+        AttributeFilter("price", "near", [1])
+
+@pytest.mark.parametrize("filter_", [
+    MagicMock(attribute="price", operator="between", values=[800000, 1200000]),
+    MagicMock(attribute="suburb", operator="not_in", values=["NELSON BAY"]),
+    MagicMock(attribute="zoning_code", operator="prefix", values=["R"]),
+    MagicMock(attribute="unit_number", operator="null", values=[]),
+])
+def test_operators_agree_across_engines(filter_, realistic_data):
+    """Test that every engine evaluates operators identically."""
+    kwargs = {"event_types": ["sales report"], "filters": [filter_]}
+    expected = process_data(realistic_data, **kwargs)
+    assert process_data(realistic_data, engine="columnar", **kwargs) == expected
+    assert DatasetIndex(realistic_data["events"]).apply(FilterPlan(**kwargs)) == expected
+    assert apply_parallel(FilterPlan(**kwargs), realistic_data["events"], chunk_events=3) == expected
+
+def test_filter_data_operators_api(realistic_data):
+    """Test operator filters through /filter-data."""
+    test_input = {
+        "json_data": realistic_data,
+        "event_type": ["sales report"],
+        "filters": [{"attribute": "price", "operator": "lt", "values": [900000]}, {"attribute": "unit_number", "operator": "null"}],
+        "include_attributes": ["price"],
+    }
+    response = client.post("/filter-data", json=test_input)
+    assert response.status_code == 200
+    assert all(event["attribute"]["price"] < 900000 for event in response.json()["filtered_data"])
+
+@pytest.mark.parametrize("filter_", [
+    {"attribute": "price", "operator": "between", "values": [1]},
+    {"attribute": "price", "operator": "near", "values": [1]},
+    {"attribute": "price", "operator": "gt"},
+    {"attribute": "price", "values": [[1]]},
+    {"attribute": "price", "operator": "not_in", "values": [{"a": 1}]},
+])
+def test_filter_data_operator_validation(filter_):
+    """Test that malformed operator filters are rejected."""
+    response = client.post("/filter-data", json={"json_data": {"events": []}, "filters": [filter_]})
+    assert response.status_code == 422
+    response = client.post("/filter-data/fast", json={"json_data": {"events": []}, "filters": [filter_]})
+    assert response.status_code == 422
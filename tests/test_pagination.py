@@ -0,0 +1,89 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.cache import results
+from app.main import app
+from app.pagination import decode_cursor, encode_cursor, paginate
+from app.preprocessing import FilterPlan, process_data
+
+client = TestClient(app)
+
+@pytest.fixture
+def all_events(realistic_data):
+    return process_data(realistic_data, event_types=["sales report", "market update"])
+
+@pytest.fixture(autouse=True)
+def clear_results():
+    results.clear()
+    yield
+    results.clear()
+
+def test_unsorted_page_stops_scanning():
+    """Test that an unsorted page does not consume matches past the page."""
+    consumed = []
+    def matches():
+        for position in range(1000):
+            consumed.append(position)
+            yield position
+    assert paginate(matches(), offset=2, limit=3) == ([2, 3, 4], True)
+    assert len(consumed) == 6  # The page plus one to detect the next page
+
+def test_sorted_page_matches_full_sort(realistic_data, all_events):
+    """Test that the heap-based top-N agrees with sorting every match."""
+    for descending in (False, True):
+        priced = sorted(e["attribute"]["price"] for e in all_events if "price" in e["attribute"])
+        expected = (priced[::-1] if descending else priced)[1:4]
+        page = process_data(realistic_data, event_types=["sales report", "market update"], sort_by="price", descending=descending, limit=3, offset=1)
+        assert [e["attribute"]["price"] for e in page] == expected
+
+def test_sort_places_missing_values_last():
+    """Test that events without the sort attribute come last in either direction."""
+    events = [{"time_object": {}, "event_type": "t", "attribute": attrs} for attrs in ({}, {"n": 2}, {"n": "x"}, {"n": 1})]
+    for descending, expected in ((False, [{"n": 1}, {"n": 2}, {"n": "x"}, {}]), (True, [{"n": 2}, {"n": 1}, {"n": "x"}, {}])):
+        result = process_data({"events": events}, event_types=["t"], sort_by="n", descending=descending)
+        assert [e["attribute"] for e in result] == expected
+
+def test_sort_by_timestamp(realistic_data, all_events):
+    """Test ordering by parsed event timestamp, across engines."""
+    plan = FilterPlan(["sales report", "market update"])
+    expected = sorted(all_events, key=lambda e: e["time_object"]["timestamp"])[:4]
+    for engine in ("python", "columnar", "auto"):
+        assert plan.page(realistic_data, limit=4, sort_by="timestamp", engine=engine) == (expected, True)
+
+def test_cursor_round_trip():
+    """Test that cursors carry the offset and are tied to the sort order."""
+    cursor = encode_cursor(20, "price", True)
+    assert decode_cursor(cursor, "price", True) == 20
+    with pytest.raises(ValueError, match="different sort order"):
+        decode_cursor(cursor, "price", False)
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not-a-cursor", None, False)
+
+def test_filter_data_pages_through_cursor(realistic_data, all_events):
+    """Test walking every page of /filter-data with next_cursor."""
+    body = {"json_data": realistic_data, "event_type": ["sales report", "market update"], "limit": 3, "sort_by": "timestamp"}
+    pages = []
+    while True:
+        response = client.post("/filter-data", json=body)
+        assert response.status_code == 200
+        pages.extend(response.json()["filtered_data"])
+        if response.json()["next_cursor"] is None:
+            break
+        body["cursor"] = response.json()["next_cursor"]
+    assert pages == sorted(all_events, key=lambda e: e["time_object"]["timestamp"])
+
+def test_dataset_and_ndjson_pagination(realistic_data, all_events):
+    """Test pagination on stored datasets and streamed responses."""
+    dataset_id = client.post("/datasets", content=json.dumps(realistic_data)).json()["dataset_id"]
+    query = {"event_type": ["sales report", "market update"], "limit": 2, "offset": 1}
+    response = client.post(f"/datasets/{dataset_id}/filter-data", json=query)
+    assert response.json()["filtered_data"] == all_events[1:3]
+
+    response = client.post("/filter-data", json={**query, "json_data": realistic_data}, headers={"Accept": "application/x-ndjson"})
+    assert [json.loads(line) for line in response.text.splitlines()] == all_events[1:3]
+
+@pytest.mark.parametrize("options", [{"limit": 0}, {"offset": -1}, {"cursor": "bogus"}])
+def test_invalid_pagination(options, realistic_data):
+    """Test that invalid pagination options are rejected."""
+    response = client.post("/filter-data", json={"json_data": realistic_data, **options})
+    assert response.status_code == 422
@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+from app.parallel import apply_parallel
+from app.preprocessing import FilterPlan, process_data
+
+def test_parallel_engine_matches_python_engine(sample_input):
+    """Test that chunked parallel filtering preserves results and order."""
+    data = sample_input("input1.json")
+    data["events"] = data["events"] * 3
+    plan = FilterPlan(
+        ["sales report"],
+        filters=[MagicMock(attribute="suburb", values=["SALAMANDER BAY", "NELSON BAY"])],
+        include_attributes=["price", "suburb"],
+        start_timestamp="2024-08-01",
+    )
+    expected = plan.apply(data)
+    assert len(expected) > 0
+    assert apply_parallel(plan, data["events"], chunk_events=4) == expected
+
+def test_parallel_engine_falls_back_for_unserializable_events():
+    """Test that events the workers cannot receive are filtered in-process."""
+    data = {"events": [{"time_object": {}, "event_type": "type1", "attribute": {1: "x"}}] * 2}
+    assert process_data(data, event_types=["type1"], engine="parallel") == [data["events"][0]] * 2
+
+def test_parallel_engine_falls_back_for_non_finite_values():
+    """Test that NaN values, which would reach the workers as null, are checked in-process."""
+    data = {"events": [
+        {"time_object": {}, "event_type": "type1", "attribute": {"score": float("nan")}},
+        {"time_object": {}, "event_type": "type1", "attribute": {"score": None}},
+        {"time_object": {}, "event_type": "type1", "attribute": {"score": float("inf")}},
+        {"time_object": {"timestamp": None}, "event_type": "type1", "attribute": {"score": 1}},
+    ]}
+    for operator in ("exists", "null"):
+        filters = [MagicMock(attribute="score", operator=operator, values=[])]
+        expected = process_data(data, event_types=["type1"], filters=filters, engine="python")
+        assert process_data(data, event_types=["type1"], filters=filters, engine="parallel") == expected
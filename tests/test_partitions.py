@@ -0,0 +1,108 @@
+import pytest
+from unittest.mock import MagicMock
+from app import metrics, partitions
+from app.datasets import StoredDataset
+from app.partitions import PartitionIndexes, partition_events
+from app.preprocessing import FilterPlan, process_data
+from benchmarks.synthetic import generate
+
+
+def event(timestamp, event_type="a"):
+    return {"time_object": {"timestamp": timestamp} if timestamp is not None else {}, "event_type": event_type, "attribute": {}}
+
+events = [
+    event("2024-03-05T00:00:00"),
+    event("2024-01-31T23:59:59"),
+    event(None),
+    event("not a time"),
+    event("2024-01-01T00:00:00", "b"),
+    event("2023-12-31T23:59:59"),
+]
+
+def test_partition_events():
+    """Test that events are bucketed by month, with untimed and invalid events apart."""
+    found = {partition.label: partition.offsets.tolist() for partition in partition_events(events, months=1)}
+    assert found == {"2023-12": [5], "2024-01": [1, 4], "2024-03": [0], "untimed": [2], "invalid": [3]}
+
+    quarters = {partition.label: partition.offsets.tolist() for partition in partition_events(events, months=3)}
+    assert quarters == {"2023-10": [5], "2024-01": [0, 1, 4], "untimed": [2], "invalid": [3]}
+
+    assert [partition.label for partition in partition_events(events, months=0)] == ["all"]
+    assert [partition.label for partition in partition_events(events + ["not an event"], months=1)] == ["all"]
+
+    january = partition_events(events, months=1)[1]
+    assert january.timestamp_range[0] < january.timestamp_range[1]
+
+@pytest.mark.parametrize("window", [
+    {},
+    {"start_timestamp": "2019-03-01T00:00:00", "end_timestamp": "2019-03-31T23:59:59"},
+    {"start_timestamp": "2019-01-01T00:00:00", "end_timestamp": "2019-03-31T23:59:59"},
+    {"start_timestamp": "2019-03-15T12:00:00"},
+    {"end_timestamp": "2016-02-01T00:00:00"},
+    {"start_timestamp": "2030-01-01T00:00:00"},
+])
+def test_partitioned_queries_match_scan(window):
+    """Test that range queries over a partitioned dataset return exactly what process_data returns."""
+    data = generate(3000, attributes=3, cardinality=5, timestamp_format="mixed", seed=4)
+    data["events"] += [event(None, "sales report"), event("not a time", "sales report")]
+    dataset = StoredDataset("partitioned", data, 1)
+    kwargs = {"event_types": ["sales report", "market update"], "include_attributes": ["suburb"], **window}
+    assert dataset.apply(FilterPlan(**kwargs)) == process_data(data, **kwargs)
+
+    filters = [MagicMock(attribute="suburb", operator="in", values=["SUBURB 1"])]
+    assert dataset.apply(FilterPlan(filters=filters, **kwargs)) == process_data(data, filters=filters, **kwargs)
+
+def test_range_queries_only_index_their_partitions(realistic_data):
+    """Test that partitions outside the time window are never indexed."""
+    dataset = StoredDataset("partitioned", realistic_data, 1)
+    plan = FilterPlan(["sales report"], start_timestamp="2024-01-01T00:00:00", end_timestamp="2024-01-31T23:59:59")
+    assert dataset.select(plan) == process_data(realistic_data, ["sales report"], start_timestamp="2024-01-01T00:00:00", end_timestamp="2024-01-31T23:59:59")
+    indexed = [partition.label for partition in dataset._segments[0].partitions if partition._index is not None]
+    assert indexed == ["2024-01"]
+
+    explanation = dataset.explain(plan)["segments"][0]["partitions"]
+    assert [partition["partition"] for partition in explanation if not partition["pruned"]] == ["2024-01"]
+
+def test_removed_events_leave_their_partitions():
+    """Test that removals reach the partitions already built."""
+    data = {"events": [
+        {**event("2024-01-02T00:00:00"), "attribute": {"transaction_id": 1}},
+        {**event("2024-01-03T00:00:00"), "attribute": {"transaction_id": 2}},
+        {**event("not a time"), "attribute": {"transaction_id": 3}},
+        {**event("2024-02-03T00:00:00"), "attribute": {"transaction_id": 4}},
+        {**event("2024-02-04T00:00:00"), "attribute": {"transaction_id": 5}},
+    ]}
+    dataset = StoredDataset("partitioned", data, 1)
+    assert len(dataset.select(FilterPlan(["a"]))) == 4
+    dataset.remove([1, 3])  # Too few to rewrite the segment
+    assert [found["attribute"]["transaction_id"] for found in dataset.select(FilterPlan(["a"]))] == [2, 4, 5]
+    assert dataset._segments[0].partitions[-1].event_types == {"a": 0}
+
+def test_pruned_invalid_timestamps_are_counted():
+    """Test that skipping the partition of invalid timestamps still counts them as failures."""
+    dataset = StoredDataset("partitioned", {"events": events}, 1)
+    failures = metrics.TIMESTAMP_FAILURES.value()
+    dataset.select(FilterPlan(["a"]))
+    assert metrics.TIMESTAMP_FAILURES.value() - failures == 1
+
+def test_partition_indexes_are_evicted_least_recently_used(monkeypatch):
+    """Test that partition indexes past the budget are dropped and rebuilt on demand."""
+    budget = PartitionIndexes(max_events=3)
+    monkeypatch.setattr(partitions, "partition_indexes", budget)
+    dataset = StoredDataset("partitioned", {"events": events}, 1)
+    months = {partition.label: partition for partition in dataset._segments[0].partitions}
+
+    january = FilterPlan(["a", "b"], start_timestamp="2024-01-01T00:00:00", end_timestamp="2024-01-31T23:59:59")
+    march = FilterPlan(["a", "b"], start_timestamp="2024-03-01T00:00:00", end_timestamp="2024-03-31T23:59:59")
+    assert len(dataset.select(january)) == 3  # With the event without a timestamp
+    assert months["2024-01"]._index is not None and months["untimed"]._index is not None
+    assert len(budget) == 2 and budget.events == 3
+
+    assert len(dataset.select(march)) == 2
+    assert months["2024-01"]._index is None  # Least recently used
+    assert months["2024-03"]._index is not None and months["untimed"]._index is not None
+    assert budget.events == 2
+
+    assert len(dataset.select(january)) == 3  # Rebuilt on demand
+    assert months["2024-01"]._index is not None and months["2024-03"]._index is None
+    assert budget.events == 3
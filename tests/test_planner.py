@@ -0,0 +1,130 @@
+import json
+import pytest
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+from app import main
+from app.cache import results
+from app.datasets import datasets
+from app.indexes import DatasetIndex
+from app.main import app
+from app.mapped import MappedStore, convert
+from app.planner import QueryPlan
+from app.preprocessing import FilterPlan, process_data
+
+client = TestClient(app)
+
+events = [
+    {"time_object": {"timestamp": "2024-01-01T00:00:00"}, "event_type": "a", "attribute": {"id": 1, "suburb": "X"}},
+    {"time_object": {"timestamp": "2024-02-01T00:00:00"}, "event_type": "a", "attribute": {"id": 2, "suburb": "Y"}},
+    {"time_object": {}, "event_type": "a", "attribute": {"id": 3, "suburb": "X"}},
+    {"time_object": {"timestamp": "2024-03-01T00:00:00"}, "event_type": "b", "attribute": {"id": 4}},
+]
+invalid_event = {"time_object": {"timestamp": "not a time"}, "event_type": "a", "attribute": {"id": 5, "suburb": "X"}}
+
+def row_order(explanation):
+    return [predicate["predicate"] for predicate in explanation["predicates"] if predicate["evaluation"] == "row"]
+
+def evaluation(explanation, name):
+    return next(predicate["evaluation"] for predicate in explanation["predicates"] if predicate["predicate"] == name)
+
+@pytest.mark.parametrize("kwargs", [
+    {"event_types": ["a", "b"]},
+    {"event_types": ["a"], "start_timestamp": "2023-01-01", "end_timestamp": "2025-01-01"},
+    {"event_types": ["a"], "start_timestamp": "2024-01-15"},
+    {"event_types": ["a"], "filters": [MagicMock(attribute="suburb", operator="not_in", values=["Y"])]},
+    {"event_types": ["a", "b"], "filters": [MagicMock(attribute="id", operator="gte", values=[2])]},
+    {"event_types": ["c"]},
+    {"event_types": ["a"], "start_timestamp": "2025-01-01"},
+])
+@pytest.mark.parametrize("data", [events, events + [invalid_event]])
+@pytest.mark.parametrize("max_cardinality", [0, 4096])
+def test_planned_queries_match_scan(kwargs, data, max_cardinality):
+    """Test that planned queries return exactly what process_data returns, with or without attribute indexes."""
+    index = DatasetIndex(data, max_cardinality=max_cardinality)
+    assert index.apply(FilterPlan(**kwargs)) == process_data({"events": data}, **kwargs)
+
+def test_covering_window_skips_timestamp_parsing():
+    """Test that no timestamp is parsed when the window covers the whole dataset."""
+    index = DatasetIndex(events)
+    plan = FilterPlan(["a"], start_timestamp="2023-01-01", end_timestamp="2025-01-01")
+    assert len(index.select(plan)) == 3
+    assert plan.timestamps._cache == {}
+    assert evaluation(index.explain(plan), "timestamp") == "skipped"
+
+    index = DatasetIndex(events + [invalid_event])
+    plan = FilterPlan(["a"], start_timestamp="2023-01-01", end_timestamp="2025-01-01")
+    assert len(index.select(plan)) == 3  # Invalid timestamps are still excluded
+    assert evaluation(index.explain(plan), "timestamp") == "index"
+
+def test_predicates_are_ordered_by_rank():
+    """Test that a cheap selective filter is checked before the timestamp parse."""
+    data = [
+        {"time_object": {"timestamp": f"2024-01-{day:02d}T00:00:00"}, "event_type": "a", "attribute": {"id": day}}
+        for day in range(1, 29)
+    ] + [invalid_event]
+    index = DatasetIndex(data, max_cardinality=0)  # Only row checks for attributes
+    filters = [MagicMock(attribute="id", operator="in", values=[3])]
+    plan = FilterPlan(["a"], filters=filters)
+    explanation = index.explain(plan)
+    assert row_order(explanation) == ["filters[0]", "timestamp"]
+    assert evaluation(explanation, "event_type") == "skipped"  # Every event is of type "a"
+    assert index.apply(plan) == process_data({"events": data}, ["a"], filters=filters)
+
+    query = QueryPlan(plan, index.statistics)
+    assert query.predicates[0].name == "filters[0]"
+    assert query.predicates[0].selectivity < query.predicates[-1].selectivity
+
+def test_statistics():
+    """Test the statistics the planner reads off the indexes."""
+    index = DatasetIndex(events + [invalid_event])
+    index.explain(FilterPlan(["a"], filters=[MagicMock(attribute="suburb", operator="in", values=["X"])]))
+    statistics = index.statistics.to_dict()
+    assert statistics["event_count"] == 5
+    assert statistics["event_types"] == {"a": 4, "b": 1}
+    assert statistics["missing_timestamps"] == 1
+    assert statistics["invalid_timestamps"] == 1
+    assert statistics["timestamp_min"] < statistics["timestamp_max"]
+    assert statistics["attributes"] == {"suburb": {"distinct": 2, "present": 4}}
+
+def test_impossible_queries_short_circuit():
+    """Test that queries no event can match are answered without a lookup."""
+    timed = DatasetIndex([event for event in events if event["time_object"]])
+    for plan in (FilterPlan(["c"]), FilterPlan(["a"], start_timestamp="2020-01-01", end_timestamp="2020-02-01")):
+        explanation = timed.explain(plan)
+        assert explanation["short_circuit"] and explanation["candidates"] == 0
+        assert timed.select(plan) == []
+
+    # An event without a timestamp passes any window
+    plan = FilterPlan(["a"], start_timestamp="2020-01-01", end_timestamp="2020-02-01")
+    assert not DatasetIndex(events).explain(plan)["short_circuit"]
+    assert len(DatasetIndex(events).select(plan)) == 1
+
+def test_explain_endpoint(tmp_path, monkeypatch, realistic_data):
+    """Test explaining queries over uploaded and mapped datasets."""
+    results.clear()
+    datasets.clear()
+    dataset_id = client.post("/datasets", content=json.dumps(realistic_data)).json()["dataset_id"]
+    query = {"event_type": ["sales report"], "filters": [{"attribute": "suburb", "values": ["NELSON BAY"]}]}
+    response = client.post(f"/datasets/{dataset_id}/filter-data/explain", json=query)
+    assert response.status_code == 200
+    explanation = response.json()
+    assert explanation["engine"] == "index"
+    partitions = explanation["segments"][0]["partitions"]
+    assert sum(partition["event_count"] for partition in partitions) == len(realistic_data["events"])
+    plan = partitions[0]["plan"]
+    assert evaluation(plan, "filters[0]") == "index"
+    assert evaluation(plan, "timestamp") == "skipped"
+    assert sum(partition["plan"]["candidates"] for partition in partitions) == len(
+        client.post(f"/datasets/{dataset_id}/filter-data", json=query).json()["filtered_data"]
+    )
+
+    datasets.clear()  # The mapped copy has the same ID
+    source = tmp_path / "source.json"
+    source.write_text(json.dumps(realistic_data))
+    mapped = convert(str(source), str(tmp_path / "mapped"))
+    monkeypatch.setattr(main, "mapped_datasets", MappedStore(str(tmp_path / "mapped")))
+    explanation = client.post(f"/datasets/{mapped.dataset_id}/filter-data/explain", json=query).json()
+    assert explanation["engine"] == "columns"
+    assert evaluation(explanation["segments"][0], "event_type") == "columns"
+
+    assert client.post("/datasets/not-a-dataset/filter-data/explain", json=query).status_code == 404
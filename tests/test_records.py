@@ -0,0 +1,118 @@
+import json
+import tracemalloc
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from app import fastjson
+from app.datasets import datasets
+from app.main import app
+from app.preprocessing import FilterPlan
+from app.cache import render_json
+from app.preprocessing import process_data
+from app.records import Compactor, EventRecord, ProjectedEvent
+from app.streaming import iter_ndjson
+from benchmarks.synthetic import generate
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def clear_datasets():
+    datasets.clear()
+    yield
+    datasets.clear()
+
+def test_records_behave_like_events(realistic_data):
+    """Test that records read, compare and serialize like the source dicts."""
+    compactor = Compactor()
+    events = json.loads(json.dumps(realistic_data["events"]))
+    records = [compactor.event(event) for event in events]
+    assert all(isinstance(record, EventRecord) for record in records)
+    assert records == events
+    assert records[0]["event_type"] == events[0]["event_type"]
+    assert records[0].get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        records[0]["missing"]
+    assert json.loads(fastjson.dumps(records)) == events
+
+def test_compactor_shares_strings_and_time_objects(realistic_data):
+    """Test that repeated strings and time objects are stored once."""
+    compactor = Compactor()
+    first, second = (compactor.event(json.loads(json.dumps(realistic_data["events"][0]))) for _ in range(2))
+    assert first.time_object is second.time_object
+    assert first.event_type is second.event_type
+    assert next(iter(first.attribute)) is next(iter(second.attribute))
+
+def test_equal_time_objects_of_different_types_are_not_shared():
+    """Test that time object values which compare equal but differ in type keep their own JSON."""
+    events = [
+        {"time_object": {"timestamp": "2024-01-01T00:00:00", "duration": duration}, "event_type": "t", "attribute": {}}
+        for duration in (0, 0.0, False, 1, 1.0, True)
+    ]
+    data = {"events": events}
+    compactor = Compactor()
+    assert [type(compactor.event(event).time_object["duration"]) for event in events] == [int, float, bool] * 2
+
+    dataset_id = client.post("/datasets", content=json.dumps(data)).json()["dataset_id"]
+    stored = client.post(f"/datasets/{dataset_id}/filter-data", json={"event_type": ["t"]}).json()
+    inline = client.post("/filter-data", json={"json_data": data, "event_type": ["t"]}).json()
+    assert stored == inline
+    assert [event["time_object"]["duration"] for event in stored["filtered_data"]] == [0, 0.0, False, 1, 1.0, True]
+
+def test_irregular_events_stay_dicts():
+    """Test that events not shaped like ADAGE events are kept as they are."""
+    compactor = Compactor()
+    extra = {"time_object": {}, "event_type": "t", "attribute": {}, "extra": 1}
+    assert compactor.event(extra) == extra and type(compactor.event(extra)) is dict
+    assert compactor.event({"event_type": "t"}) == {"event_type": "t"}
+    assert compactor.event(["not", "an", "event"]) == ["not", "an", "event"]
+
+def test_stored_dataset_queries_use_records(realistic_data):
+    """Test that uploaded datasets hold records and answer queries as before."""
+    dataset_id = client.post("/datasets", content=json.dumps(realistic_data)).json()["dataset_id"]
+    dataset = datasets.get(dataset_id)
+    assert all(isinstance(event, EventRecord) for event in dataset.events)
+
+    plan = FilterPlan(["sales report"], filters=[MagicMock(attribute="suburb", values=["NELSON BAY"])], include_attributes=["price"])
+    for engine in ("auto", "python", "columnar", "parallel"):
+        assert dataset.apply(plan, engine=engine) == plan.apply(realistic_data)
+
+@pytest.mark.parametrize("include", [None, ["price", "suburb"], ["missing"]])
+def test_zero_copy_projection_encodes_identically(include, realistic_data):
+    """Test that zero-copy results equal and encode exactly like copied ones."""
+    compactor = Compactor()
+    data = {"events": realistic_data["events"] + [compactor.event(json.loads(json.dumps(event))) for event in realistic_data["events"]]}
+    copied = process_data(data, ["sales report"], include_attributes=include)
+    views = process_data(data, ["sales report"], include_attributes=include, zero_copy=True)
+    assert views == copied
+    assert render_json(views) == render_json(copied)
+    assert fastjson.dumps(views) == fastjson.dumps(copied)
+    assert b"".join(iter_ndjson(views)) == b"".join(iter_ndjson(copied))
+    if include is None:
+        assert all(view is event for view, event in zip(views, (e for e in data["events"] if e["event_type"] == "sales report")))
+    else:
+        assert all(isinstance(view, ProjectedEvent) for view in views)
+
+def test_zero_copy_irregular_events_are_projected():
+    """Test that events with extra members are never passed through as they are."""
+    event = {"time_object": {}, "event_type": "t", "attribute": {"a": 1}, "extra": 1}
+    [view] = process_data({"events": [event]}, ["t"], zero_copy=True)
+    assert view is not event and view == {"time_object": {}, "event_type": "t", "attribute": {"a": 1}}
+
+def peak_bytes(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+@pytest.mark.parametrize("include, saving", [(None, 0.8), (["price", "suburb"], 0.6)])
+def test_zero_copy_allocation_savings(include, saving):
+    """Test with tracemalloc that zero-copy results allocate a fraction of copied ones."""
+    data = generate(20000, attributes=12)
+    arguments = {"event_types": ["sales report"], "include_attributes": include, "engine": "python"}
+    process_data(data, **arguments)  # Warm the timestamp parsing paths
+    copied_peak, copied = peak_bytes(lambda: process_data(data, **arguments))
+    views_peak, views = peak_bytes(lambda: process_data(data, zero_copy=True, **arguments))
+    assert len(views) == len(copied) > 5000
+    assert views_peak < (1 - saving) * copied_peak
@@ -0,0 +1,110 @@
+import json
+import os
+from fastapi.testclient import TestClient
+from app import main, server, settings
+from app.cache import results
+from app.datasets import datasets
+from app.main import app
+from app.mapped import MappedStore
+from app.preprocessing import process_data
+
+client = TestClient(app)
+
+def cgroup(tmp_path, files):
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return str(tmp_path)
+
+def test_cpu_quota(tmp_path):
+    """Test reading the CPU quota of cgroup v2 and v1, and unlimited quotas."""
+    assert settings.cpu_quota("/nonexistent") is None
+    assert settings.cpu_quota(cgroup(tmp_path / "v2", {"cpu.max": "200000 100000\n"})) == 2.0
+    assert settings.cpu_quota(cgroup(tmp_path / "v2max", {"cpu.max": "max 100000\n"})) is None
+    v1 = cgroup(tmp_path / "v1", {"cpu/cpu.cfs_quota_us": "50000", "cpu/cpu.cfs_period_us": "100000"})
+    assert settings.cpu_quota(v1) == 0.5
+    assert settings.cpu_quota(cgroup(tmp_path / "v1max", {"cpu/cpu.cfs_quota_us": "-1", "cpu/cpu.cfs_period_us": "100000"})) is None
+
+def test_worker_count(tmp_path):
+    """Test that workers follow the CPU quota unless configured."""
+    assert server.worker_count(3) == 3
+    root = cgroup(tmp_path, {"cpu.max": "50000 100000"})
+    assert server.worker_count(0, root) == 1  # Half a CPU still gets one worker
+    assert server.worker_count(0, "/nonexistent") == settings.available_cpus("/nonexistent")
+
+def test_main_runs_uvicorn(monkeypatch):
+    """Test the server options handed to uvicorn."""
+    calls = []
+    monkeypatch.setattr(server.uvicorn, "run", lambda target, **options: calls.append((target, options)))
+    monkeypatch.setattr(settings, "WORKER_MAX_REQUESTS", 5000)
+    monkeypatch.delenv("PREPROCESSING_SHARED_DATASETS", raising=False)
+    monkeypatch.delenv("PREPROCESSING_PARALLEL_WORKERS", raising=False)
+
+    server.main(["--workers", "4", "--port", "9000"])
+    target, options = calls[-1]
+    assert target == "app.main:app"
+    assert options["workers"] == 4 and options["port"] == 9000
+    assert options["limit_max_requests"] == 5000 and options["limit_max_requests_jitter"] > 0
+    assert os.environ["PREPROCESSING_SHARED_DATASETS"] == "1"
+    assert "PREPROCESSING_PARALLEL_WORKERS" not in os.environ  # The parallel engine stays off
+
+    monkeypatch.delenv("PREPROCESSING_SHARED_DATASETS")
+    server.main([])
+    assert calls[-1][1]["workers"] == settings.WORKERS == 1  # Dataset updates need a single worker
+    assert "limit_max_requests" not in calls[-1][1]  # A single worker would not be replaced
+    assert "PREPROCESSING_SHARED_DATASETS" not in os.environ
+
+def test_shared_datasets_are_visible_to_every_worker(tmp_path, monkeypatch, realistic_data):
+    """Test that uploads in shared mode are served from the mapped store by any process."""
+    directory = str(tmp_path / "datasets")
+    monkeypatch.setattr(settings, "SHARED_DATASETS", 1)
+    monkeypatch.setattr(main, "mapped_datasets", MappedStore(directory))
+    results.clear()
+    datasets.clear()
+
+    response = client.post("/datasets", content=json.dumps(realistic_data))
+    assert response.status_code == 200
+    assert response.json()["storage"] == "mapped"
+    dataset_id = response.json()["dataset_id"]
+    assert len(datasets) == 0
+    assert not [name for name in os.listdir(directory) if name.startswith(".")]  # No upload left behind
+
+    other_worker = MappedStore(directory)
+    query = {"event_type": ["sales report"], "include_attributes": ["price"]}
+    expected = process_data(realistic_data, ["sales report"], include_attributes=["price"])
+    assert client.post(f"/datasets/{dataset_id}/filter-data", json=query).json()["filtered_data"] == expected
+    assert other_worker.get(dataset_id).describe()["event_count"] == len(realistic_data["events"])
+
+    assert client.delete(f"/datasets/{dataset_id}").status_code == 200
+    assert other_worker.get(dataset_id) is None
+    assert client.get(f"/datasets/{dataset_id}").status_code == 404
+
+    assert client.post("/datasets", content=b"{}").json()["detail"] == "No JSON data provided"
+    assert client.post("/datasets", content=b'{"events": [').status_code == 400
+    assert os.listdir(directory) == []
+
+def test_shared_datasets_are_evicted_past_the_budget(tmp_path, monkeypatch, realistic_data):
+    """Test that uploads in shared mode keep the mapped store within its byte budget."""
+    directory = str(tmp_path / "datasets")
+    monkeypatch.setattr(settings, "SHARED_DATASETS", 1)
+    store = MappedStore(directory)
+    monkeypatch.setattr(main, "mapped_datasets", store)
+    datasets.clear()
+
+    uploads = []
+    for number in range(3):
+        response = client.post("/datasets", content=json.dumps({**realistic_data, "upload": number}))
+        uploads.append(response.json()["dataset_id"])
+        os.utime(os.path.join(directory, uploads[-1], "manifest.json"), (number, number))
+    store.max_bytes = response.json()["size_bytes"] * 7 // 2  # Room for three of them
+    assert store.get(uploads[0]) is not None  # Now the most recently used
+    client.post("/datasets", content=json.dumps({**realistic_data, "upload": 3}))
+    assert store.get(uploads[1]) is None
+    assert store.get(uploads[0]) is not None and store.get(uploads[2]) is not None
+
+    body = json.dumps(realistic_data).encode("utf-8")
+    store.max_bytes = len(body) - 1
+    response = client.post("/datasets", content=body)
+    assert response.status_code == 413
+    assert not [name for name in os.listdir(directory) if name.startswith(".")]
@@ -0,0 +1,109 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.streaming import EventStreamParser, StreamParseError, iter_ndjson
+
+client = TestClient(app)
+
+def parse_in_chunks(body, size):
+    parser = EventStreamParser()
+    events = []
+    for start in range(0, len(body), size):
+        events.extend(parser.feed(body[start:start + size]))
+    events.extend(parser.close())
+    return parser, events
+
+@pytest.mark.parametrize("size", [1, 7, 64, 1 << 20])
+def test_parser_yields_every_event(size, sample_input):
+    """Test that events are parsed identically whatever the chunk boundaries."""
+    data = sample_input("input1.json")
+    data["count"] = 12345
+    body = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    parser, events = parse_in_chunks(body, size)
+    assert events == data["events"]
+    assert parser.metadata == {key: value for key, value in data.items() if key != "events"}
+
+def test_parser_splits_numbers_and_multibyte_characters():
+    """Test that numbers and UTF-8 sequences split across chunks are not truncated."""
+    body = '{"events": [1234567, "Ünit"], "size": 98765}'.encode("utf-8")
+    parser, events = parse_in_chunks(body, 3)
+    assert events == [1234567, "Ünit"]
+    assert parser.metadata == {"size": 98765}
+
+@pytest.mark.parametrize("body", [b'{"events": [1,]}', b'{"events": {}}', b'{"events": []', b'[]', b'{"events": []} x'])
+def test_parser_rejects_invalid_documents(body):
+    """Test that malformed documents raise StreamParseError."""
+    with pytest.raises(StreamParseError):
+        parse_in_chunks(body, 4)
+
+def test_filter_data_stream(realistic_data):
+    """Test /filter-data/stream against /filter-data on the same dataset."""
+    data = realistic_data
+    params = {
+        "event_type": ["sales report"],
+        "filters": json.dumps([{"attribute": "suburb", "values": ["NELSON BAY"]}]),
+        "include_attributes": ["price", "suburb"],
+        "start_timestamp": "2023-01-01T00:00:00",
+    }
+    response = client.post("/filter-data/stream", params=params, content=json.dumps(data))
+    expected = client.post("/filter-data", json={
+        "json_data": data,
+        "event_type": params["event_type"],
+        "filters": json.loads(params["filters"]),
+        "include_attributes": params["include_attributes"],
+        "start_timestamp": params["start_timestamp"],
+    })
+    assert response.status_code == 200
+    assert response.json() == expected.json()
+    assert len(response.json()["filtered_data"]) > 0
+
+def test_filter_data_stream_errors():
+    """Test /filter-data/stream error handling."""
+    response = client.post("/filter-data/stream", content=b"{}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "No JSON data provided"
+
+    response = client.post("/filter-data/stream", content=b'{"dataset_type": "house sales"}')
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid JSON format: Missing 'events' key"
+
+    response = client.post("/filter-data/stream", content=b'{"events": [')
+    assert response.status_code == 400
+
+    response = client.post("/filter-data/stream", params={"filters": "[{}]"}, content=b'{"events": []}')
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["query", "filters"]
+
+    response = client.post("/filter-data/stream", params={"filters": "not json"}, content=b'{"events": []}')
+    assert response.status_code == 422
+
+    response = client.post("/filter-data/stream", params={"start_timestamp": "invalid-timestamp"}, content=b'{"events": []}')
+    assert response.status_code == 500
+    assert "Invalid start_timestamp format" in response.json()["detail"]
+
+def test_filter_data_ndjson(sample_input):
+    """Test that /filter-data streams NDJSON when asked to."""
+    data = sample_input("input1.json")
+    test_input = {"json_data": data, "event_type": ["sales report"], "include_attributes": ["price", "suburb"]}
+    expected = client.post("/filter-data", json=test_input).json()["filtered_data"]
+    response = client.post("/filter-data", json=test_input, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+def test_filter_data_ndjson_invalid_timestamp():
+    """Test that invalid timestamps are reported before streaming starts."""
+    test_input = {"json_data": {"events": []}, "start_timestamp": "invalid-timestamp"}
+    response = client.post("/filter-data", json=test_input, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 500
+    assert "Invalid start_timestamp format" in response.json()["detail"]
+
+def test_iter_ndjson_chunks():
+    """Test that NDJSON output is chunked without splitting lines."""
+    events = [{"attribute": {"n": n, "pad": "x" * 1000}} for n in range(200)]
+    chunks = list(iter_ndjson(iter(events)))
+    assert len(chunks) > 2
+    assert chunks[0].count(b"\n") == 1
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    assert [json.loads(line) for line in b"".join(chunks).splitlines()] == events
@@ -0,0 +1,54 @@
+import pytest
+from datetime import datetime, timezone
+from app.timestamps import INVALID_TIMESTAMP, MISSING_TIMESTAMP, VALID_TIMESTAMP, TimestampParser, parse_bound, read_timestamps, to_epoch
+
+@pytest.mark.parametrize("value", [
+    "20240628",
+    "2024-06-28",
+    "2024-06-28T00:00:00",
+    "2019-07-21 13:04:40.3401012",
+    "2023-02-12T07:52:02.921420",
+])
+def test_parser_matches_fromisoformat(value):
+    """Test that parsed timestamps agree with datetime.fromisoformat."""
+    expected = to_epoch(datetime.fromisoformat(value[:26]))
+    assert TimestampParser().parse(value) == expected
+
+def test_parser_handles_mixed_formats():
+    """Test that a parser detected on compact dates still parses ISO strings."""
+    parser = TimestampParser()
+    assert parser.parse("20240628") == parser.parse("2024-06-28T00:00:00")
+    assert parser.parse("2024-06-28 00:00:01") == parser.parse("20240628") + 1000000
+
+@pytest.mark.parametrize("value", ["invalid", "20241340", "00000101", "2024-13-01"])
+def test_parser_rejects_invalid_timestamps(value):
+    """Test that unparseable timestamps are reported as None."""
+    parser = TimestampParser()
+    parser.parse("20240628")
+    assert parser.parse(value) is None
+
+def test_offset_aware_timestamps_use_utc():
+    """Test that offset-aware timestamps are compared on the UTC timeline."""
+    assert parse_bound("2024-01-01T10:00:00+10:00", "start_timestamp") == parse_bound("2024-01-01T00:00:00", "start_timestamp")
+    assert to_epoch(datetime(1970, 1, 1, tzinfo=timezone.utc)) == 0
+
+def test_parse_bound_errors():
+    """Test that invalid bounds name the offending parameter."""
+    assert parse_bound(None, "start_timestamp") is None
+    with pytest.raises(ValueError, match="Invalid end_timestamp format: nope"):
+        parse_bound("nope", "end_timestamp")
+
+def test_read_timestamps():
+    """Test classifying event timestamps as valid, missing or invalid."""
+    events = [
+        {"time_object": {"timestamp": "2024-06-28"}},
+        {"time_object": {"timestamp": ""}},
+        {"time_object": {}},
+        {},
+        {"time_object": {"timestamp": "not a time"}},
+    ]
+    states, epochs = read_timestamps(events)
+    assert states.tolist() == [VALID_TIMESTAMP] + [MISSING_TIMESTAMP] * 3 + [INVALID_TIMESTAMP]
+    assert epochs.tolist() == [to_epoch(datetime(2024, 6, 28)), 0, 0, 0, 0]
+    with pytest.raises(AttributeError):
+        read_timestamps(["not an event"])